@@ -1,20 +1,34 @@
 import datetime
 import logging
 import azure.functions as func
-from firewall_optimizer import optimize_firewalls  # ✅ Correct import
-from scripts  import update_azure_firewall  # Import the missing function
 
 app = func.FunctionApp()
 
 @app.function_name(name="FirewallOptimizerFunction")
 @app.timer_trigger(schedule="5 */ * * * *", arg_name="mytimer")
 def run_firewall_update(myTimer: func.TimerRequest):
-    update_azure_firewall()
     utc_timestamp = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc).isoformat()
     logging.info('🔥 Firewall optimizer function triggered at %s', utc_timestamp)
 
     try:
-        result = optimize_firewalls()
-        logging.info("✅ Firewall optimization result: %s", result)
+        # Imported on first use: cache hits never load the optimizer, Z3 or the Azure SDKs.
+        from scripts.update_azure_firewall import firewall_update_pipeline
+
+        # Unchanged NSRs are served from the solution cache, and then the firewall is left alone.
+        # On a miss the solve and the GET of the deployed firewall run concurrently.
+        report = firewall_update_pipeline().run()
+        cached = report.value("cached")
+        if cached is not None and cached[1] is not None:
+            logging.info("✅ NSRs unchanged, Azure Firewall update skipped: %s", cached[1])
+        elif report.ok:
+            logging.info("✅ Firewall optimization result: %s", report.value("result"))
+        else:
+            errors = {name: report.stages[name].error for name in report.failed}
+            logging.error("❌ Error during firewall optimization: %s", errors)
+        logging.info("⏱️ %s", report.summary())
     except Exception as e:
         logging.error("❌ Error during firewall optimization: %s", e)
+    finally:
+        # Written only when FIREWALL_METRICS and FIREWALL_METRICS_FILE are set.
+        from MyFirewallFunctionProj.instrumentation import write_metrics
+        write_metrics()
@@ -0,0 +1,24 @@
+"""
+example_network.py
+
+The example network the optimizer was originally written against.
+
+This module holds plain data only and does not import Z3, so callers that just need to know the
+default input (for example the solution cache, when it computes a key) can import it cheaply.
+
+Usage:
+  from MyFirewallFunctionProj.example_network import DEFAULT_NSRS, DEFAULT_TOPOLOGY
+"""
+
+DEFAULT_TOPOLOGY = {
+    "aps": ["frontend", "backend", "dmz"],
+    "links": [["frontend", "backend"], ["dmz", "backend"]],
+    "paths": {},
+}
+
+DEFAULT_NSRS = [
+    # NSR 1: Block traffic from 'frontend' to 'backend'
+    {"name": "block_frontend_backend", "source": "frontend", "destination": "backend", "action": "Deny"},
+    # NSR 2: Allow traffic from 'dmz' to 'backend'
+    {"name": "allow_dmz_backend", "source": "dmz", "destination": "backend", "action": "Allow"},
+]
@@ -3,71 +3,362 @@ firewall_optimizer.py
 
 This module uses the Z3 SMT solver to formulate and solve a MaxSMT problem for automated firewall configuration.
 It models:
-  - A simplified network topology with predefined Allocation Places (APs)
+  - A network topology of Allocation Places (APs), the links between them and the paths traffic takes
   - Network Security Requirements (NSRs) as logical constraints
-  - An objective to minimize the number of deployed firewall instances
+  - An objective to minimize the number of deployed firewall instances, optionally weighted by
+    a per-AP deployment cost (topology["costs"])
+
+The topology and NSRs are plain data, so the same model builder handles the three-AP example
+below as well as VNets with thousands of subnets:
+
+  topology = {
+      "aps": ["frontend", "backend", "dmz"],
+      "links": [["frontend", "backend"], ["dmz", "backend"]],
+      "paths": {"dmz->backend": ["dmz", "backend"]},   # optional, otherwise derived from links
+  }
+  nsrs = [
+      {"name": "block_frontend_backend", "source": "frontend", "destination": "backend", "action": "Deny"},
+      {"name": "allow_dmz_backend", "source": "dmz", "destination": "backend", "action": "Allow"},
+  ]
 
 Usage:
-  Call the optimize_firewalls() function to run the optimizer and obtain a solution.
+  Call optimize_firewalls() to solve the built-in example, or optimize_firewalls(topology, nsrs)
+  to solve your own. build_model() and solve_model() expose the two halves separately.
+  Pass deadline=<seconds> to get the best allocation found within a time budget; the result's
+  "optimal" flag says whether it was proven minimal.
 """
 
+import time
+from collections import deque
+
+from z3 import AtMost, Bool, If, Implies, Not, Optimize, Or, PbLe, Solver, Sum, Z3Exception, is_true, sat, unknown, unsat
+
+# The example network the optimizer was originally written against (plain data, no Z3).
+from MyFirewallFunctionProj.example_network import DEFAULT_NSRS, DEFAULT_TOPOLOGY
+from MyFirewallFunctionProj.instrumentation import enabled, inc, record_solver_statistics, set_gauge, span, timed
+
+# Objective encodings understood by build_model(); see new_solver().
+ENCODINGS = ("sum", "soft", "pb")
+
+
+class InfeasibleError(Exception):
+    """No allocation satisfies every NSR (the solver answered unsat)."""
+
+
+class FirewallModel:
+    """A Z3 Optimize instance together with the variables needed to read a solution back."""
+
+    def __init__(self, ap_names, fw_alloc, allow_rules, total_firewalls, optimizer):
+        self.ap_names = ap_names
+        self.fw_alloc = fw_alloc
+        self.allow_rules = allow_rules
+        self.total_firewalls = total_firewalls
+        self.optimizer = optimizer
+        self.num_constraints = 0
+        self.encoding = "sum"
+        self.costs = {ap: 1 for ap in ap_names}
+        self.total_cost = total_firewalls
+        # The most recent Z3 model, kept so later solves can start from it.
+        self.last_model = None
+
+
+def path_key(source, destination):
+    """Key used for explicit paths in topology["paths"]."""
+    return f"{source}->{destination}"
+
+
+def build_adjacency(topology):
+    """Build an undirected adjacency map from the topology's AP list and links."""
+    adjacency = {ap: [] for ap in topology["aps"]}
+    for a, b in topology.get("links", []):
+        if a not in adjacency or b not in adjacency:
+            raise ValueError(f"Link {a!r} <-> {b!r} references an unknown AP.")
+        adjacency[a].append(b)
+        adjacency[b].append(a)
+    return adjacency
+
+
+def _bfs_parents(adjacency, source):
+    # One BFS per source AP is enough for every NSR that starts there.
+    parents = {source: None}
+    queue = deque([source])
+    while queue:
+        node = queue.popleft()
+        for neighbour in adjacency[node]:
+            if neighbour not in parents:
+                parents[neighbour] = node
+                queue.append(neighbour)
+    return parents
+
+
+def resolve_paths(topology, nsrs, adjacency=None, bfs_cache=None):
+    """
+    Return the AP path for every NSR, in order.
+
+    An NSR may carry its own "path"; otherwise topology["paths"] is consulted and, failing that,
+    the shortest path over topology["links"] is used. Callers that resolve paths repeatedly can
+    pass their own adjacency map and BFS cache to reuse them between calls.
+    """
+    explicit_paths = topology.get("paths") or {}
+    if bfs_cache is None:
+        bfs_cache = {}
+    paths = []
+    for nsr in nsrs:
+        source, destination = nsr["source"], nsr["destination"]
+        path = nsr.get("path") or explicit_paths.get(path_key(source, destination))
+        if path is None:
+            if adjacency is None:
+                adjacency = build_adjacency(topology)
+            if source not in adjacency or destination not in adjacency:
+                raise ValueError(f"NSR {nsr.get('name')!r} references an unknown AP.")
+            if source not in bfs_cache:
+                bfs_cache[source] = _bfs_parents(adjacency, source)
+            parents = bfs_cache[source]
+            if destination not in parents:
+                raise ValueError(f"No path from {source!r} to {destination!r} for NSR {nsr.get('name')!r}.")
+            path = []
+            node = destination
+            while node is not None:
+                path.append(node)
+                node = parents[node]
+            path.reverse()
+        paths.append(list(path))
+    return paths
+
+
+def allow_rule_name(nsr):
+    """Name of the allow-rule variable an Allow NSR is encoded with."""
+    return f"allow_rule_{nsr['source']}_{nsr['destination']}"
+
+
+def encode_nsr(nsr, path, fw_alloc, allow_rules, path_guards):
+    """
+    Return the Z3 constraints for a single NSR.
+
+    fw_alloc, allow_rules and path_guards are shared across NSRs so that the same AP variable,
+    allow-rule variable and "some firewall on this path" disjunction are only ever created once.
+    """
+    action = nsr.get("action", "Deny").capitalize()
+    if action == "Deny":
+        # At least one firewall along the path must be deployed to block the traffic.
+        key = tuple(path)
+        guard = path_guards.get(key)
+        if guard is None:
+            guard = Or([fw_alloc[ap] for ap in path]) if len(path) > 1 else fw_alloc[path[0]]
+            path_guards[key] = guard
+        return [guard]
+    if action == "Allow":
+        # Every firewall deployed along the path must carry an allow rule for this traffic,
+        # and for allowed traffic the allow rule must be active.
+        name = allow_rule_name(nsr)
+        allow_rule = allow_rules.get(name)
+        if allow_rule is None:
+            allow_rule = Bool(name)
+            allow_rules[name] = allow_rule
+        return [Implies(fw_alloc[ap], allow_rule) for ap in path] + [allow_rule]
+    raise ValueError(f"Unsupported NSR action {nsr.get('action')!r} in NSR {nsr.get('name')!r}.")
+
+
+def ap_costs(topology):
+    """Per-AP deployment cost from topology["costs"]; APs without an entry cost 1."""
+    costs = topology.get("costs") or {}
+    invalid = {ap: cost for ap, cost in costs.items()
+               if isinstance(cost, bool) or not isinstance(cost, int) or cost <= 0}
+    if invalid:
+        raise ValueError(f"AP costs must be positive integers: {invalid}")
+    return {ap: costs.get(ap, 1) for ap in topology["aps"]}
 
-from z3 import *
-print("Starting firewall optimizer...")
-def optimize_firewalls():
-    # Define the potential firewall allocation places (APs)
-    # For our example, these could be subnets or network segments
-    ap_names = ["frontend", "backend", "dmz"]
+
+def new_solver(fw_alloc, costs, encoding="sum"):
+    """
+    Create the Z3 solver for an objective encoding and return it with the total-cost expression.
+
+      - "sum":  Optimize minimizing the arithmetic Sum(If(fw, cost, 0)).
+      - "soft": Optimize with one weighted soft constraint Not(fw) per AP (MaxSMT).
+      - "pb":   plain Solver; solve_model() tightens a PbLe/AtMost bound on the cost instead.
+    """
+    total_cost = Sum([If(fw_alloc[ap], cost, 0) for ap, cost in costs.items()])
+    if encoding == "sum":
+        opt = Optimize()
+        opt.minimize(total_cost)
+    elif encoding == "soft":
+        opt = Optimize()
+        for ap, cost in costs.items():
+            if cost > 0:
+                opt.add_soft(Not(fw_alloc[ap]), cost)
+    elif encoding == "pb":
+        opt = Solver()
+    else:
+        raise ValueError(f"Unknown objective encoding {encoding!r}; expected one of {ENCODINGS}.")
+    return opt, total_cost
+
+
+@timed("optimizer_build")
+def build_model(topology, nsrs, encoding="sum"):
+    """Encode a topology and its NSRs as a single Z3 model using the given objective encoding."""
+    ap_names = list(topology["aps"])
 
     # Create a Boolean decision variable for each AP: True if a firewall is deployed there
     fw_alloc = {ap: Bool(f"fw_{ap}") for ap in ap_names}
+    allow_rules = {}
+    path_guards = {}
 
-    # Create an extra Boolean variable for a specific NSR rule.
-    # For example, suppose we require that if a firewall is deployed in 'dmz',
-    # it must have an "allow" rule for traffic to 'backend'.
-    allow_rule_dmz_backend = Bool("allow_rule_dmz_backend")
-
-    # Initialize a list to hold our NSR constraints
     nsr_constraints = []
+    for nsr, path in zip(nsrs, resolve_paths(topology, nsrs)):
+        unknown_aps = [ap for ap in path if ap not in fw_alloc]
+        if unknown_aps:
+            raise ValueError(f"NSR {nsr.get('name')!r} path uses unknown APs: {unknown_aps}")
+        nsr_constraints.extend(encode_nsr(nsr, path, fw_alloc, allow_rules, path_guards))
 
-    # NSR 1: Block traffic from 'frontend' to 'backend'
-    # For this, we assume that at least one firewall along the path (either in 'frontend' OR 'backend')
-    # must be deployed. (This is a simplified representation.)
-    nsr_constraints.append(Or(fw_alloc["frontend"], fw_alloc["backend"]))
+    # The objective minimizes the total deployment cost; with the default cost of 1 per AP
+    # that is the number of deployed firewalls.
+    total_firewalls = Sum([If(fw_alloc[ap], 1, 0) for ap in ap_names])
+    costs = ap_costs(topology)
+    opt, total_cost = new_solver(fw_alloc, costs, encoding)
 
-    # NSR 2: Allow traffic from 'dmz' to 'backend'
-    # We assume that if a firewall is deployed in 'dmz', it must have an allow rule for traffic.
-    nsr_constraints.append(Implies(fw_alloc["dmz"], allow_rule_dmz_backend))
-    # Additionally, we require that for allowed traffic, the allow rule must be active.
-    nsr_constraints.append(allow_rule_dmz_backend)
+    # Add all NSR (hard) constraints in one call rather than one opt.add() per constraint.
+    opt.add(nsr_constraints)
+
+    model = FirewallModel(ap_names, fw_alloc, allow_rules, total_firewalls, opt)
+    model.num_constraints = len(nsr_constraints)
+    set_gauge("optimizer_aps", len(ap_names))
+    set_gauge("optimizer_constraints", len(nsr_constraints))
+    model.encoding = encoding
+    model.costs = costs
+    model.total_cost = total_cost
+    return model
+
+
+def _read_result(model, z3_model, optimal):
+    model.last_model = z3_model
+    # Construct a result dictionary to store our decisions
+    return {
+        "firewall_allocation": {
+            ap: is_true(z3_model.evaluate(model.fw_alloc[ap], model_completion=True))
+            for ap in model.ap_names
+        },
+        "total_firewalls_deployed": int(z3_model.evaluate(model.total_firewalls, model_completion=True).as_long()),
+        "total_cost": int(z3_model.evaluate(model.total_cost, model_completion=True).as_long()),
+        "allow_rules": {
+            name: is_true(z3_model.evaluate(var, model_completion=True))
+            for name, var in model.allow_rules.items()
+        },
+        "optimal": optimal,
+    }
+
+
+def _remaining_ms(deadline):
+    if deadline is None:
+        return None
+    return max(0, int((deadline - time.monotonic()) * 1000))
 
-    # Define an objective: minimize the total number of deployed firewalls.
-    total_firewalls = Sum([If(fw_alloc[ap], 1, 0) for ap in ap_names])
 
-    # Create an optimizer instance
-    opt = Optimize()
-
-    # Add all NSR (hard) constraints
-    for constraint in nsr_constraints:
-        opt.add(constraint)
-
-    # Add the objective as a soft constraint: minimize the number of firewalls
-    opt.minimize(total_firewalls)
-
-    # Check for satisfiability and return the model if found
-    if opt.check() == sat:
-        model = opt.model()
-        # Construct a result dictionary to store our decisions
-        result = {
-            "firewall_allocation": {ap: is_true(model.evaluate(fw_alloc[ap])) for ap in ap_names},
-            "total_firewalls_deployed": int(model.evaluate(total_firewalls).as_long()),
-            "allow_rule_dmz_backend": is_true(model.evaluate(allow_rule_dmz_backend))
-        }
+def _solve_pb(model, assumptions, timeout_ms):
+    # Binary search on the cost bound: every sat answer is a better allocation, so whatever
+    # has been found when the deadline hits is returned as a non-optimal result.
+    solver = model.optimizer
+    deadline = None if timeout_ms is None else time.monotonic() + timeout_ms / 1000.0
+    if deadline is not None:
+        solver.set("timeout", _remaining_ms(deadline))
+
+    status = solver.check(*assumptions)
+    if status == unsat:
+        raise InfeasibleError("No solution found that satisfies all NSRs.")
+    if status != sat:
+        raise TimeoutError(f"No solution found within {timeout_ms} ms: {solver.reason_unknown()}")
+    best = solver.model()
+    best_cost = best.evaluate(model.total_cost, model_completion=True).as_long()
+
+    weighted = [(model.fw_alloc[ap], cost) for ap, cost in model.costs.items() if cost > 0]
+    uniform = all(cost == 1 for _, cost in weighted)
+    lower = 0
+    while lower < best_cost:
+        bound = (lower + best_cost - 1) // 2
+        if deadline is not None:
+            remaining = _remaining_ms(deadline)
+            if remaining == 0:
+                break
+            solver.set("timeout", remaining)
+        solver.push()
+        if uniform:
+            solver.add(AtMost(*[var for var, _ in weighted], bound))
+        else:
+            solver.add(PbLe(weighted, bound))
+        status = solver.check(*assumptions)
+        candidate = solver.model() if status == sat else None
+        solver.pop()
+        if status == sat:
+            best = candidate
+            best_cost = best.evaluate(model.total_cost, model_completion=True).as_long()
+        elif status == unsat:
+            lower = bound + 1
+        else:
+            break
+    return _read_result(model, best, optimal=lower >= best_cost)
+
+
+def _record_solve(model, status):
+    inc("optimizer_solves_total", encoding=model.encoding, status=status)
+    if enabled():   # collecting the statistics is not free, so skip it when metrics are off
+        record_solver_statistics(model.optimizer.statistics(), encoding=model.encoding)
+
+
+def solve_model(model, assumptions=(), timeout_ms=None):
+    """
+    Solve a model built by build_model() and return the allocation as a result dictionary.
+
+    With timeout_ms the solver is interrupted at the deadline and the best allocation found so far
+    is returned with "optimal" set to False; TimeoutError is raised if none was found at all.
+    """
+    if model.encoding == "pb":
+        with span("optimizer_check", encoding="pb"):
+            result = _solve_pb(model, assumptions, timeout_ms)
+        _record_solve(model, "optimal" if result["optimal"] else "deadline")
         return result
+
+    opt = model.optimizer
+    if timeout_ms is not None:
+        opt.set("timeout", int(timeout_ms))
+    with span("optimizer_check", encoding=model.encoding):
+        status = opt.check(*assumptions)
+    _record_solve(model, str(status))
+    if status == sat:
+        return _read_result(model, opt.model(), optimal=True)
+    elif status == unknown:
+        # Interrupted: Optimize keeps the best model that satisfied the hard constraints.
+        try:
+            z3_model = opt.model()
+        except Z3Exception:
+            z3_model = None
+        if z3_model is None or len(z3_model) == 0:
+            raise TimeoutError(f"No solution found within {timeout_ms} ms: {opt.reason_unknown()}")
+        return _read_result(model, z3_model, optimal=False)
     else:
-        raise Exception("No solution found that satisfies all NSRs.")
+        raise InfeasibleError("No solution found that satisfies all NSRs.")
+
+
+def optimize_firewalls(topology=None, nsrs=None, deadline=None, encoding="sum"):
+    """
+    Build and solve the firewall allocation problem.
+
+    Without arguments the built-in three-AP example is solved, and its allow rules are also
+    returned as top-level keys (e.g. "allow_rule_dmz_backend") for existing callers. deadline is
+    a time budget in seconds for the solve; see solve_model().
+    """
+    legacy = topology is None and nsrs is None
+    if topology is None:
+        topology = DEFAULT_TOPOLOGY
+    if nsrs is None:
+        nsrs = DEFAULT_NSRS
+
+    timeout_ms = None if deadline is None else int(deadline * 1000)
+    result = solve_model(build_model(topology, nsrs, encoding), timeout_ms=timeout_ms)
+    if legacy:
+        result.update(result["allow_rules"])
+    return result
 
 if __name__ == "__main__":
+    print("Starting firewall optimizer...")
     try:
         solution = optimize_firewalls()
         print("Firewall Allocation Decision:")
@@ -80,4 +371,4 @@ if __name__ == "__main__":
     import traceback
     traceback.print_exc()
     import time
-    time.sleep(5)
\ No newline at end of file
+    time.sleep(5)
@@ -3,6 +3,8 @@ import datetime
 import json
 import logging
 
+from MyFirewallFunctionProj.solution_cache import run_cached
+
 app = func.FunctionApp()
 
 @app.timer_trigger(schedule="0 */5 * * * *", arg_name="myTimer", run_on_startup=False,
@@ -12,4 +14,6 @@ def FirewallOptimizerFunction(myTimer: func.TimerRequest) -> None:
     if myTimer.past_due:
         logging.info('The timer is past due!')
 
-    logging.info('Python timer trigger function executed.')
\ No newline at end of file
+    result, cache_hit = run_cached()
+    logging.info('Python timer trigger function executed (cache %s): %s',
+                 'hit' if cache_hit else 'miss', json.dumps(result))
\ No newline at end of file
@@ -0,0 +1,259 @@
+"""
+instrumentation.py
+
+Lightweight timings, counters, gauges and histograms for the optimizer and the updaters.
+
+Metrics are off unless FIREWALL_METRICS is set (1/true/yes), or until enable() is called. While
+they are off, every call returns after a single flag check, and span() hands back a shared no-op
+context manager, so instrumented hot paths cost next to nothing.
+
+While they are on:
+  - span(name, **labels) times a block into the histogram <name>_seconds, labelled with the
+    outcome ("ok" or "error"). Each finished span is also logged as one JSON line on the
+    "firewall.metrics" logger.
+  - inc(), set_gauge() and observe() record counters, gauges and histogram samples.
+  - record_solver_statistics() turns Z3's opt.statistics() into gauges.
+  - render_prometheus() returns everything in the Prometheus text exposition format, and
+    write_metrics() writes it to FIREWALL_METRICS_FILE (for node_exporter's textfile collector,
+    for example). serve_metrics() exposes it at /metrics over HTTP.
+
+Usage:
+  with span("optimizer_check", encoding="sum"):
+      status = opt.check()
+  inc("feed_bytes_total", result.bytes_fetched, feed=name)
+  write_metrics()
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NAMESPACE = "firewall"
+METRICS_FILE = os.environ.get("FIREWALL_METRICS_FILE")
+# Seconds; covers sub-millisecond lookups up to the five-minute timer window.
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+logger = logging.getLogger("firewall.metrics")
+
+_enabled = os.environ.get("FIREWALL_METRICS", "").lower() in ("1", "true", "yes")
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}     # (name, labels) -> [bucket counts..., +Inf count, sum]
+
+
+def enabled():
+    return _enabled
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = flag
+
+
+def reset():
+    """Forget every recorded metric."""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def inc_counts(name, counts, **labels):
+    """inc(name) once per entry of a {kind: count} report, with the entry as the "kind" label."""
+    if not _enabled:
+        return
+    for kind, value in counts.items():
+        if isinstance(value, (int, float)):
+            inc(name, value, kind=kind, **labels)
+
+
+def set_gauge(name, value, **labels):
+    if not _enabled:
+        return
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, value, **labels):
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram[i] += 1
+                break
+        else:
+            histogram[len(BUCKETS)] += 1
+        histogram[-1] += value
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def annotate(self, **fields):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """Times a block into <name>_seconds; annotate() adds fields to its log line only."""
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.fields = {}
+        self.seconds = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._start
+        outcome = "ok" if exc_type is None else "error"
+        observe(f"{self.name}_seconds", self.seconds, outcome=outcome, **self.labels)
+        record = {"span": self.name, "seconds": round(self.seconds, 6), "outcome": outcome}
+        record.update(self.labels)
+        record.update(self.fields)
+        logger.info(json.dumps(record, default=str))
+        return False
+
+    def annotate(self, **fields):
+        self.fields.update(fields)
+
+
+def span(name, **labels):
+    if not _enabled:
+        return _NOOP_SPAN
+    return Span(name, labels)
+
+
+def timed(name, **labels):
+    """Decorator form of span()."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(name, labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_solver_statistics(statistics, **labels):
+    """Gauges z3_<key> for every entry of a z3 Statistics object (opt.statistics())."""
+    if not _enabled:
+        return
+    for key in statistics.keys():
+        value = statistics.get_key_value(key)
+        if isinstance(value, (int, float)):
+            set_gauge("z3_" + re.sub(r"[^a-zA-Z0-9_]", "_", key), value, **labels)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _series(name, labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return name
+    return name + "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {key: list(value) for key, value in _histograms.items()}
+
+    lines = []
+    typed = set()
+
+    def type_line(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in sorted(counters.items()):
+        full = f"{NAMESPACE}_{name}"
+        type_line(full, "counter")
+        lines.append(f"{_series(full, labels)} {value}")
+    for (name, labels), value in sorted(gauges.items()):
+        full = f"{NAMESPACE}_{name}"
+        type_line(full, "gauge")
+        lines.append(f"{_series(full, labels)} {value}")
+    for (name, labels), histogram in sorted(histograms.items()):
+        full = f"{NAMESPACE}_{name}"
+        type_line(full, "histogram")
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), histogram[:-1]):
+            cumulative += count
+            lines.append(f"{_series(full + '_bucket', labels, [('le', str(bound))])} {cumulative}")
+        lines.append(f"{_series(full + '_sum', labels)} {histogram[-1]}")
+        lines.append(f"{_series(full + '_count', labels)} {cumulative}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def write_metrics(path=None):
+    """Atomically write render_prometheus() to `path` (default FIREWALL_METRICS_FILE), if enabled."""
+    path = path or METRICS_FILE
+    if not _enabled or not path:
+        return None
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+    return path
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """Serve /metrics from a daemon thread; returns the server (call shutdown() to stop it)."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
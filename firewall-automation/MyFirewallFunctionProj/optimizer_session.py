@@ -0,0 +1,146 @@
+"""
+optimizer_session.py
+
+A long-lived firewall optimizer that keeps its Z3 Optimize instance warm between solves.
+
+build_model() encodes every NSR from scratch. When requirements change in bursts of small edits,
+re-encoding a large topology dominates the run time, so an OptimizerSession encodes the topology
+once and then adds and retracts individual NSRs:
+
+  - every NSR's constraints are guarded by its own tracking literal (Implies(literal, c));
+  - solve() passes the literals of the active NSRs to opt.check() as assumptions, so a retracted
+    NSR simply stops being assumed and nothing has to be re-encoded;
+  - retracted literals are also asserted false, which lets Z3 discard their clauses;
+  - the previous model's AP decisions are handed to Z3 as initial values for the next solve.
+
+Usage:
+  session = OptimizerSession(topology, nsrs)
+  result = session.solve()
+  session.remove_nsr("block_frontend_backend")
+  session.add_nsr({"name": "block_dmz_frontend", "source": "dmz", "destination": "frontend"})
+  result = session.solve()
+
+push() and pop() bracket temporary edits, as used by what_if for scenario batches.
+"""
+from z3 import Bool, If, Implies, Not, Sum, is_true
+
+from MyFirewallFunctionProj.firewall_optimizer import (
+    FirewallModel,
+    allow_rule_name,
+    ap_costs,
+    build_adjacency,
+    encode_nsr,
+    new_solver,
+    resolve_paths,
+    solve_model,
+)
+
+
+class OptimizerSession:
+    """Incrementally maintained firewall allocation model for one topology."""
+
+    def __init__(self, topology, nsrs=()):
+        self.topology = topology
+        ap_names = list(topology["aps"])
+        fw_alloc = {ap: Bool(f"fw_{ap}") for ap in ap_names}
+        total_firewalls = Sum([If(fw_alloc[ap], 1, 0) for ap in ap_names])
+        costs = ap_costs(topology)
+        opt, total_cost = new_solver(fw_alloc, costs)
+
+        self.model = FirewallModel(ap_names, fw_alloc, {}, total_firewalls, opt)
+        self.model.costs = costs
+        self.model.total_cost = total_cost
+        self._adjacency = build_adjacency(topology)
+        self._bfs_cache = {}
+        self._allow_vars = {}
+        self._path_guards = {}
+        # name -> (nsr, tracking literal, allow-rule names used by the NSR)
+        self._active = {}
+        self._generation = 0
+        self._scopes = []
+
+        self.add_nsrs(nsrs)
+
+    @property
+    def nsr_names(self):
+        return list(self._active)
+
+    def literal(self, name):
+        """Tracking literal of an active NSR, e.g. for use in extra assumptions."""
+        return self._active[name][1]
+
+    def add_nsrs(self, nsrs):
+        """
+        Encode several NSRs and add them to the solver in a single call.
+
+        The whole batch is validated and encoded first; if any NSR is rejected, the session is
+        left exactly as it was.
+        """
+        nsrs = list(nsrs)
+        paths = resolve_paths(self.topology, nsrs, self._adjacency, self._bfs_cache)
+        seen = set()
+        for nsr, path in zip(nsrs, paths):
+            name = nsr["name"]
+            if name in self._active or name in seen:
+                raise ValueError(f"NSR {name!r} is already part of the session.")
+            seen.add(name)
+            unknown = [ap for ap in path if ap not in self.model.fw_alloc]
+            if unknown:
+                raise ValueError(f"NSR {name!r} path uses unknown APs: {unknown}")
+
+        encoded = []
+        for nsr, path in zip(nsrs, paths):
+            constraints = encode_nsr(nsr, path, self.model.fw_alloc, self._allow_vars, self._path_guards)
+            allow_names = [allow_rule_name(nsr)] if nsr.get("action", "Deny").capitalize() == "Allow" else []
+            encoded.append((nsr, constraints, allow_names))
+
+        guarded = []
+        for nsr, constraints, allow_names in encoded:
+            # A fresh literal per (re-)addition, so a retracted NSR can be added back later.
+            self._generation += 1
+            literal = Bool(f"nsr!{nsr['name']}!{self._generation}")
+            guarded.extend(Implies(literal, constraint) for constraint in constraints)
+            self._active[nsr["name"]] = (nsr, literal, allow_names)
+            self.model.num_constraints += len(constraints)
+        self.model.optimizer.add(guarded)
+
+    def add_nsr(self, nsr):
+        self.add_nsrs([nsr])
+
+    def remove_nsr(self, name):
+        """Retract an NSR. Its constraints stay in the solver but are permanently switched off."""
+        nsr, literal, _ = self._active.pop(name)
+        self.model.optimizer.add(Not(literal))
+        return nsr
+
+    def push(self):
+        """Open a scope; NSRs added or removed until the matching pop() are restored by it."""
+        self.model.optimizer.push()
+        self._scopes.append((dict(self._active), self.model.num_constraints))
+
+    def pop(self):
+        self.model.optimizer.pop()
+        self._active, self.model.num_constraints = self._scopes.pop()
+
+    def assumptions(self):
+        return [literal for _, literal, _ in self._active.values()]
+
+    def _apply_hint(self):
+        # Start the search from the previous allocation; most edits only move a few APs.
+        last_model = self.model.last_model
+        opt = self.model.optimizer
+        if last_model is None or not hasattr(opt, "set_initial_value"):
+            return
+        for var in self.model.fw_alloc.values():
+            opt.set_initial_value(var, is_true(last_model.evaluate(var, model_completion=True)))
+
+    def solve(self, extra_assumptions=(), timeout_ms=None, hint=True):
+        """Re-optimize for the currently active NSRs and return the usual result dictionary."""
+        self.model.allow_rules = {
+            name: self._allow_vars[name]
+            for _, _, allow_names in self._active.values()
+            for name in allow_names
+        }
+        if hint:
+            self._apply_hint()
+        return solve_model(self.model, self.assumptions() + list(extra_assumptions), timeout_ms)
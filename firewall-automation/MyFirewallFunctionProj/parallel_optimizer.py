@@ -0,0 +1,119 @@
+"""
+parallel_optimizer.py
+
+Splits the firewall allocation problem into independent parts and solves them in parallel.
+
+Two NSRs only interact when their paths share an AP, so the APs and NSRs form an interaction
+graph whose connected components can be optimized separately: the minimal allocation of the
+whole problem is the union of the minimal allocations of its components. Solving many small
+models is much cheaper than one large one, and the components are spread over a
+concurrent.futures.ProcessPoolExecutor.
+
+Usage:
+  result = optimize_firewalls_parallel(topology, nsrs, max_workers=4)
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from MyFirewallFunctionProj.firewall_optimizer import ap_costs, optimize_firewalls, resolve_paths
+
+# Components are handed to workers in batches so tiny components don't pay one IPC round-trip each.
+BATCHES_PER_WORKER = 4
+
+
+def split_components(topology, nsrs):
+    """
+    Group NSRs into independent components.
+
+    Returns a list of (aps, nsrs) pairs, largest first. Each NSR is given an explicit "path" so
+    that a component can be solved without the rest of the topology. APs that no NSR touches do
+    not belong to any component.
+    """
+    parent = {}
+
+    def find(ap):
+        root = ap
+        while parent[root] != root:
+            root = parent[root]
+        while parent[ap] != root:
+            parent[ap], ap = root, parent[ap]
+        return root
+
+    paths = resolve_paths(topology, nsrs)
+    for path in paths:
+        for ap in path:
+            parent.setdefault(ap, ap)
+        root = find(path[0])
+        for ap in path[1:]:
+            other = find(ap)
+            if other != root:
+                parent[other] = root
+
+    components = {}
+    for nsr, path in zip(nsrs, paths):
+        aps, component_nsrs = components.setdefault(find(path[0]), (set(), []))
+        aps.update(path)
+        component_nsrs.append(dict(nsr, path=path))
+
+    return sorted(
+        ((sorted(aps), component_nsrs) for aps, component_nsrs in components.values()),
+        key=lambda component: len(component[1]),
+        reverse=True,
+    )
+
+
+def _solve_batch(batch):
+    return [
+        optimize_firewalls({"aps": aps, "links": [], "costs": costs}, nsrs, deadline, encoding)
+        for aps, nsrs, costs, deadline, encoding in batch
+    ]
+
+
+def _make_batches(components, num_batches):
+    # Deal components round-robin (largest first) so batches end up with similar amounts of work.
+    batches = [[] for _ in range(min(num_batches, len(components)))]
+    for i, component in enumerate(components):
+        batches[i % len(batches)].append(component)
+    return batches
+
+
+def merge_results(ap_names, results):
+    """Combine per-component results into one result dictionary over all APs."""
+    allocation = {ap: False for ap in ap_names}
+    allow_rules = {}
+    for result in results:
+        allocation.update(result["firewall_allocation"])
+        allow_rules.update(result["allow_rules"])
+    return {
+        "firewall_allocation": allocation,
+        "total_firewalls_deployed": sum(allocation.values()),
+        "total_cost": sum(result["total_cost"] for result in results),
+        "allow_rules": allow_rules,
+        "optimal": all(result["optimal"] for result in results),
+    }
+
+
+def optimize_firewalls_parallel(topology, nsrs, max_workers=None, deadline=None, encoding="sum"):
+    """
+    Solve each independent component of the problem in a worker process and merge the results.
+
+    max_workers defaults to os.cpu_count(); with a single worker, or a single component, everything
+    is solved in the calling process. deadline and encoding are applied to every component solve.
+    """
+    costs = ap_costs(topology)
+    components = [
+        (aps, component_nsrs, {ap: costs[ap] for ap in aps}, deadline, encoding)
+        for aps, component_nsrs in split_components(topology, nsrs)
+    ]
+    max_workers = max_workers or os.cpu_count() or 1
+
+    if max_workers == 1 or len(components) <= 1:
+        results = _solve_batch(components)
+    else:
+        results = []
+        batches = _make_batches(components, max_workers * BATCHES_PER_WORKER)
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            for batch_results in pool.map(_solve_batch, batches):
+                results.extend(batch_results)
+
+    return merge_results(topology["aps"], results)
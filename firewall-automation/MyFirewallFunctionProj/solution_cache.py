@@ -0,0 +1,173 @@
+"""
+solution_cache.py
+
+Content-addressed cache for firewall optimizer solutions.
+
+The timer triggers solve the same topology and NSRs every five minutes, and the inputs almost
+never change between ticks. This module hashes a canonical form of the optimizer input and keeps
+the solved allocation in a small SQLite database, so an unchanged input is answered without
+building or solving the Z3 model. The database is bounded to MAX_ENTRIES rows and evicts the
+least recently used solutions first.
+
+Usage:
+  result, cache_hit = run_cached(deploy=update_azure_firewall)
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from MyFirewallFunctionProj.example_network import DEFAULT_NSRS, DEFAULT_TOPOLOGY
+from MyFirewallFunctionProj.instrumentation import inc
+
+# Bump whenever the model encoding changes so that stale solutions are not served.
+CACHE_FORMAT_VERSION = 2
+CACHE_PATH = os.environ.get(
+    "FIREWALL_SOLUTION_CACHE", os.path.join(tempfile.gettempdir(), "firewall_solution_cache.sqlite3")
+)
+MAX_ENTRIES = int(os.environ.get("FIREWALL_SOLUTION_CACHE_ENTRIES", "256"))
+# Keep the solve well inside the five-minute timer window.
+SOLVE_DEADLINE_SECONDS = float(os.environ.get("FIREWALL_SOLVE_DEADLINE_SECONDS", "120"))
+
+
+def canonical_input(topology, nsrs):
+    """Return the optimizer input in a form that does not depend on list or key ordering."""
+    canonical_nsrs = sorted(json.dumps(nsr, sort_keys=True, separators=(",", ":")) for nsr in nsrs)
+    return {
+        "version": CACHE_FORMAT_VERSION,
+        "aps": sorted(topology["aps"]),
+        "links": sorted(sorted(link) for link in topology.get("links", [])),
+        "paths": topology.get("paths") or {},
+        "costs": topology.get("costs") or {},
+        "nsrs": canonical_nsrs,
+    }
+
+
+def solution_key(topology, nsrs):
+    """SHA-256 of the canonical optimizer input."""
+    payload = json.dumps(canonical_input(topology, nsrs), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SolutionCache:
+    """SQLite-backed map from solution_key() to a solved result dictionary."""
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # Shared by pipeline stages and the worker's thread pool; the lock serializes access.
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS solutions ("
+            " key TEXT PRIMARY KEY, result TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS solutions_last_used ON solutions (last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM solutions WHERE key = ?", (key,)).fetchone()
+            counter = "hits" if row is not None else "misses"
+            with self._conn:
+                if row is not None:
+                    self._conn.execute("UPDATE solutions SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._conn.execute(
+                    "INSERT INTO stats (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                    (counter,),
+                )
+            setattr(self, counter, getattr(self, counter) + 1)
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, key, result):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO solutions (key, result, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(result), now, now),
+            )
+            # Evict the least recently used rows beyond the size bound.
+            self._conn.execute(
+                "DELETE FROM solutions WHERE key NOT IN"
+                " (SELECT key FROM solutions ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def stats(self):
+        """Hit/miss counts for this process and for the lifetime of the cache file."""
+        with self._lock:
+            totals = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            size = self._conn.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": totals.get("hits", 0),
+            "total_misses": totals.get("misses", 0),
+            "entries": size,
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """Process-wide cache at CACHE_PATH, opened on first use."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = SolutionCache()
+    return _default_cache
+
+
+def lookup_solution(topology=None, nsrs=None, cache=None):
+    """Return (key, cached result or None) for the given optimizer input."""
+    cache = cache or get_default_cache()
+    key = solution_key(topology or DEFAULT_TOPOLOGY, DEFAULT_NSRS if nsrs is None else nsrs)
+    result = cache.get(key)
+    inc("solution_cache_lookups_total", result="hit" if result is not None else "miss")
+    logging.info("Solution cache %s for %s (%s)", "hit" if result is not None else "miss", key[:12], cache.stats())
+    return key, result
+
+
+def solve(topology=None, nsrs=None):
+    """Solve the model under SOLVE_DEADLINE_SECONDS."""
+    # Imported here so that cache hits never pay for loading Z3.
+    from MyFirewallFunctionProj.firewall_optimizer import optimize_firewalls
+    return optimize_firewalls(topology, nsrs, deadline=SOLVE_DEADLINE_SECONDS)
+
+
+def store_solution(key, result, cache=None):
+    """Cache a deployed result, unless the solve hit its deadline and may not be optimal."""
+    if result["optimal"]:
+        (cache or get_default_cache()).put(key, result)
+    else:
+        logging.warning("Solve for %s hit the %ss deadline; result not cached.", key[:12], SOLVE_DEADLINE_SECONDS)
+
+
+def run_cached(deploy=None, topology=None, nsrs=None, cache=None):
+    """
+    Return (result, cache_hit) for the given optimizer input.
+
+    On a miss the model is solved, deploy(result) is called if given, and only then is the result
+    stored, so a failed deployment is retried on the next tick. On a hit neither the solve nor
+    the deployment runs. Solves that hit SOLVE_DEADLINE_SECONDS are deployed but not cached, so
+    the next tick gets another chance to find the optimum.
+    """
+    key, result = lookup_solution(topology, nsrs, cache)
+    if result is not None:
+        return result, True
+
+    result = solve(topology, nsrs)
+    if deploy is not None:
+        deploy(result)
+    store_solution(key, result, cache)
+    return result, False
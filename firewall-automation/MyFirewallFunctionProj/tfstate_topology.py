@@ -0,0 +1,301 @@
+"""
+tfstate_topology.py
+
+Builds the optimizer's topology input from a Terraform state file.
+
+The subnets that terraform/main.tf creates (azurerm_subnet.subnets) are the allocation places
+the optimizer reasons about. This module reads terraform.tfstate (format version 4) and returns
+a topology dict, so a redeployed network no longer needs hand-edited AP names:
+
+  {
+      "aps": [subnet names],            # "<vnet>/<subnet>" where a name repeats across VNets
+      "links": [[ap, ap], ...],
+      "paths": {},
+      "subnets": {ap: {"id", "vnet", "address_prefixes"}},
+      "firewalls": {name: {"id", "resource_group", "subnet", "private_ip", "policy_id"}},
+      "rule_collections": [{"firewall", "name", "priority", "action", "rules": [rules.py-style]}],
+  }
+
+How links are derived:
+  - Subnets of one VNet reach each other directly.
+  - A subnet whose route table sends traffic to a firewall's private IP (next hop
+    "VirtualAppliance") is linked only to that firewall's subnet, so its paths run through the
+    firewall.
+  - Peerings and other routes are not modelled.
+
+Rule collections come from azurerm_firewall_network_rule_collection, and from the network rule
+collections of azurerm_firewall_policy_rule_collection_group.
+
+State files larger than STREAM_THRESHOLD bytes are parsed one resource at a time with ijson,
+when it is installed, so a multi-megabyte state is never held in memory as a whole. The result
+is cached in two layers:
+  - In the process, keyed by the file's mtime and size. A repeated tick costs one stat() call.
+  - On disk, keyed by the SHA-256 of the file. A touched but unchanged file, or a fresh worker
+    process, costs one hash instead of a parse.
+
+Usage:
+  topology = load_topology("terraform/terraform.tfstate")
+  result = optimize_firewalls(topology, nsrs)
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+try:
+    import ijson
+except ImportError:  # streaming is optional; small states parse fine with json
+    ijson = None
+
+TFSTATE_PATH = os.environ.get("FIREWALL_TFSTATE")
+CACHE_DIR = os.environ.get("FIREWALL_TFSTATE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "tfstate_topology"))
+STREAM_THRESHOLD = 1 << 20     # bytes
+# Bump whenever the extracted topology changes shape so stale disk caches are ignored.
+TOPOLOGY_FORMAT_VERSION = 1
+
+_lock = threading.Lock()
+_memory = {}    # path -> (mtime_ns, size, digest, topology)
+
+
+def _check_version(path, version):
+    if version != 4:
+        raise ValueError(f"{path}: unsupported Terraform state version {version!r}")
+
+
+def iter_resources(path, stream=None):
+    """Yield the resources of a version 4 state file; stream=None decides by file size."""
+    if stream is None:
+        stream = ijson is not None and os.path.getsize(path) > STREAM_THRESHOLD
+    with open(path, "rb") as f:
+        if stream:
+            if ijson is None:
+                raise ValueError("Streaming a Terraform state requires the ijson package.")
+            # "version" is written first, so this only reads the head of the file.
+            _check_version(path, next(ijson.items(f, "version"), None))
+            f.seek(0)
+            yield from ijson.items(f, "resources.item", use_float=True)
+            return
+        state = json.load(f)
+    _check_version(path, state.get("version"))
+    yield from state.get("resources") or []
+
+
+def _instances(resource):
+    for instance in resource.get("instances") or []:
+        attributes = instance.get("attributes")
+        if attributes:
+            yield attributes
+
+
+def _network_rule(rule):
+    protocols = rule.get("protocols") or ([rule["protocol"]] if rule.get("protocol") else [])
+    return {
+        "name": rule.get("name"),
+        "protocols": [str(protocol).upper() for protocol in protocols],
+        "source_addresses": list(rule.get("source_addresses") or []),
+        "destination_addresses": list(rule.get("destination_addresses") or []),
+        "destination_ports": list(rule.get("destination_ports") or []),
+    }
+
+
+def topology_from_resources(resources):
+    """Extract the topology dict (see the module docstring) from tfstate resources."""
+    subnets, firewalls, collections, policy_groups = [], [], [], []
+    route_tables, associations = {}, []
+    for resource in resources:
+        kind = resource.get("type")
+        for attributes in _instances(resource):
+            if kind == "azurerm_subnet":
+                subnets.append(attributes)
+            elif kind == "azurerm_firewall":
+                firewalls.append(attributes)
+            elif kind == "azurerm_firewall_network_rule_collection":
+                collections.append(attributes)
+            elif kind == "azurerm_firewall_policy_rule_collection_group":
+                policy_groups.append(attributes)
+            elif kind == "azurerm_route_table":
+                route_tables[attributes.get("id")] = attributes
+            elif kind == "azurerm_subnet_route_table_association":
+                associations.append(attributes)
+
+    # Subnet names repeat across VNets ("default"), so those are qualified with the VNet.
+    name_counts = {}
+    for subnet in subnets:
+        name_counts[subnet["name"]] = name_counts.get(subnet["name"], 0) + 1
+    ap_by_id = {}
+    subnet_info = {}
+    for subnet in subnets:
+        vnet = subnet.get("virtual_network_name")
+        ap = subnet["name"] if name_counts[subnet["name"]] == 1 else f"{vnet}/{subnet['name']}"
+        ap_by_id[(subnet.get("id") or "").lower()] = ap
+        prefixes = subnet.get("address_prefixes") or ([subnet["address_prefix"]] if subnet.get("address_prefix") else [])
+        subnet_info[ap] = {"id": subnet.get("id"), "vnet": vnet, "address_prefixes": list(prefixes)}
+
+    firewall_info = {}
+    firewall_by_ip = {}
+    firewall_by_policy = {}
+    for firewall in firewalls:
+        configs = firewall.get("ip_configuration") or []
+        subnet_id = next((c.get("subnet_id") for c in configs if c.get("subnet_id")), None)
+        private_ip = next((c.get("private_ip_address") for c in configs if c.get("private_ip_address")), None)
+        info = {
+            "id": firewall.get("id"),
+            "resource_group": firewall.get("resource_group_name"),
+            "subnet": ap_by_id.get((subnet_id or "").lower()),
+            "private_ip": private_ip,
+            "policy_id": firewall.get("firewall_policy_id") or None,
+        }
+        firewall_info[firewall["name"]] = info
+        if private_ip:
+            firewall_by_ip[private_ip] = info
+        if info["policy_id"]:
+            firewall_by_policy[info["policy_id"].lower()] = firewall["name"]
+
+    # Subnets whose route table points at a firewall are forced through the firewall's subnet.
+    forced = {}
+    for association in associations:
+        ap = ap_by_id.get((association.get("subnet_id") or "").lower())
+        table = route_tables.get(association.get("route_table_id"))
+        if ap is None or table is None:
+            continue
+        for route in table.get("route") or []:
+            firewall = firewall_by_ip.get(route.get("next_hop_in_ip_address"))
+            if route.get("next_hop_type") == "VirtualAppliance" and firewall and firewall["subnet"]:
+                forced[ap] = firewall["subnet"]
+                break
+
+    aps = sorted(subnet_info)
+    links = set()
+    by_vnet = {}
+    for ap in aps:
+        by_vnet.setdefault(subnet_info[ap]["vnet"], []).append(ap)
+    for members in by_vnet.values():
+        direct = [ap for ap in members if ap not in forced]
+        for i, a in enumerate(direct):
+            for b in direct[i + 1:]:
+                links.add((a, b))
+    for ap, hub in forced.items():
+        if ap != hub:
+            links.add(tuple(sorted((ap, hub))))
+
+    rule_collections = [
+        {
+            "firewall": collection.get("azure_firewall_name") or collection.get("firewall_name"),
+            "name": collection.get("name"),
+            "priority": collection.get("priority"),
+            "action": collection.get("action"),
+            "rules": [_network_rule(rule) for rule in collection.get("rule") or []],
+        }
+        for collection in collections
+    ]
+    for group in policy_groups:
+        firewall = firewall_by_policy.get((group.get("firewall_policy_id") or "").lower())
+        for collection in group.get("network_rule_collection") or []:
+            rule_collections.append({
+                "firewall": firewall,
+                "name": collection.get("name"),
+                "priority": collection.get("priority"),
+                "action": collection.get("action"),
+                "rules": [_network_rule(rule) for rule in collection.get("rule") or []],
+            })
+
+    return {
+        "aps": aps,
+        "links": [list(link) for link in sorted(links)],
+        "paths": {},
+        "subnets": subnet_info,
+        "firewalls": firewall_info,
+        "rule_collections": rule_collections,
+    }
+
+
+def parse_tfstate(path, stream=None):
+    return topology_from_resources(iter_resources(path, stream))
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _read_disk_cache(cache_path):
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cached.get("topology") if cached.get("version") == TOPOLOGY_FORMAT_VERSION else None
+
+
+def _write_disk_cache(cache_path, topology):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": TOPOLOGY_FORMAT_VERSION, "topology": topology}, f)
+    os.replace(tmp_path, cache_path)
+
+
+def load_topology(path=TFSTATE_PATH, cache_dir=CACHE_DIR):
+    """
+    The topology for a state file, re-parsed only when its content changes.
+
+    The returned dict is shared between callers and must not be modified.
+    """
+    if not path:
+        raise ValueError("No Terraform state path given (set FIREWALL_TFSTATE).")
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    with _lock:
+        entry = _memory.get(path)
+    if entry is not None and entry[:2] == (st.st_mtime_ns, st.st_size):
+        return entry[3]
+
+    digest = file_digest(path)
+    if entry is not None and entry[2] == digest:
+        topology = entry[3]
+    else:
+        cache_path = os.path.join(cache_dir, f"{digest}.json") if cache_dir else None
+        topology = _read_disk_cache(cache_path) if cache_path else None
+        if topology is None:
+            topology = parse_tfstate(path)
+            logging.info(f"Parsed {path}: {len(topology['aps'])} subnets, {len(topology['firewalls'])} firewalls, "
+                         f"{len(topology['rule_collections'])} rule collections.")
+            if cache_path:
+                _write_disk_cache(cache_path, topology)
+    if not topology["aps"]:
+        raise ValueError(f"{path}: the Terraform state has no azurerm_subnet instances. "
+                         "Apply terraform/ first, or point FIREWALL_TFSTATE at a deployed state.")
+    with _lock:
+        _memory[path] = (st.st_mtime_ns, st.st_size, digest, topology)
+    return topology
+
+
+def check_nsrs(topology, nsrs, path):
+    """Raise ValueError, naming the state file, if an NSR's source or destination is not a subnet in it."""
+    aps = set(topology["aps"])
+    unknown = [f"NSR '{nsr['name']}' {end} '{nsr[end]}'"
+               for nsr in nsrs for end in ("source", "destination") if nsr[end] not in aps]
+    if unknown:
+        raise ValueError(f"{path}: not a subnet in the Terraform state: {', '.join(unknown)}. "
+                         f"The state has {', '.join(sorted(aps))}.")
+
+
+def configured_topology(nsrs=None):
+    """
+    load_topology() for FIREWALL_TFSTATE, or None when it is not set.
+
+    `nsrs` (DEFAULT_NSRS when None) are checked against the loaded subnets with check_nsrs().
+    """
+    if not TFSTATE_PATH:
+        return None
+    topology = load_topology(TFSTATE_PATH)
+    if nsrs is None:
+        from MyFirewallFunctionProj.example_network import DEFAULT_NSRS
+        nsrs = DEFAULT_NSRS
+    check_nsrs(topology, nsrs, TFSTATE_PATH)
+    return topology
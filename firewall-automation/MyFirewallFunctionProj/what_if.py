@@ -0,0 +1,128 @@
+"""
+what_if.py
+
+Batch "what if" evaluation of firewall allocation scenarios against one warm Z3 model.
+
+Change reviews ask questions like "what if the dmz firewall goes away?" or "what if this NSR
+becomes Allow?", often dozens at a time. The base topology and NSRs are encoded once in an
+OptimizerSession. Each scenario is then a delta, evaluated inside a push()/pop() scope on the
+same solver:
+
+  - "forbid_firewalls" / "require_firewalls": APs assumed to have no firewall, or one. These are
+    assumption literals only, so nothing is added to the solver.
+  - "remove_nsrs": NSR names that are simply not assumed for this scenario.
+  - "set_actions": {NSR name: "Allow" | "Deny"}. The NSR is swapped for a re-encoded copy.
+  - "add_nsrs": extra NSR dicts, encoded behind fresh tracking literals inside the scope.
+
+Every scenario reports whether it is feasible and, if so, its optimal cost and the APs whose
+decision differs from the baseline. An infeasible scenario instead reports an unsat core: the
+NSRs ("nsr:<name>") and firewall assumptions ("forbid_firewall:<ap>", "require_firewall:<ap>")
+that cannot all hold together. The core is minimized, so it names only what a reviewer would
+have to give up.
+
+Usage:
+  report = evaluate_scenarios(topology, nsrs, [
+      {"name": "no dmz firewall", "forbid_firewalls": ["dmz"]},
+      {"name": "allow frontend", "set_actions": {"block_frontend_backend": "Allow"}},
+  ])
+  for scenario in report["scenarios"]:
+      print(scenario["name"], scenario["feasible"], scenario["total_cost"], scenario["unsat_core"])
+"""
+import time
+
+from z3 import Not
+
+from MyFirewallFunctionProj.firewall_optimizer import InfeasibleError
+from MyFirewallFunctionProj.instrumentation import inc, span
+from MyFirewallFunctionProj.optimizer_session import OptimizerSession
+
+SCENARIO_KEYS = {"name", "forbid_firewalls", "require_firewalls", "remove_nsrs", "set_actions", "add_nsrs"}
+
+
+def _validate(session, scenario):
+    unknown_keys = set(scenario) - SCENARIO_KEYS
+    if unknown_keys:
+        raise ValueError(f"Scenario {scenario.get('name')!r} has unknown keys {sorted(unknown_keys)}")
+    aps = set(scenario.get("forbid_firewalls", ())) | set(scenario.get("require_firewalls", ()))
+    unknown_aps = sorted(ap for ap in aps if ap not in session.model.fw_alloc)
+    if unknown_aps:
+        raise ValueError(f"Scenario {scenario.get('name')!r} references unknown APs {unknown_aps}")
+    names = list(scenario.get("remove_nsrs", ())) + list(scenario.get("set_actions", {}))
+    unknown_nsrs = sorted(name for name in names if name not in session.nsr_names)
+    if unknown_nsrs:
+        raise ValueError(f"Scenario {scenario.get('name')!r} references unknown NSRs {unknown_nsrs}")
+
+
+def _minimal_core(session, extra):
+    # core.minimize slows every check, feasible ones included, so it is only switched on to
+    # re-derive the core once a scenario is known to be infeasible.
+    opt = session.model.optimizer
+    opt.set("core.minimize", True)
+    try:
+        opt.check(*(session.assumptions() + extra))
+        return opt.unsat_core()
+    finally:
+        opt.set("core.minimize", False)
+
+
+def evaluate_scenario(session, scenario, baseline=None, timeout_ms=None):
+    """Evaluate one scenario dict on `session`, leaving the session as it was."""
+    _validate(session, scenario)
+    fw_alloc = session.model.fw_alloc
+    start = time.perf_counter()
+    report = {"name": scenario.get("name"), "feasible": None, "total_cost": None, "total_firewalls": None,
+              "firewall_allocation": None, "changed_aps": None, "unsat_core": None, "optimal": None}
+
+    session.push()
+    try:
+        for name in scenario.get("remove_nsrs", ()):
+            session.remove_nsr(name)
+        replaced = [
+            dict(session.remove_nsr(name), action=action)
+            for name, action in scenario.get("set_actions", {}).items()
+        ]
+        session.add_nsrs(replaced + list(scenario.get("add_nsrs", ())))
+
+        labels = {session.literal(name).get_id(): f"nsr:{name}" for name in session.nsr_names}
+        extra = []
+        for ap in scenario.get("forbid_firewalls", ()):
+            extra.append(Not(fw_alloc[ap]))
+            labels[extra[-1].get_id()] = f"forbid_firewall:{ap}"
+        for ap in scenario.get("require_firewalls", ()):
+            extra.append(fw_alloc[ap])
+            labels[extra[-1].get_id()] = f"require_firewall:{ap}"
+
+        try:
+            # Scenarios are unrelated edits of the baseline, so seeding with the last model is no help.
+            result = session.solve(extra, timeout_ms, hint=False)
+        except InfeasibleError:
+            core = _minimal_core(session, extra)
+            report.update(feasible=False, unsat_core=sorted(labels.get(lit.get_id(), str(lit)) for lit in core))
+        except TimeoutError as e:
+            report["error"] = str(e)
+        else:
+            allocation = result["firewall_allocation"]
+            report.update(feasible=True, total_cost=result["total_cost"], total_firewalls=result["total_firewalls_deployed"],
+                          firewall_allocation=allocation, optimal=result["optimal"])
+            if baseline is not None:
+                report["changed_aps"] = sorted(ap for ap, deployed in allocation.items()
+                                               if deployed != baseline["firewall_allocation"].get(ap))
+    finally:
+        session.pop()
+    report["seconds"] = time.perf_counter() - start
+    inc("what_if_scenarios_total", feasible=report["feasible"])
+    return report
+
+
+def evaluate_scenarios(topology, nsrs, scenarios, timeout_ms=None, session=None):
+    """
+    Solve the baseline once and then every scenario on the same warm solver.
+
+    Returns {"baseline": result, "scenarios": [per-scenario reports in input order]}.
+    A session built for (topology, nsrs) can be passed in and reused between batches.
+    """
+    session = session or OptimizerSession(topology, nsrs)
+    with span("what_if_batch", scenarios=len(scenarios)):
+        baseline = session.solve(timeout_ms=timeout_ms)
+        reports = [evaluate_scenario(session, scenario, baseline, timeout_ms) for scenario in scenarios]
+    return {"baseline": baseline, "scenarios": reports}
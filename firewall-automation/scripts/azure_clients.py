@@ -0,0 +1,87 @@
+"""
+azure_clients.py
+
+Process-wide cache of Azure credentials and management clients.
+
+An Azure Functions worker process lives across many timer ticks. Building a new
+DefaultAzureCredential for every tick throws away the access token it has already acquired,
+and building a new NetworkManagementClient throws away its HTTP connection pool. Both are
+created here once per process and then reused. The credential refreshes its own token when
+the token nears expiry.
+
+The Azure SDK packages are imported on first use rather than at module import, so importing a
+handler module stays cheap on a cold start.
+
+Usage:
+  network_client = get_network_client(SUBSCRIPTION_ID)
+  table_client = get_table_client(account_url, TABLE_NAME, credential=STORAGE_ACCOUNT_KEY)
+"""
+import threading
+
+_lock = threading.Lock()
+_credential = None
+_network_clients = {}
+_table_clients = {}
+
+
+def get_credential():
+    """The shared DefaultAzureCredential (its token cache is reused between invocations)."""
+    global _credential
+    with _lock:
+        if _credential is None:
+            from azure.identity import DefaultAzureCredential
+            _credential = DefaultAzureCredential()
+        return _credential
+
+
+def get_network_client(subscription_id):
+    """The shared NetworkManagementClient for a subscription."""
+    with _lock:
+        client = _network_clients.get(subscription_id)
+    if client is not None:
+        return client
+    credential = get_credential()
+    with _lock:
+        client = _network_clients.get(subscription_id)
+        if client is None:
+            from azure.mgmt.network import NetworkManagementClient
+            client = _network_clients[subscription_id] = NetworkManagementClient(credential, subscription_id)
+        return client
+
+
+def set_network_client(subscription_id, client):
+    """Use `client` for a subscription from now on (the load harness installs stand-ins this way)."""
+    with _lock:
+        _network_clients[subscription_id] = client
+
+
+def get_table_client(account_url, table_name, credential=None):
+    """The shared TableClient for a table; `credential` defaults to the shared Azure credential."""
+    key = (account_url, table_name)
+    with _lock:
+        client = _table_clients.get(key)
+    if client is not None:
+        return client
+    credential = credential if credential is not None else get_credential()
+    with _lock:
+        client = _table_clients.get(key)
+        if client is None:
+            from azure.data.tables import TableServiceClient
+            service = TableServiceClient(account_url=account_url, credential=credential)
+            client = _table_clients[key] = service.get_table_client(table_name=table_name)
+        return client
+
+
+def set_table_client(account_url, table_name, client):
+    """Use `client` for a table from now on."""
+    with _lock:
+        _table_clients[(account_url, table_name)] = client
+
+
+def reset_clients():
+    """Drop every cached credential and client (after a credential rotation, or in tests)."""
+    global _credential
+    with _lock:
+        _credential = None
+        _network_clients.clear()
+        _table_clients.clear()
@@ -0,0 +1,90 @@
+"""
+bench_blocklist_manager.py
+
+Measures BlocklistManager at 1,000,000 tracked networks with a 10,000-network rule budget. It
+times:
+  - the cold sync, and a full re-sync of an unchanged feed;
+  - a run where 1% of the feed was added, removed or re-scored, applied as a delta and ticked;
+  - a tick after a week with no feed changes, so networks expire and are promoted;
+  - the save of the full state, a journal append, and a load.
+
+Usage:
+  python -m scripts.bench_blocklist_manager               # 1,000,000 networks
+  python -m scripts.bench_blocklist_manager 200000
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from scripts.blocklist_manager import BlocklistManager
+from scripts.blocklist_snapshot import SnapshotDiff
+from scripts.bench_blocklist_snapshot import synthetic_networks
+
+BUDGET = 10000
+CONFIDENCE = {"Spamhaus": 90.0, "FireHOL": 70.0, "AlienVault": 50.0, "AbuseIPDB": 60.0}
+
+
+def confidence_of(sources):
+    miss = 1.0
+    for source in sources:
+        miss *= 1.0 - CONFIDENCE[source] / 100.0
+    return 100.0 * (1.0 - miss)
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:<26} {time.perf_counter() - start:8.3f} s")
+    return result
+
+
+def run_benchmark(count):
+    networks = synthetic_networks(count)
+    rng = random.Random(10)
+    keys = sorted(networks)
+    removed = rng.sample(keys, count // 300)
+    changed = [key for key in rng.sample(keys, count // 300) if key not in set(removed)]
+    added = [key for key in synthetic_networks(count // 300, seed=11) if key not in networks]
+    updated = dict(networks)
+    for key in removed:
+        del updated[key]
+    for key in changed:
+        updated[key] = ["Spamhaus", "FireHOL"]
+    updated.update({key: ["AbuseIPDB"] for key in added})
+    delta = SnapshotDiff(added=added, removed=removed, changed=changed)
+    hits = {key: rng.randrange(1, 50) for key in rng.sample(keys, 1000)}
+
+    now = time.time()
+    manager = BlocklistManager(BUDGET)
+    timed("cold sync", lambda: manager.sync(networks, confidence_of, now))
+    timed("cold tick", lambda: manager.tick(now))
+    timed("re-sync unchanged", lambda: manager.sync(networks, confidence_of, now + 300))
+    timed("tick unchanged", lambda: manager.tick(now + 300))
+    manager._dirty.clear()
+    timed("apply 1% delta", lambda: manager.apply_delta(updated, delta, confidence_of, now + 600))
+    timed("record 1,000 hits", lambda: manager.record_hits(hits, now + 600))
+    report = timed("tick after delta", lambda: manager.tick(now + 600))
+    print(f"{'':<26} {len(report['promoted'])} promoted, {len(report['demoted'])} demoted, {report['tracked']} tracked")
+    report = timed("tick a week later", lambda: manager.tick(now + 7 * 86400))
+    print(f"{'':<26} {report['expired']} expired, {len(report['promoted'])} promoted")
+
+    fd, path = tempfile.mkstemp(suffix=".jsonl")
+    os.close(fd)
+    os.remove(path)
+    try:
+        timed("save (full state)", lambda: manager.save(path))
+        manager.apply_delta(updated, SnapshotDiff(removed=added), confidence_of, now + 900)
+        manager.tick(now + 900)
+        timed("save (journal append)", lambda: manager.save(path))
+        print(f"{'state size':<26} {os.path.getsize(path) / 1e6:8.1f} MB")
+        timed("load", lambda: BlocklistManager.load(path, BUDGET))
+    finally:
+        for file_path in (path, path + ".journal"):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,71 @@
+"""
+bench_blocklist_store.py
+
+Measures BlocklistStore.sync() against a local mongod. It compares a cold load, a re-run of
+the identical feed, and a run where 1% of the feed changed. These are the legacy insert_many
+path's three worst cases, because it rewrote the whole feed every time.
+
+Uses a scratch database that is dropped afterwards. Exits early if no mongod answers.
+
+Usage:
+  python -m scripts.bench_blocklist_store                 # 100,000 networks
+  python -m scripts.bench_blocklist_store 500000 mongodb://localhost:27017/
+"""
+import random
+import sys
+import time
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from scripts.blocklist_store import BlocklistStore
+
+BENCH_DB = "firewallDB_bench"
+
+
+def synthetic_entries(count, seed=11):
+    rng = random.Random(seed)
+    entries = {}
+    while len(entries) < count:
+        network = f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}"
+        entries[network] = {"sources": ["FireHOL"], "confidence": 70.0}
+    return entries
+
+
+def timed_sync(store, label, entries):
+    start = time.perf_counter()
+    counts = store.sync(entries)
+    elapsed = time.perf_counter() - start
+    writes = counts["inserted"] + counts["updated"] + counts["refreshed"]
+    print(f"{label:<16} {elapsed:8.2f} s  {writes:>8} writes  {counts}")
+
+
+def run_benchmark(count, uri):
+    client = MongoClient(uri, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError as e:
+        print(f"mongod not reachable at {uri} ({e}); skipping benchmark.")
+        return
+    client.drop_database(BENCH_DB)
+    store = BlocklistStore(client[BENCH_DB]["blockedIPs"])
+    try:
+        entries = synthetic_entries(count)
+        timed_sync(store, "cold load", entries)
+        timed_sync(store, "same feed", entries)
+
+        rng = random.Random(12)
+        changed = dict(entries)
+        for network in rng.sample(sorted(changed), count // 100):
+            changed[network] = {"sources": ["FireHOL", "Spamhaus"], "confidence": 94.0}
+        timed_sync(store, "1% changed", changed)
+
+        documents = store.collection.count_documents({})
+        print(f"documents:       {documents} (feed size {count})")
+    finally:
+        client.drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+                  sys.argv[2] if len(sys.argv) > 2 else "mongodb://localhost:27017/")
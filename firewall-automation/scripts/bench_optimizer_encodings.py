@@ -0,0 +1,52 @@
+"""
+bench_optimizer_encodings.py
+
+Compares the objective encodings of firewall_optimizer (arithmetic "sum", weighted soft
+constraints "soft", pseudo-Boolean bound tightening "pb") on synthetic topologies with random
+per-AP deployment costs. Every solve runs under the same deadline, so the table also shows how
+good an answer each encoding reaches when it cannot finish.
+
+Usage:
+  python -m scripts.bench_optimizer_encodings                  # 100, 500 and 2000 APs, 30s deadline
+  python -m scripts.bench_optimizer_encodings 1000 --deadline 10
+"""
+import argparse
+import random
+import time
+
+from MyFirewallFunctionProj.firewall_optimizer import ENCODINGS, build_model, solve_model
+from scripts.synthetic_topology import generate_topology
+
+DEFAULT_SIZES = [100, 500, 2000]
+
+
+def run_benchmark(sizes, deadline, max_cost=10):
+    print(f"{'APs':>8} {'encoding':>9} {'build (s)':>10} {'solve (s)':>10} {'cost':>8} {'optimal':>8}")
+    for num_aps in sizes:
+        topology, nsrs = generate_topology(num_aps)
+        rng = random.Random(num_aps)
+        topology["costs"] = {ap: rng.randint(1, max_cost) for ap in topology["aps"]}
+
+        for encoding in ENCODINGS:
+            start = time.perf_counter()
+            model = build_model(topology, nsrs, encoding)
+            build_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            try:
+                result = solve_model(model, timeout_ms=int(deadline * 1000))
+                cost, optimal = result["total_cost"], result["optimal"]
+            except TimeoutError:
+                cost, optimal = "-", False
+            solve_time = time.perf_counter() - start
+
+            print(f"{len(topology['aps']):>8} {encoding:>9} {build_time:>10.3f} {solve_time:>10.3f} "
+                  f"{cost:>8} {str(optimal):>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sizes", nargs="*", type=int, default=DEFAULT_SIZES)
+    parser.add_argument("--deadline", type=float, default=30.0, help="solve deadline in seconds")
+    args = parser.parse_args()
+    run_benchmark(args.sizes, args.deadline)
@@ -0,0 +1,38 @@
+"""
+bench_optimizer_scaling.py
+
+Measures how long firewall_optimizer.build_model() and solve_model() take on synthetic
+topologies of increasing size.
+
+Usage:
+  python -m scripts.bench_optimizer_scaling            # 10, 100, 1000 and 10000 APs
+  python -m scripts.bench_optimizer_scaling 10 100     # custom sizes
+"""
+import sys
+import time
+
+from MyFirewallFunctionProj.firewall_optimizer import build_model, solve_model
+from scripts.synthetic_topology import generate_topology
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+
+def run_benchmark(sizes):
+    print(f"{'APs':>8} {'NSRs':>8} {'constraints':>12} {'build (s)':>10} {'solve (s)':>10} {'firewalls':>10}")
+    for num_aps in sizes:
+        topology, nsrs = generate_topology(num_aps)
+
+        start = time.perf_counter()
+        model = build_model(topology, nsrs)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = solve_model(model)
+        solve_time = time.perf_counter() - start
+
+        print(f"{len(topology['aps']):>8} {len(nsrs):>8} {model.num_constraints:>12} "
+              f"{build_time:>10.3f} {solve_time:>10.3f} {result['total_firewalls_deployed']:>10}")
+
+
+if __name__ == "__main__":
+    run_benchmark([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,50 @@
+"""
+bench_parallel_optimizer.py
+
+Compares the monolithic optimize_firewalls() solve with optimize_firewalls_parallel() over a
+range of worker counts, on synthetic topologies whose regions are independent.
+
+Usage:
+  python -m scripts.bench_parallel_optimizer              # 1000 and 5000 APs
+  python -m scripts.bench_parallel_optimizer 20000        # custom sizes
+"""
+import os
+import sys
+import time
+
+from MyFirewallFunctionProj.firewall_optimizer import optimize_firewalls
+from MyFirewallFunctionProj.parallel_optimizer import optimize_firewalls_parallel, split_components
+from scripts.synthetic_topology import generate_topology
+
+DEFAULT_SIZES = [1000, 5000]
+
+
+def worker_counts():
+    cores = os.cpu_count() or 1
+    counts = [1, 2, 4, 8, cores]
+    return sorted({count for count in counts if count <= cores})
+
+
+def run_benchmark(sizes):
+    print(f"{'APs':>8} {'NSRs':>8} {'components':>11} {'mode':>14} {'wall (s)':>10} {'speedup':>8} {'firewalls':>10}")
+    for num_aps in sizes:
+        topology, nsrs = generate_topology(num_aps, cross_region_ratio=0.0)
+        num_components = len(split_components(topology, nsrs))
+
+        start = time.perf_counter()
+        baseline = optimize_firewalls(topology, nsrs)
+        monolithic = time.perf_counter() - start
+        print(f"{len(topology['aps']):>8} {len(nsrs):>8} {num_components:>11} {'monolithic':>14} "
+              f"{monolithic:>10.3f} {1.0:>8.2f} {baseline['total_firewalls_deployed']:>10}")
+
+        for workers in worker_counts():
+            start = time.perf_counter()
+            result = optimize_firewalls_parallel(topology, nsrs, max_workers=workers)
+            elapsed = time.perf_counter() - start
+            assert result["total_firewalls_deployed"] == baseline["total_firewalls_deployed"]
+            print(f"{'':>8} {'':>8} {'':>11} {f'{workers} workers':>14} "
+                  f"{elapsed:>10.3f} {monolithic / elapsed:>8.2f} {result['total_firewalls_deployed']:>10}")
+
+
+if __name__ == "__main__":
+    run_benchmark([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
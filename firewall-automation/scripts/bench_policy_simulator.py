@@ -0,0 +1,66 @@
+"""
+bench_policy_simulator.py
+
+Measures policy_simulator throughput in flows per second. It compiles a synthetic rule set and
+replays random IPv4 flows on one core and then over a process pool, comparing the result against
+a second rule set with some actions flipped.
+
+Usage:
+  python -m scripts.bench_policy_simulator                  # 5,000,000 flows, 200 rules
+  python -m scripts.bench_policy_simulator 20000000 1000 4
+"""
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+from scripts.policy_simulator import CompiledPolicy, simulate
+
+PORTS = ["22", "53", "80", "443", "1433", "3389", "8000-8999", "*"]
+
+
+def synthetic_rules(count, seed=31):
+    rng = random.Random(seed)
+    return [{
+        "name": f"Rule{i:04d}", "priority": 100 + i, "action": rng.choice(["Allow", "Allow", "Deny"]),
+        "protocols": [rng.choice(["TCP", "UDP", "Any"])],
+        "source_addresses": [rng.choice(["*", "10.0.0.0/8", f"172.16.{rng.randrange(256)}.0/24"])],
+        "destination_addresses": [f"10.{rng.randrange(16)}.{rng.randrange(256)}.0/{rng.choice([16, 24, 28, 32])}"],
+        "destination_ports": [rng.choice(PORTS)],
+    } for i in range(count)]
+
+
+def synthetic_flows(count, seed=32):
+    rng = np.random.default_rng(seed)
+    return {
+        "src": rng.integers(0, 2 ** 32, size=count, dtype=np.uint32),
+        "dst": (10 << 24) + rng.integers(0, 1 << 20, size=count, dtype=np.uint32),
+        "port": rng.choice(np.array([22, 53, 80, 443, 1433, 3389, 8080, 50000], dtype=np.uint16), size=count),
+        "protocol": rng.integers(0, 3, size=count, dtype=np.uint8),
+    }
+
+
+def run_benchmark(num_flows, num_rules, max_workers):
+    rules = synthetic_rules(num_rules)
+    current = [dict(rule, action="Deny") if i % 10 == 0 else rule for i, rule in enumerate(rules)]
+    flows = synthetic_flows(num_flows)
+
+    start = time.perf_counter()
+    CompiledPolicy(rules)
+    print(f"compile:       {time.perf_counter() - start:.3f} s for {num_rules} rules")
+
+    for workers in sorted({1, max_workers}):
+        start = time.perf_counter()
+        report = simulate(rules, flows, current_rules=current, max_workers=workers)
+        elapsed = time.perf_counter() - start
+        print(f"{workers} worker(s):   {num_flows / elapsed:,.0f} flows/s ({elapsed:.2f} s), "
+              f"{report['allowed']} allowed, {len(report['changed'])} verdicts changed "
+              f"(both rule sets evaluated)")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 5000000,
+                  int(sys.argv[2]) if len(sys.argv) > 2 else 200,
+                  int(sys.argv[3]) if len(sys.argv) > 3 else (os.cpu_count() or 1))
@@ -0,0 +1,64 @@
+"""
+bench_rule_analyzer.py
+
+Times analyze_rules() on synthetic rule sets. Each set mixes per-host service rules, subnet-wide
+deny rules and duplicated rules, which is the kind of rule set that grows by accretion over
+time. A second set gives every rule a "*" destination and its own source host, the case a
+destination-only candidate search degrades on. Also prints how many rules the minimized set keeps.
+
+Usage:
+  python -m scripts.bench_rule_analyzer                  # 1,000 / 5,000 / 20,000 rules
+  python -m scripts.bench_rule_analyzer 50000
+"""
+import random
+import sys
+import time
+
+from scripts.rule_analyzer import analyze_rules
+
+PORTS = ["22", "53", "80", "443", "1433", "3389", "8080-8090"]
+
+
+def synthetic_rules(count, seed=21):
+    rng = random.Random(seed)
+    rules = []
+    for i in range(count):
+        subnet = rng.randrange(count // 20 + 1)
+        kind = rng.random()
+        if kind < 0.05:
+            rule = {"action": "Deny", "destination_addresses": [f"10.{subnet // 256}.{subnet % 256}.0/24"],
+                    "destination_ports": ["*"], "protocols": ["Any"]}
+        elif kind < 0.10 and rules:
+            rule = dict(rng.choice(rules))
+        else:
+            rule = {"action": "Allow", "destination_addresses": [f"10.{subnet // 256}.{subnet % 256}.{rng.randrange(256)}"],
+                    "destination_ports": [rng.choice(PORTS)], "protocols": [rng.choice(["TCP", "UDP"])]}
+        rule.update(name=f"Rule{i:05d}", priority=1000 + i, source_addresses=["*"])
+        rules.append(rule)
+    return rules
+
+
+def wildcard_rules(count, seed=3):
+    rng = random.Random(seed)
+    return [
+        {"name": f"Rule{i:05d}", "priority": 1000 + i, "action": rng.choice(["Allow", "Deny"]),
+         "source_addresses": [f"172.{16 + i // 65536}.{i // 256 % 256}.{i % 256}"], "destination_addresses": ["*"],
+         "destination_ports": [rng.choice(PORTS)], "protocols": [rng.choice(["TCP", "UDP"])]}
+        for i in range(count)
+    ]
+
+
+def run_benchmark(sizes):
+    for (label, generate), count in ((case, count) for case in (("mixed", synthetic_rules),
+                                                               ("wildcard", wildcard_rules)) for count in sizes):
+        rules = generate(count)
+        start = time.perf_counter()
+        report = analyze_rules(rules)
+        elapsed = time.perf_counter() - start
+        print(f"{label:>8} {count:>7} rules: {elapsed:7.2f} s, {len(report['shadowed'])} shadowed, "
+              f"{len(report['redundant'])} redundant, {len(report['correlated'])} correlated, "
+              f"{len(report['mergeable'])} merge groups -> {report['stats']['minimized_rules']} rules")
+
+
+if __name__ == "__main__":
+    run_benchmark([int(arg) for arg in sys.argv[1:]] or [1000, 5000, 20000])
@@ -0,0 +1,85 @@
+"""
+bench_what_if.py
+
+Compares batch what-if evaluation (one OptimizerSession, a push/pop scope per scenario) with
+solving every scenario cold (build_model + solve_model on edited inputs). It runs on synthetic
+topologies and a random mix of scenario kinds, and checks that both approaches agree on every
+optimal cost.
+
+Usage:
+  python -m scripts.bench_what_if                 # 200 and 1000 APs, 50 scenarios
+  python -m scripts.bench_what_if 500 --scenarios 100
+"""
+import argparse
+import random
+import time
+
+from z3 import Not
+
+from MyFirewallFunctionProj.firewall_optimizer import InfeasibleError, build_model, solve_model
+from MyFirewallFunctionProj.what_if import evaluate_scenarios
+from scripts.synthetic_topology import generate_topology
+
+DEFAULT_SIZES = [200, 1000]
+
+
+def random_scenarios(topology, nsrs, count, seed=11):
+    rng = random.Random(seed)
+    scenarios = []
+    for i in range(count):
+        nsr = rng.choice(nsrs)
+        kind = rng.randrange(4)
+        if kind == 0:
+            scenario = {"forbid_firewalls": rng.sample(topology["aps"], 2)}
+        elif kind == 1:
+            scenario = {"set_actions": {nsr["name"]: "Allow" if nsr.get("action", "Deny") == "Deny" else "Deny"}}
+        elif kind == 2:
+            scenario = {"remove_nsrs": [nsr["name"]]}
+        else:
+            scenario = {"add_nsrs": [dict(nsr, name=f"extra{i}", action="Deny")]}
+        scenarios.append(dict(scenario, name=f"scenario{i}"))
+    return scenarios
+
+
+def cold_solve(topology, nsrs, scenario):
+    removed = set(scenario.get("remove_nsrs", ()))
+    actions = scenario.get("set_actions", {})
+    edited = [dict(nsr, action=actions.get(nsr["name"], nsr.get("action", "Deny")))
+              for nsr in nsrs if nsr["name"] not in removed] + list(scenario.get("add_nsrs", ()))
+    model = build_model(topology, edited)
+    model.optimizer.add([Not(model.fw_alloc[ap]) for ap in scenario.get("forbid_firewalls", ())])
+    model.optimizer.add([model.fw_alloc[ap] for ap in scenario.get("require_firewalls", ())])
+    try:
+        return solve_model(model)["total_cost"]
+    except InfeasibleError:
+        return None
+
+
+def run_benchmark(sizes, num_scenarios):
+    print(f"{'APs':>8} {'scenarios':>10} {'cold (s)':>10} {'batch (s)':>10} {'speedup':>8} {'infeasible':>11}")
+    for num_aps in sizes:
+        topology, nsrs = generate_topology(num_aps)
+        scenarios = random_scenarios(topology, nsrs, num_scenarios)
+
+        start = time.perf_counter()
+        cold = [cold_solve(topology, nsrs, scenario) for scenario in scenarios]
+        cold_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        report = evaluate_scenarios(topology, nsrs, scenarios)
+        batch_time = time.perf_counter() - start
+
+        batch = [outcome["total_cost"] for outcome in report["scenarios"]]
+        if batch != cold:
+            raise AssertionError(f"Batch and cold costs disagree for {num_aps} APs")
+        infeasible = sum(cost is None for cost in batch)
+        print(f"{len(topology['aps']):>8} {num_scenarios:>10} {cold_time:>10.3f} {batch_time:>10.3f} "
+              f"{cold_time / batch_time:>7.1f}x {infeasible:>11}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sizes", nargs="*", type=int, default=DEFAULT_SIZES)
+    parser.add_argument("--scenarios", type=int, default=50, help="scenarios per topology")
+    args = parser.parse_args()
+    run_benchmark(args.sizes, args.scenarios)
@@ -0,0 +1,215 @@
+"""
+blocklist_index.py
+
+Compiled lookup index that answers "is this address blocked, and by which feed or rule?".
+
+Feed prefixes (the output of malip.fetch_malicious_networks or fetch_malicious_ips) and the Deny
+rules of scripts/rules.py are flattened into sorted, disjoint address intervals. Each interval
+points at the most specific prefix that covers it. CIDR prefixes are either nested or disjoint,
+so one sweep with a stack builds the intervals. A lookup is a single binary search over the
+interval starts.
+
+IPv4 intervals live in flat uint32 arrays. With NumPy installed, classify() runs them through
+searchsorted() to vectorize bulk lookups over flow logs. Without NumPy, it falls back to bisect.
+IPv6 intervals are usually few and are always looked up with bisect over Python ints.
+
+save() writes the index to a single file, and load() memory-maps it. Worker processes that load
+the same file share the IPv4 arrays through the page cache instead of rebuilding them. The
+arrays use native byte order, so the file is meant for the host that wrote it.
+
+Usage:
+  index = BlocklistIndex.build(malicious_networks, rules=firewall_rules)
+  index.lookup("203.0.113.9")          # -> ("203.0.113.0/24", ("Spamhaus",)) or None
+  entry_ids = index.classify(uint32_addresses)
+  index.save("/tmp/blocklist.idx"); shared = BlocklistIndex.load("/tmp/blocklist.idx")
+"""
+import json
+import mmap
+import struct
+from array import array
+from bisect import bisect_right
+
+from scripts.cidr_aggregate import network_range
+from scripts.feed_parser import format_network, parse_network
+
+try:
+    import numpy as np
+except ImportError:  # optional: bulk lookups fall back to bisect
+    np = None
+
+INDEX_MAGIC = b"FWBLIDX1"
+INDEX_FORMAT_VERSION = 1
+_HEADER = struct.Struct("=8sIIII")   # magic, format version, IPv4 intervals, IPv6 intervals, metadata bytes
+
+
+def rule_networks(rules):
+    """{key: ["rule:<name>"]} for the destination addresses of Deny rules ("*" is every address)."""
+    networks = {}
+    for rule in rules:
+        if str(rule.get("action", "Deny")).capitalize() != "Deny":
+            continue
+        for address in rule.get("destination_addresses", []):
+            keys = [(4, 0, 0), (6, 0, 0)] if address == "*" else [parse_network(address)]
+            for key in keys:
+                if key is not None:
+                    networks.setdefault(key, []).append(f"rule:{rule['name']}")
+    return networks
+
+
+def _normalize(networks):
+    if isinstance(networks, dict):
+        return {key: list(sources) for key, sources in networks.items()}
+    normalized = {}
+    for entry in networks:
+        key = parse_network(entry) if isinstance(entry, str) else tuple(entry)
+        if key is not None:
+            normalized.setdefault(key, [])
+    return normalized
+
+
+def _flatten(entries, version):
+    """Disjoint (start, end, entry id) intervals where the deepest covering prefix wins."""
+    prefixes = sorted(
+        (network_range(key) + (key[2], entry_id) for entry_id, (key, _) in enumerate(entries) if key[0] == version),
+        key=lambda item: (item[0], item[2]),   # parents before their children
+    )
+    intervals = []
+    stack = []          # open prefixes as (last, entry id)
+    cursor = 0
+
+    def emit(start, end, entry_id):
+        if start <= end:
+            intervals.append((start, end, entry_id))
+
+    for first, last, _, entry_id in prefixes:
+        while stack and stack[-1][0] < first:
+            closed_last, closed_id = stack.pop()
+            emit(cursor, closed_last, closed_id)
+            cursor = closed_last + 1
+        if stack:
+            emit(cursor, first - 1, stack[-1][1])
+        stack.append((last, entry_id))
+        cursor = first
+    while stack:
+        closed_last, closed_id = stack.pop()
+        emit(cursor, closed_last, closed_id)
+        cursor = closed_last + 1
+    return intervals
+
+
+class BlocklistIndex:
+    """Sorted-interval index over blocked prefixes; see the module docstring."""
+
+    def __init__(self, entries, v4, v6, buffer=None):
+        self.entries = entries          # [(key, sources tuple)] addressed by entry id
+        self.v4_starts, self.v4_ends, self.v4_ids = v4
+        self.v6_starts, self.v6_ends, self.v6_ids = v6
+        self._buffer = buffer           # keeps a memory map alive while arrays point into it
+
+    @classmethod
+    def build(cls, networks, rules=()):
+        """Index {key: [sources]} (or address strings / keys) plus the Deny rules in `rules`."""
+        merged = _normalize(networks)
+        for key, sources in rule_networks(rules).items():
+            merged.setdefault(key, []).extend(sources)
+        entries = [(key, tuple(sorted(set(sources)))) for key, sources in sorted(merged.items())]
+
+        v4 = _flatten(entries, 4)
+        v6 = _flatten(entries, 6)
+        v4_arrays = (array("I", (i[0] for i in v4)), array("I", (i[1] for i in v4)), array("i", (i[2] for i in v4)))
+        v6_arrays = ([i[0] for i in v6], [i[1] for i in v6], [i[2] for i in v6])
+        if np is not None:
+            v4_arrays = tuple(np.frombuffer(a, dtype=np.uint32 if a.typecode == "I" else np.int32) for a in v4_arrays)
+        return cls(entries, v4_arrays, v6_arrays)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def num_intervals(self):
+        return len(self.v4_starts) + len(self.v6_starts)
+
+    def entry(self, entry_id):
+        """(prefix string, sources) for an id returned by classify()."""
+        key, sources = self.entries[entry_id]
+        return format_network(key), sources
+
+    def _find(self, version, address):
+        starts, ends, ids = (self.v4_starts, self.v4_ends, self.v4_ids) if version == 4 else \
+            (self.v6_starts, self.v6_ends, self.v6_ids)
+        i = bisect_right(starts, address) - 1
+        if i >= 0 and address <= ends[i]:
+            return int(ids[i])
+        return -1
+
+    def lookup(self, address):
+        """Most specific blocked prefix covering `address` as (prefix, sources), or None."""
+        key = parse_network(address) if isinstance(address, str) else (4, int(address), 32)
+        if key is None:
+            raise ValueError(f"Invalid address: {address!r}")
+        entry_id = self._find(key[0], key[1])
+        return None if entry_id < 0 else self.entry(entry_id)
+
+    def contains(self, address):
+        return self.lookup(address) is not None
+
+    def classify(self, addresses):
+        """
+        Entry id (or -1) for each IPv4 address in `addresses`.
+
+        Integers or a uint32 NumPy array are the fast path. Strings are parsed first, and IPv6
+        strings are looked up one at a time.
+        """
+        if np is not None and isinstance(addresses, np.ndarray):
+            return self._classify_v4(addresses.astype(np.uint32, copy=False))
+        addresses = list(addresses)
+        if addresses and isinstance(addresses[0], str):
+            keys = [parse_network(a) for a in addresses]
+            if any(k is None for k in keys):
+                raise ValueError("Invalid address in bulk lookup.")
+            if any(k[0] == 6 for k in keys):
+                return [self._find(k[0], k[1]) for k in keys]
+            addresses = [k[1] for k in keys]
+        if np is not None:
+            return self._classify_v4(np.asarray(addresses, dtype=np.uint32))
+        return [self._find(4, a) for a in addresses]
+
+    def _classify_v4(self, addresses):
+        if not len(self.v4_starts):
+            return np.full(len(addresses), -1, dtype=np.int32)
+        i = np.searchsorted(self.v4_starts, addresses, side="right").astype(np.int64) - 1
+        clipped = np.maximum(i, 0)
+        hit = (i >= 0) & (addresses <= self.v4_ends[clipped])
+        return np.where(hit, self.v4_ids[clipped], -1).astype(np.int32)
+
+    def save(self, path):
+        metadata = json.dumps({
+            "entries": [[list(key), list(sources)] for key, sources in self.entries],
+            "v6": [self.v6_starts, self.v6_ends, self.v6_ids],
+        }).encode("utf-8")
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(INDEX_MAGIC, INDEX_FORMAT_VERSION, len(self.v4_starts), len(self.v6_starts), len(metadata)))
+            for values, typecode in zip((self.v4_starts, self.v4_ends, self.v4_ids), "IIi"):
+                f.write(bytes(values) if np is not None and isinstance(values, np.ndarray) else array(typecode, values).tobytes())
+            f.write(metadata)
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map an index written by save(); the IPv4 arrays are not copied."""
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n4, n6, metadata_size = _HEADER.unpack_from(buffer, 0)
+        if magic != INDEX_MAGIC or version != INDEX_FORMAT_VERSION:
+            raise ValueError(f"{path} is not a blocklist index (format {INDEX_FORMAT_VERSION}).")
+        offset = _HEADER.size
+        v4 = []
+        for typecode in "IIi":
+            size = n4 * 4
+            if np is not None:
+                v4.append(np.frombuffer(buffer, dtype=np.uint32 if typecode == "I" else np.int32, count=n4, offset=offset))
+            else:
+                v4.append(memoryview(buffer)[offset:offset + size].cast(typecode))
+            offset += size
+        metadata = json.loads(buffer[offset:offset + metadata_size].decode("utf-8"))
+        entries = [(tuple(key), tuple(sources)) for key, sources in metadata["entries"]]
+        return cls(entries, tuple(v4), tuple(metadata["v6"]), buffer)
@@ -0,0 +1,462 @@
+"""
+blocklist_manager.py
+
+Scored, aging blocklist that keeps the best `budget` networks and remembers every other
+network between runs.
+
+Each tracked network has:
+  - its sightings, {feed: unix time that feed first listed it};
+  - the confidence_score of those feeds (see malip.network_confidence);
+  - first_seen and last_seen times;
+  - hits, the number of flow-log matches.
+
+Nothing in this module reads flow logs; hits must be supplied by the caller through record_hits().
+In the blocklist pipeline, malip.rank_blocklist() passes the counts from the FLOW_LOG_HITS_PATH
+file (see malip.load_flow_log_hits). Without that file every network keeps hits = 0.
+
+A network is "listed" while some feed still lists it. A listed network is scored without decay:
+
+  score = confidence / 100 * (1 + HIT_WEIGHT * ln(1 + hits))
+
+Once no feed lists it, the score halves every HALF_LIFE_SECONDS counted from last_seen. A hit
+refreshes last_seen. An unlisted network whose decayed score drops below MIN_SCORE is forgotten.
+
+Scores are kept as time-invariant log keys:
+  - ln(score) for listed networks;
+  - ln(score) + rate * last_seen for unlisted ones.
+Between any two networks, the order of the keys is the same at every point in time. Comparing
+the two kinds only needs rate * now added to the listed key. Therefore nothing is re-keyed as
+time passes, and a run costs O(changes * log n) rather than O(n).
+
+The networks sit in four groups: listed or unlisted, crossed with active (in the firewall) or
+candidate. Each group has lazily-deleted heaps (heapq). A superseded heap item is skipped when it
+surfaces, and a heap is rebuilt once it holds more stale items than live ones. tick() does the
+following:
+  - expires unlisted networks below MIN_SCORE;
+  - evicts the weakest candidates beyond max_entries;
+  - fills free slots with the strongest candidates;
+  - swaps a candidate in for the weakest active network only when its score is higher by more
+    than the HYSTERESIS margin, so near-ties do not flap between runs.
+
+The state is a JSON-lines file, followed by a journal of the records changed since then. save()
+appends only the changed records to the journal. It rewrites the whole file once the journal
+grows larger than the state.
+
+Usage:
+  manager = load_manager(STATE_PATH, budget=RULE_BUDGET)
+  manager.apply_delta(networks, delta, confidence_of, now)   # or manager.sync(networks, ...)
+  manager.record_hits({key: 3}, now)
+  report = manager.tick(now)              # {"promoted", "demoted", "expired", "evicted", ...}
+  manager.deploy_pending |= bool(report["promoted"] or report["demoted"])
+  manager.save(STATE_PATH)                # clear deploy_pending and save again once the firewall has it
+  blocked = manager.active_networks()     # {key: [feed names]}
+"""
+import heapq
+import itertools
+import json
+import math
+import os
+
+STATE_PATH = os.environ.get("BLOCKLIST_MANAGER_STATE")
+STATE_FORMAT_VERSION = 1
+HALF_LIFE_SECONDS = 3 * 24 * 3600
+HYSTERESIS = 0.1            # a candidate must beat the weakest active network by 10%
+MIN_SCORE = 0.05
+HIT_WEIGHT = 0.5
+MAX_ENTRIES = 1 << 21
+COMPACT_MIN_RECORDS = 10000
+RECORDS_PER_LINE = 10000
+
+_cache = {}     # path -> (stat signature of the state and journal, manager)
+
+
+class BlocklistEntry:
+    __slots__ = ("key", "sightings", "confidence", "hits", "first_seen", "last_seen", "listed", "active", "stamp")
+
+    def __init__(self, key, sightings, confidence, hits, first_seen, last_seen, listed, active):
+        self.key = key
+        self.sightings = sightings
+        self.confidence = confidence
+        self.hits = hits
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+        self.listed = listed
+        self.active = active
+        self.stamp = 0
+
+    @property
+    def sources(self):
+        return sorted(self.sightings)
+
+    def log_score(self):
+        """ln of the undecayed score."""
+        return math.log(max(self.confidence, 1e-6) / 100.0 * (1.0 + HIT_WEIGHT * math.log1p(self.hits)))
+
+    def record(self):
+        version, address, prefixlen = self.key
+        return [version, address, prefixlen, self.sightings, self.confidence, self.hits, self.first_seen,
+                self.last_seen, self.listed, self.active]
+
+    @classmethod
+    def from_record(cls, record):
+        version, address, prefixlen, sightings, confidence, hits, first_seen, last_seen, listed, active = record
+        return cls((version, address, prefixlen), sightings, confidence, hits, first_seen, last_seen, listed, active)
+
+
+class _LazyHeap:
+    """heapq of (sign * key, stamp, network) whose superseded items are dropped as they surface."""
+
+    def __init__(self, sign):
+        self.sign = sign
+        self.items = []
+
+    def push(self, key, stamp, network):
+        heapq.heappush(self.items, (self.sign * key, stamp, network))
+
+    def top(self, entries):
+        items = self.items
+        while items:
+            _, stamp, network = items[0]
+            entry = entries.get(network)
+            if entry is not None and entry.stamp == stamp:
+                return entry
+            heapq.heappop(items)
+        return None
+
+    def rebuild(self, keyed):
+        self.items = [(self.sign * key, entry.stamp, entry.key) for key, entry in keyed]
+        heapq.heapify(self.items)
+
+
+class _Group:
+    def __init__(self, listed, active):
+        self.listed = listed
+        self.active = active
+        self.size = 0
+        self.min = _LazyHeap(1)
+        self.max = None if active else _LazyHeap(-1)     # only candidates are promoted by best score
+
+    def heaps(self):
+        return (self.min,) if self.max is None else (self.min, self.max)
+
+
+class BlocklistManager:
+    def __init__(self, budget, half_life=HALF_LIFE_SECONDS, hysteresis=HYSTERESIS, min_score=MIN_SCORE,
+                 max_entries=MAX_ENTRIES):
+        if budget < 0 or max_entries < budget:
+            raise ValueError("budget must be between 0 and max_entries.")
+        self.budget = budget
+        self.rate = math.log(2) / half_life
+        self.margin = math.log1p(hysteresis)
+        self.floor = math.log(min_score)
+        self.max_entries = max_entries
+        self.entries = {}
+        self.now = 0.0
+        self.source_checksum = None     # checksum of the blocklist snapshot last applied
+        self.deploy_pending = False     # the active set changed and the firewall has not confirmed it yet
+        self._groups = {(listed, active): _Group(listed, active) for listed in (True, False) for active in (True, False)}
+        self._stamps = itertools.count(1)
+        self._dirty = set()
+        self._deferred = False
+        self._journal_records = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def active_count(self):
+        return self._groups[True, True].size + self._groups[False, True].size
+
+    def _heap_key(self, entry):
+        key = entry.log_score()
+        return key if entry.listed else key + self.rate * entry.last_seen
+
+    def _effective(self, entry, now):
+        """ln(score at `now`) + rate * now, comparable across every group."""
+        key = self._heap_key(entry)
+        return key + self.rate * now if entry.listed else key
+
+    def score(self, network, now=None):
+        """The decayed score of a tracked network at `now` (default: the last tick)."""
+        entry = self.entries[network]
+        now = self.now if now is None else now
+        return math.exp(self._effective(entry, now) - self.rate * now)
+
+    def _place(self, entry):
+        entry.stamp = next(self._stamps)
+        self._dirty.add(entry.key)
+        if self._deferred:
+            return
+        key = self._heap_key(entry)
+        group = self._groups[entry.listed, entry.active]
+        for heap in group.heaps():
+            heap.push(key, entry.stamp, entry.key)
+            if len(heap.items) > 2 * group.size + COMPACT_MIN_RECORDS:
+                self._rebuild_group(group)
+
+    def _move(self, entry, listed=None, active=None):
+        self._groups[entry.listed, entry.active].size -= 1
+        entry.listed = entry.listed if listed is None else listed
+        entry.active = entry.active if active is None else active
+        self._groups[entry.listed, entry.active].size += 1
+        self._place(entry)
+
+    def _drop(self, entry):
+        self._groups[entry.listed, entry.active].size -= 1
+        del self.entries[entry.key]
+        self._dirty.add(entry.key)
+
+    def _rebuild_group(self, group):
+        keyed = [(self._heap_key(entry), entry) for entry in self.entries.values()
+                 if entry.listed == group.listed and entry.active == group.active]
+        for heap in group.heaps():
+            heap.rebuild(keyed)
+
+    def _rebuild(self):
+        """Recount every group and heapify its heaps in one pass over the entries."""
+        keyed = {group: [] for group in self._groups}
+        for entry in self.entries.values():
+            keyed[entry.listed, entry.active].append((self._heap_key(entry), entry))
+        for name, group in self._groups.items():
+            group.size = len(keyed[name])
+            for heap in group.heaps():
+                heap.rebuild(keyed[name])
+
+    def _weakest(self, now, active):
+        best = None
+        for listed in (True, False):
+            entry = self._groups[listed, active].min.top(self.entries)
+            if entry is not None and (best is None or self._effective(entry, now) < self._effective(best, now)):
+                best = entry
+        return best
+
+    def _strongest_candidate(self, now):
+        best = None
+        for listed in (True, False):
+            entry = self._groups[listed, False].max.top(self.entries)
+            if entry is not None and (best is None or self._effective(entry, now) > self._effective(best, now)):
+                best = entry
+        return best
+
+    def observe(self, network, sources, confidence, now):
+        """Record that `sources` list `network` at `now` with the given confidence_score."""
+        entry = self.entries.get(network)
+        if entry is None:
+            entry = self.entries[network] = BlocklistEntry(network, {source: now for source in sources}, confidence,
+                                                           0, now, now, True, False)
+            self._groups[True, False].size += 1
+            self._place(entry)
+            return
+        entry.sightings = {source: entry.sightings.get(source, now) for source in sources}
+        entry.confidence = confidence
+        entry.last_seen = now
+        if entry.listed:
+            self._place(entry)
+        else:
+            self._move(entry, listed=True)
+
+    def unlist(self, network, now):
+        """No feed lists `network` any more; its score starts to decay from `now`."""
+        entry = self.entries.get(network)
+        if entry is not None and entry.listed:
+            entry.sightings = {}
+            entry.last_seen = now
+            self._move(entry, listed=False)
+
+    def sync(self, networks, confidence_of, now):
+        """Make `networks` ({key: [feed names]}) the complete listed set. O(n)."""
+        entries = self.entries
+        observed = [
+            network for network, sources in networks.items()
+            if network not in entries or not entries[network].listed or entries[network].sightings.keys() != set(sources)
+        ]
+        unlisted = [key for key, entry in entries.items() if entry.listed and key not in networks]
+        # A large batch is cheaper to heapify once than to push one entry at a time.
+        self._deferred = len(observed) + len(unlisted) > len(entries) // 4
+        confidences = {}    # feeds often list networks under the same few source combinations
+        try:
+            for network in observed:
+                sources = networks[network]
+                names = tuple(sources)
+                if names not in confidences:
+                    confidences[names] = confidence_of(sources)
+                self.observe(network, sources, confidences[names], now)
+            for network in unlisted:
+                self.unlist(network, now)
+        finally:
+            if self._deferred:
+                self._deferred = False
+                self._rebuild()
+
+    def apply_delta(self, networks, delta, confidence_of, now):
+        """Apply a SnapshotDiff of `networks` against the previous run. O(delta * log n)."""
+        for network in itertools.chain(delta.added, delta.changed):
+            self.observe(network, networks[network], confidence_of(networks[network]), now)
+        for network in delta.removed:
+            self.unlist(network, now)
+
+    def record_hits(self, hits, now):
+        """Add flow-log hit counts ({key: count}); returns how many tracked networks were hit."""
+        matched = 0
+        for network, count in hits.items():
+            entry = self.entries.get(network)
+            if entry is None or count <= 0:
+                continue
+            entry.hits += count
+            entry.last_seen = now
+            self._place(entry)
+            matched += 1
+        return matched
+
+    def tick(self, now):
+        """Expire, evict and rebalance the active set at `now`. Returns a report dict."""
+        self.now = now
+        floor = self.floor + self.rate * now
+        promoted, demoted = [], []
+        expired = evicted = 0
+
+        # Unlisted networks that have decayed below MIN_SCORE are forgotten, active or not.
+        for active in (True, False):
+            heap = self._groups[False, active].min
+            entry = heap.top(self.entries)
+            while entry is not None and self._heap_key(entry) < floor:
+                if entry.active:
+                    demoted.append(entry.key)
+                self._drop(entry)
+                expired += 1
+                entry = heap.top(self.entries)
+
+        while len(self.entries) > self.max_entries:
+            entry = self._weakest(now, active=False)
+            if entry is None:
+                break
+            self._drop(entry)
+            evicted += 1
+
+        while self.active_count > self.budget:
+            entry = self._weakest(now, active=True)
+            self._move(entry, active=False)
+            demoted.append(entry.key)
+
+        while self.active_count < self.budget:
+            entry = self._strongest_candidate(now)
+            if entry is None or self._effective(entry, now) < floor:
+                break
+            self._move(entry, active=True)
+            promoted.append(entry.key)
+
+        while True:
+            candidate = self._strongest_candidate(now)
+            weakest = self._weakest(now, active=True)
+            if candidate is None or weakest is None:
+                break
+            if self._effective(candidate, now) <= self._effective(weakest, now) + self.margin:
+                break
+            self._move(weakest, active=False)
+            self._move(candidate, active=True)
+            demoted.append(weakest.key)
+            promoted.append(candidate.key)
+
+        # A network demoted and promoted again in the same tick did not leave the firewall.
+        both = set(promoted) & set(demoted)
+        return {
+            "promoted": [key for key in promoted if key not in both],
+            "demoted": [key for key in demoted if key not in both],
+            "expired": expired,
+            "evicted": evicted,
+            "active": self.active_count,
+            "tracked": len(self.entries),
+        }
+
+    def active_networks(self):
+        """{key: [feed names]} of the networks that belong in the firewall."""
+        return {key: entry.sources for key, entry in self.entries.items() if entry.active}
+
+    def _meta(self):
+        return ["meta", {"format": STATE_FORMAT_VERSION, "budget": self.budget, "now": self.now,
+                         "source_checksum": self.source_checksum, "deploy_pending": self.deploy_pending}]
+
+    def _write_lines(self, f, records, dropped=()):
+        for offset in range(0, len(records), RECORDS_PER_LINE):
+            f.write(json.dumps(["set", records[offset:offset + RECORDS_PER_LINE]]) + "\n")
+        if dropped:
+            f.write(json.dumps(["drop", [list(key) for key in dropped]]) + "\n")
+        f.write(json.dumps(self._meta()) + "\n")
+
+    def save(self, path):
+        """Append the records changed since the last save, or rewrite the file once the journal is large."""
+        journal_path = path + ".journal"
+        if (self._journal_records + len(self._dirty) > max(COMPACT_MIN_RECORDS, len(self.entries))
+                or not os.path.exists(path)):
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                self._write_lines(f, [entry.record() for entry in self.entries.values()])
+            os.replace(tmp_path, path)
+            if os.path.exists(journal_path):
+                os.remove(journal_path)
+            self._journal_records = 0
+        else:
+            records = [self.entries[key].record() for key in self._dirty if key in self.entries]
+            dropped = [key for key in self._dirty if key not in self.entries]
+            with open(journal_path, "a", encoding="utf-8") as f:
+                self._write_lines(f, records, dropped)
+            self._journal_records += len(self._dirty)
+        self._dirty.clear()
+        _cache[os.path.abspath(path)] = (_signature(path), self)
+
+    @classmethod
+    def load(cls, path, budget, **kwargs):
+        """The manager saved at `path` (with its journal replayed), or an empty one."""
+        manager = cls(budget, **kwargs)
+        entries = manager.entries
+        for file_path in (path, path + ".journal"):
+            try:
+                f = open(file_path, encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            with f:
+                for line in f:
+                    kind, value = json.loads(line)
+                    if kind == "meta":
+                        if value.get("format") != STATE_FORMAT_VERSION:
+                            raise ValueError(f"{file_path}: unsupported blocklist state format {value.get('format')!r}")
+                        manager.now = value["now"]
+                        manager.source_checksum = value["source_checksum"]
+                        manager.deploy_pending = value.get("deploy_pending", False)
+                        continue
+                    if file_path != path:
+                        manager._journal_records += len(value)
+                    if kind == "set":
+                        for record in value:
+                            entry = BlocklistEntry.from_record(record)
+                            entries[entry.key] = entry
+                    else:
+                        for key in value:
+                            entries.pop(tuple(key), None)
+        manager._rebuild()
+        return manager
+
+def _signature(path):
+    signature = []
+    for file_path in (path, path + ".journal"):
+        try:
+            st = os.stat(file_path)
+            signature.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def load_manager(path=STATE_PATH, budget=0, **kwargs):
+    """
+    BlocklistManager.load(), reusing the manager this process last saved to `path` while the
+    files are unchanged, so a warm worker does not re-read a large state every run.
+    """
+    cached = _cache.get(os.path.abspath(path))
+    if cached is not None and cached[0] == _signature(path):
+        manager = cached[1]
+        manager.budget = budget
+        return manager
+    manager = BlocklistManager.load(path, budget, **kwargs)
+    _cache[os.path.abspath(path)] = (_signature(path), manager)
+    return manager
@@ -0,0 +1,213 @@
+"""
+blocklist_snapshot.py
+
+Versioned binary snapshot of a run's normalized blocklist, with a linear-merge diff.
+
+Layout (big-endian):
+
+  header   8s magic "FWBLSNP1" | H format version | H source count | I record count
+           | d created (unix time) | I source table bytes | I crc32 of source table + records
+  sources  JSON list of feed / rule names; a record's source mask indexes into it
+  records  fixed 26-byte records sorted by network key:
+           B version | 16s address | B prefix length | I source mask | f score
+
+The first 18 bytes of a record are its network key, encoded so that byte order equals
+(version, address, prefixlen) order. load() memory-maps the file, and nothing is decoded until
+a record is read. diff() merges two snapshots by comparing those key bytes directly, and it
+skips byte-identical runs of records a block at a time. When the two checksums and counts
+match, it returns without reading any records.
+
+Usage:
+  snapshot = BlocklistSnapshot.from_networks(malicious_networks, scores)
+  previous = load_previous(SNAPSHOT_PATH)
+  delta = diff(previous, snapshot)      # delta.added / delta.removed / delta.changed
+  snapshot.write(SNAPSHOT_PATH)
+"""
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+
+SNAPSHOT_MAGIC = b"FWBLSNP1"
+SNAPSHOT_FORMAT_VERSION = 1
+MAX_SOURCES = 32
+_HEADER = struct.Struct(">8sHHIdII")
+_META = struct.Struct(">If")
+_RECORD = struct.Struct(">B16sBIf")
+KEY_SIZE = 18
+RECORD_SIZE = _RECORD.size
+MERGE_BLOCK = 64    # records compared at once while two snapshots agree
+
+
+def decode_key(data):
+    return data[0], int.from_bytes(data[1:17], "big"), data[17]
+
+
+class SnapshotDiff:
+    """
+    Network keys added, removed and re-scored (sources or score changed) between two snapshots.
+
+    `full` is True when there was no previous snapshot: `added` is then the whole blocklist and
+    removals are unknown, so sinks must resync instead of applying the delta.
+    """
+
+    def __init__(self, added=None, removed=None, changed=None, full=False):
+        self.added = added or []
+        self.removed = removed or []
+        self.changed = changed or []
+        self.full = full
+
+    @property
+    def has_changes(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def summary(self):
+        return {"added": len(self.added), "removed": len(self.removed), "changed": len(self.changed)}
+
+    def __repr__(self):
+        return f"SnapshotDiff({self.summary()})"
+
+
+class BlocklistSnapshot:
+    """Read-only view over snapshot bytes, either built in memory or memory-mapped from a file."""
+
+    def __init__(self, data, created, sources, count, checksum):
+        self._data = data
+        self.created = created
+        self.sources = sources
+        self.count = count
+        self.checksum = checksum
+        self._offset = _HEADER.size + len(json.dumps(sources).encode("utf-8"))
+
+    @classmethod
+    def from_networks(cls, networks, scores=None, created=None):
+        """Snapshot {key: [sources]}; `scores` maps keys to a float score (default 0)."""
+        sources = sorted({source for names in networks.values() for source in names})
+        if len(sources) > MAX_SOURCES:
+            raise ValueError(f"Snapshots support at most {MAX_SOURCES} sources, got {len(sources)}.")
+        bit = {source: 1 << i for i, source in enumerate(sources)}
+        masks = {}
+        scores = scores or {}
+        pack = _RECORD.pack
+        records = []
+        for key in sorted(networks):
+            names = tuple(networks[key])
+            mask = masks.get(names)
+            if mask is None:
+                mask = masks[names] = sum(bit[s] for s in set(names))
+            records.append(pack(key[0], key[1].to_bytes(16, "big"), key[2], mask, scores.get(key, 0.0)))
+        records = b"".join(records)
+        source_table = json.dumps(sources).encode("utf-8")
+        checksum = zlib.crc32(records, zlib.crc32(source_table))
+        created = time.time() if created is None else created
+        header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, len(sources), len(networks),
+                              created, len(source_table), checksum)
+        return cls(header + source_table + records, created, sources, len(networks), checksum)
+
+    @classmethod
+    def load(cls, path, verify=True):
+        """Memory-map a snapshot. verify=True checks the crc32 before anything is trusted."""
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(data) < _HEADER.size:
+            raise ValueError(f"{path} is too short to be a blocklist snapshot.")
+        magic, version, _, count, created, table_size, checksum = _HEADER.unpack_from(data, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"{path} is not a blocklist snapshot (format {SNAPSHOT_FORMAT_VERSION}).")
+        if len(data) != _HEADER.size + table_size + count * RECORD_SIZE:
+            raise ValueError(f"{path} is truncated.")
+        if verify and zlib.crc32(memoryview(data)[_HEADER.size:]) != checksum:
+            raise ValueError(f"{path} failed its checksum.")
+        sources = json.loads(data[_HEADER.size:_HEADER.size + table_size].decode("utf-8"))
+        return cls(data, created, sources, count, checksum)
+
+    def write(self, path):
+        """Atomically replace `path` with this snapshot."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self._data)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return self.count
+
+    def key_bytes(self, i):
+        offset = self._offset + i * RECORD_SIZE
+        return self._data[offset:offset + KEY_SIZE]
+
+    def entry(self, i):
+        """(key, sources tuple, score) of record i."""
+        offset = self._offset + i * RECORD_SIZE
+        mask, score = _META.unpack_from(self._data, offset + KEY_SIZE)
+        sources = tuple(source for bit, source in enumerate(self.sources) if mask >> bit & 1)
+        return decode_key(self._data[offset:offset + KEY_SIZE]), sources, score
+
+    def keys(self):
+        return (decode_key(self.key_bytes(i)) for i in range(self.count))
+
+    def to_networks(self):
+        """{key: [sources]} as used by malip."""
+        return {key: list(sources) for key, sources, _ in map(self.entry, range(self.count))}
+
+    def _records(self, i, n):
+        offset = self._offset + i * RECORD_SIZE
+        return self._data[offset:offset + n * RECORD_SIZE]
+
+    def _metadata(self, i):
+        offset = self._offset + i * RECORD_SIZE + KEY_SIZE
+        return self._data[offset:offset + _META.size]
+
+
+def load_previous(path, verify=True):
+    """The snapshot at `path`, or None if it is missing or unreadable (the next run starts fresh)."""
+    try:
+        return BlocklistSnapshot.load(path, verify)
+    except (OSError, ValueError):
+        return None
+
+
+def diff(old, new):
+    """Linear merge of two snapshots (old may be None). Returns a SnapshotDiff of network keys."""
+    if old is None:
+        return SnapshotDiff(added=list(new.keys()), full=True)
+    if old.checksum == new.checksum and old.count == new.count and old.sources == new.sources:
+        return SnapshotDiff()
+
+    same_sources = old.sources == new.sources
+    added, removed, changed = [], [], []
+    i = j = 0
+    step = MERGE_BLOCK if same_sources else 1
+    while i < old.count and j < new.count:
+        # Skip byte-identical runs a block at a time, halving the block around a difference.
+        n = min(step, old.count - i, new.count - j)
+        if n > 1:
+            if old._records(i, n) == new._records(j, n):
+                i += n
+                j += n
+                step = min(step * 2, MERGE_BLOCK * 16)
+            else:
+                step = n // 2
+            continue
+        if same_sources:
+            step = MERGE_BLOCK
+        a, b = old.key_bytes(i), new.key_bytes(j)
+        if a == b:
+            if same_sources:
+                differs = old._metadata(i) != new._metadata(j)
+            else:
+                differs = old.entry(i)[1:] != new.entry(j)[1:]
+            if differs:
+                changed.append(decode_key(b))
+            i += 1
+            j += 1
+        elif a < b:
+            removed.append(decode_key(a))
+            i += 1
+        else:
+            added.append(decode_key(b))
+            j += 1
+    removed.extend(decode_key(old.key_bytes(k)) for k in range(i, old.count))
+    added.extend(decode_key(new.key_bytes(k)) for k in range(j, new.count))
+    return SnapshotDiff(added, removed, changed)
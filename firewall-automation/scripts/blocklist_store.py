@@ -0,0 +1,187 @@
+"""
+blocklist_store.py
+
+MongoDB store for the malicious-network blocklist.
+
+There is one document per network, keyed by its normalized CIDR string:
+
+  {"network": "203.0.113.0/24", "sources": ["FireHOL", "Spamhaus"], "confidence": 94.0,
+   "first_seen": <datetime>, "last_seen": <datetime>}
+
+A unique index on "network" rules out duplicates. A TTL index on "last_seen" expires networks
+that no feed has reported for TTL_SECONDS. Documents from the old per-IP layout
+({"ip", "blocked_at"}) have no "network" and no "last_seen", so neither index would ever cover
+them: ensure_indexes() deletes them once, and the unique index only applies to documents that
+have a "network".
+
+sync() reads the stored state once and writes only the delta, using unordered bulk_write upserts
+in bounded batches. The delta is:
+  - new networks (first_seen is set once, with $setOnInsert);
+  - networks whose sources or confidence changed;
+  - networks whose last_seen is older than REFRESH_SECONDS, refreshed so the TTL index keeps them.
+An unchanged feed therefore costs no writes except the periodic last_seen refresh.
+
+When the caller already knows the delta (see blocklist_snapshot), apply_delta() skips reading
+the stored state: it upserts and deletes exactly the given networks, and refreshes last_seen on
+the stale networks of the current blocklist with batched server-side update_many calls. Networks
+that are no longer listed are never refreshed, so the TTL index still expires them.
+
+Clients are cached per URI, so every store in the process shares one connection pool. Writes are
+built with `write_models`, pymongo's (UpdateOne, DeleteOne) unless set_client() registered other
+classes with the same constructors for that URI (the load harness does, for its fake collection).
+
+Usage:
+  store = BlocklistStore.from_uri()
+  store.sync({"203.0.113.0/24": {"sources": ["Spamhaus"], "confidence": 80.0}})
+"""
+import datetime
+import logging
+import os
+
+from pymongo import ASCENDING, DeleteOne, MongoClient, UpdateOne
+
+MONGO_URI = os.environ.get("FIREWALL_MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DB = "firewallDB"
+MONGO_COLLECTION = "blockedIPs"
+BATCH_SIZE = 1000
+TTL_SECONDS = 7 * 24 * 3600
+REFRESH_SECONDS = 24 * 3600
+LEGACY_FILTER = {"network": {"$exists": False}}     # {"ip", "blocked_at"} documents of the old layout
+
+WRITE_MODELS = (UpdateOne, DeleteOne)
+
+_clients = {}
+_write_models = {}
+
+
+def get_client(uri=MONGO_URI, **kwargs):
+    """Process-wide MongoClient per URI; MongoClient is thread-safe and pools its connections."""
+    client = _clients.get(uri)
+    if client is None:
+        client = _clients[uri] = MongoClient(uri, **kwargs)
+    return client
+
+
+def set_client(uri, client, write_models=None):
+    """Use `client` (and its `write_models`, if given) for `uri` from now on; None drops the cached client."""
+    _write_models.pop(uri, None)
+    if client is None:
+        _clients.pop(uri, None)
+    else:
+        _clients[uri] = client
+        if write_models is not None:
+            _write_models[uri] = write_models
+
+
+def plan_sync(entries, existing, now, refresh_seconds=REFRESH_SECONDS):
+    """
+    Work out the writes needed to bring the store up to `entries`.
+
+    `entries` maps network -> {"sources", "confidence"}; `existing` maps network -> stored document
+    (at least "sources", "confidence", "last_seen"). Returns (updates, counts), where updates is a
+    list of (network, update document) pairs.
+    """
+    refresh_before = now - datetime.timedelta(seconds=refresh_seconds)
+    updates = []
+    counts = {"inserted": 0, "updated": 0, "refreshed": 0, "unchanged": 0}
+    for network, entry in entries.items():
+        sources = sorted(entry.get("sources", []))
+        confidence = entry.get("confidence")
+        stored = existing.get(network)
+        if stored is None:
+            counts["inserted"] += 1
+        elif stored.get("sources") != sources or stored.get("confidence") != confidence:
+            counts["updated"] += 1
+        elif stored.get("last_seen") is None or stored["last_seen"] < refresh_before:
+            counts["refreshed"] += 1
+            updates.append((network, {"$set": {"last_seen": now}}))
+            continue
+        else:
+            counts["unchanged"] += 1
+            continue
+        updates.append((network, {
+            "$set": {"sources": sources, "confidence": confidence, "last_seen": now},
+            "$setOnInsert": {"first_seen": now},
+        }))
+    return updates, counts
+
+
+class BlocklistStore:
+    """Indexed, delta-writing wrapper around one MongoDB collection."""
+
+    def __init__(self, collection, batch_size=BATCH_SIZE, ttl_seconds=TTL_SECONDS, refresh_seconds=REFRESH_SECONDS,
+                 write_models=WRITE_MODELS):
+        self.collection = collection
+        self.update_one, self.delete_one = write_models
+        self.batch_size = batch_size
+        self.ttl_seconds = ttl_seconds
+        self.refresh_seconds = refresh_seconds
+        self._indexed = False
+
+    @classmethod
+    def from_uri(cls, uri=MONGO_URI, db=MONGO_DB, collection=MONGO_COLLECTION, **kwargs):
+        kwargs.setdefault("write_models", _write_models.get(uri, WRITE_MODELS))
+        return cls(get_client(uri)[db][collection], **kwargs)
+
+    def ensure_indexes(self):
+        if self._indexed:
+            return
+        legacy = self.collection.delete_many(LEGACY_FILTER).deleted_count
+        if legacy:
+            logging.info(f"Blocklist store: deleted {legacy} legacy per-IP documents.")
+        self.collection.create_index([("network", ASCENDING)], unique=True, name="network_unique",
+                                     partialFilterExpression={"network": {"$exists": True}})
+        self.collection.create_index([("last_seen", ASCENDING)], expireAfterSeconds=self.ttl_seconds,
+                                     name="last_seen_ttl")
+        self._indexed = True
+
+    def load_state(self):
+        """{network: stored document} for the whole blocklist, without _id or first_seen."""
+        projection = {"_id": 0, "network": 1, "sources": 1, "confidence": 1, "last_seen": 1}
+        return {doc["network"]: doc for doc in self.collection.find({"network": {"$exists": True}}, projection)}
+
+    def _upsert(self, network, entry, now):
+        return self.update_one({"network": network}, {
+            "$set": {"sources": sorted(entry.get("sources", [])), "confidence": entry.get("confidence"), "last_seen": now},
+            "$setOnInsert": {"first_seen": now},
+        }, upsert=True)
+
+    def _bulk_write(self, operations):
+        batches = 0
+        for offset in range(0, len(operations), self.batch_size):
+            self.collection.bulk_write(operations[offset:offset + self.batch_size], ordered=False)
+            batches += 1
+        return batches
+
+    def sync(self, entries, now=None):
+        """Upsert the delta between `entries` and the stored blocklist. Returns the write counts."""
+        self.ensure_indexes()
+        now = now or datetime.datetime.utcnow()
+        updates, counts = plan_sync(entries, self.load_state(), now, self.refresh_seconds)
+        counts["batches"] = self._bulk_write(
+            [self.update_one({"network": network}, update, upsert=True) for network, update in updates]
+        )
+        logging.info(f"Blocklist store sync: {counts}")
+        return counts
+
+    def apply_delta(self, added, changed, removed, current, now=None):
+        """
+        Write a known delta: `added` / `changed` map network -> entry, `removed` lists networks.
+
+        `current` lists every network of the blocklist the delta leads to; only those are refreshed.
+        """
+        self.ensure_indexes()
+        now = now or datetime.datetime.utcnow()
+        operations = [self._upsert(network, entry, now) for network, entry in {**added, **changed}.items()]
+        operations.extend(self.delete_one({"network": network}) for network in removed)
+        counts = {"inserted": len(added), "updated": len(changed), "deleted": len(removed), "refreshed": 0}
+        counts["batches"] = self._bulk_write(operations)
+        refresh_before = now - datetime.timedelta(seconds=self.refresh_seconds)
+        current = [network for network in current if network not in added and network not in changed]
+        for offset in range(0, len(current), self.batch_size):
+            counts["refreshed"] += self.collection.update_many(
+                {"network": {"$in": current[offset:offset + self.batch_size]}, "last_seen": {"$lt": refresh_before}},
+                {"$set": {"last_seen": now}},
+            ).modified_count
+        logging.info(f"Blocklist store delta: {counts}")
+        return counts
@@ -0,0 +1,120 @@
+"""
+cidr_aggregate.py
+
+Collapses a blocklist of network keys (see feed_parser) into the fewest CIDR prefixes that cover
+exactly the same addresses, and picks the most valuable prefixes when a rule budget still
+forces truncation.
+
+Aggregation is a sorted-interval merge: each network becomes an [first, last] address interval,
+overlapping and adjacent intervals are merged, and every merged interval is cut back into the
+largest aligned CIDR blocks. No address outside the original list is ever added.
+
+Usage:
+  blocks = aggregate_networks({key: confidence, ...})
+  selected, report = select_within_budget(blocks, budget=100)
+"""
+
+ADDRESS_BITS = {4: 32, 6: 128}
+
+
+def network_range(key):
+    """First and last address of a (version, address, prefixlen) key."""
+    version, address, prefixlen = key
+    return address, address + (1 << (ADDRESS_BITS[version] - prefixlen)) - 1
+
+
+def network_size(key):
+    version, _, prefixlen = key
+    return 1 << (ADDRESS_BITS[version] - prefixlen)
+
+
+def range_to_networks(version, first, last):
+    """Split the inclusive address range [first, last] into the minimal list of CIDR keys."""
+    bits = ADDRESS_BITS[version]
+    networks = []
+    while first <= last:
+        # Largest block aligned at `first` ...
+        size = first & -first if first else 1 << bits
+        # ... that does not run past `last`.
+        while size > last - first + 1:
+            size >>= 1
+        networks.append((version, first, bits - size.bit_length() + 1))
+        first += size
+    return networks
+
+
+def merge_ranges(networks):
+    """
+    Merge overlapping and adjacent networks.
+
+    `networks` maps keys to a confidence score. Returns (version, first, last, confidence) tuples
+    sorted by address, where confidence is the mean confidence of the merged addresses: each entry
+    is weighted by the addresses it adds to the interval, so one confident /32 next to a weak /16
+    does not lend the whole block its confidence.
+    """
+    merged = []     # (version, first, last, sum of confidence * addresses)
+    for key in sorted(networks):
+        version = key[0]
+        first, last = network_range(key)
+        confidence = networks[key]
+        if merged and merged[-1][0] == version and first <= merged[-1][2] + 1:
+            _, m_first, m_last, weighted = merged[-1]
+            if last > m_last:
+                weighted += confidence * (last - m_last)
+            merged[-1] = (version, m_first, max(m_last, last), weighted)
+        else:
+            merged.append((version, first, last, confidence * (last - first + 1)))
+    return [(version, first, last, weighted / (last - first + 1)) for version, first, last, weighted in merged]
+
+
+def aggregate_networks(networks):
+    """
+    Return the minimal covering set of CIDR blocks as a list of (key, confidence) pairs.
+
+    `networks` is either {key: confidence} or an iterable of keys (confidence 1.0).
+    """
+    if not isinstance(networks, dict):
+        networks = dict.fromkeys(networks, 1.0)
+    blocks = []
+    for version, first, last, confidence in merge_ranges(networks):
+        blocks.extend((key, confidence) for key in range_to_networks(version, first, last))
+    return blocks
+
+
+def block_score(key, confidence):
+    """Value of blocking a prefix: confidence times the address space it covers."""
+    return confidence * network_size(key)
+
+
+def select_within_budget(blocks, budget, raw_count=None):
+    """
+    Keep the `budget` highest-scoring blocks.
+
+    Returns (selected, report); selected keeps address order, and report compares the coverage
+    retained with the full aggregated list.
+    """
+    if budget is None or len(blocks) <= budget:
+        selected = list(blocks)
+    else:
+        ranked = sorted(blocks, key=lambda block: block_score(*block), reverse=True)
+        selected = sorted(ranked[:budget])
+    return selected, coverage_report(blocks, selected, raw_count)
+
+
+def coverage_report(blocks, selected, raw_count=None):
+    """Summarize how much of the aggregated blocklist survives in `selected`."""
+    total_addresses = sum(network_size(key) for key, _ in blocks)
+    kept_addresses = sum(network_size(key) for key, _ in selected)
+    total_score = sum(block_score(key, confidence) for key, confidence in blocks)
+    kept_score = sum(block_score(key, confidence) for key, confidence in selected)
+    report = {
+        "aggregated_prefixes": len(blocks),
+        "selected_prefixes": len(selected),
+        "total_addresses": total_addresses,
+        "retained_addresses": kept_addresses,
+        "address_coverage": kept_addresses / total_addresses if total_addresses else 1.0,
+        "score_coverage": kept_score / total_score if total_score else 1.0,
+    }
+    if raw_count is not None:
+        report["raw_entries"] = raw_count
+    return report
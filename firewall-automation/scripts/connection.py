@@ -1,15 +1,14 @@
-import pymongo
+from scripts.blocklist_store import BlocklistStore
 
-# Connect to MongoDB
-client = pymongo.MongoClient("mongodb://localhost:27017/")
-db = client["firewall_db"]
-collection = db["malicious_ips"]
+# Connect to MongoDB (shared, pooled client; same schema as malip.py, but the sample's own
+# collection, so these addresses never land in the production blocklist)
+store = BlocklistStore.from_uri("mongodb://localhost:27017/", db="firewall_db", collection="malicious_ips")
 
 # Sample IPs
-malicious_ips = [{"ip_address": "192.168.1.100", "source": "AbuseIPDB", "confidence_score": 90},
-                 {"ip_address": "203.0.113.25", "source": "Spamhaus", "confidence_score": 80}]
+malicious_ips = {"192.168.1.100": {"sources": ["AbuseIPDB"], "confidence": 90},
+                 "203.0.113.25": {"sources": ["Spamhaus"], "confidence": 80}}
 
-# Insert IPs into MongoDB
-collection.insert_many(malicious_ips)
+# Upsert IPs into MongoDB; re-running is idempotent
+counts = store.sync(malicious_ips)
 
-print("Malicious IPs stored in MongoDB")
+print("Malicious IPs stored in MongoDB:", counts)
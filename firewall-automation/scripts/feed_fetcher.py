@@ -0,0 +1,212 @@
+"""
+feed_fetcher.py
+
+Concurrent, cache-aware downloader for threat intelligence feeds.
+
+All feeds are fetched in parallel over one pooled requests.Session. Each response body is parsed
+as it streams in and only its parsed entries are cached on disk, together with its ETag /
+Last-Modified validators, CACHE_FORMAT_VERSION and the parser that produced them. The next run
+sends If-None-Match / If-Modified-Since, and a 304 answer is served from the cached entries. Entries from another cache format or parser are never reused. If a feed
+fails to download or to parse, the last good entries are used and the result is marked "stale"
+(or "error" without a cached copy).
+
+The body is parsed while it streams in (see feed_parser), so entries are normalized
+(version, address, prefixlen) network keys and a feed is never held in memory as one string.
+A feed is a dict with a "url" and either a "format" from feed_parser.FEED_FORMATS or its own
+"parser" callable taking (lines, stats) and yielding network keys:
+
+  THREAT_FEEDS = {
+      "Spamhaus": {"url": "https://www.spamhaus.org/drop/drop.txt", "format": "spamhaus"},
+      "Internal": {"url": "https://intel.example/blocklist.txt", "parser": my_parser, "timeout": 10},
+  }
+
+Usage:
+  results = fetch_feeds(THREAT_FEEDS)
+  for name, result in results.items():
+      print(name, result.status, len(result.entries), result.stats)
+  for result in iter_feeds(THREAT_FEEDS):   # as each download completes
+      ...
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from MyFirewallFunctionProj.instrumentation import inc, set_gauge, span
+from scripts.feed_parser import CHUNK_SIZE, FeedStats, iter_lines, parse_feed
+
+FEED_CACHE_DIR = os.environ.get("THREAT_FEED_CACHE_DIR", os.path.join(tempfile.gettempdir(), "threat_feed_cache"))
+DEFAULT_TIMEOUT = (5, 60)   # (connect, read) seconds
+MAX_WORKERS = 8
+# Bumped whenever the cached entries change shape; 2: (version, address, prefixlen) keys, not strings.
+CACHE_FORMAT_VERSION = 2
+
+
+class FeedResult:
+    """Outcome of fetching one feed. status is "fetched", "not_modified", "stale" or "error"."""
+
+    def __init__(self, name, status, entries, bytes_fetched=0, error=None, stats=None):
+        self.name = name
+        self.status = status
+        self.entries = entries
+        self.bytes_fetched = bytes_fetched
+        self.error = error
+        self.stats = stats
+
+    def __repr__(self):
+        return f"FeedResult({self.name!r}, {self.status!r}, entries={len(self.entries)}, bytes={self.bytes_fetched})"
+
+
+def make_session(pool_size=MAX_WORKERS):
+    """A requests.Session whose connection pool is large enough for every concurrent download."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_session = None
+
+
+def get_session():
+    """Process-wide pooled session, so connections are reused between runs."""
+    global _session
+    if _session is None:
+        _session = make_session()
+    return _session
+
+
+def _cache_paths(cache_dir, name, url):
+    # Key the files on the URL too, so pointing a feed at a new URL never serves the old entries.
+    stem = f"{name}-{hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]}"
+    base = os.path.join(cache_dir, stem)
+    return base + ".entries.json", base + ".meta.json"
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _load_entries(path):
+    entries = _read_json(path)
+    if entries is None:
+        return None
+    return [tuple(entry) for entry in entries]
+
+
+def _parser_id(feed):
+    """What produced a feed's cached entries: its format name or its parser's qualified name."""
+    parser = feed.get("parser")
+    if parser is None:
+        return f"format:{feed.get('format', 'plain')}"
+    return f"parser:{getattr(parser, '__module__', '')}.{getattr(parser, '__qualname__', repr(parser))}"
+
+
+def _get_parser(feed):
+    parser = feed.get("parser")
+    if parser is None:
+        feed_format = feed.get("format", "plain")
+        parser = lambda lines, stats: parse_feed(lines, feed_format, stats)
+    return parser
+
+
+def _count_bytes(chunks, counter):
+    for chunk in chunks:
+        counter[0] += len(chunk)
+        yield chunk
+
+
+def fetch_feed(name, feed, session=None, cache_dir=FEED_CACHE_DIR):
+    """Fetch and parse a single feed, revalidating against the on-disk cache."""
+    with span("feed_fetch", feed=name) as timing:
+        result = _fetch_feed(name, feed, session, cache_dir)
+        timing.annotate(status=result.status, bytes=result.bytes_fetched, entries=len(result.entries))
+    inc("feed_fetches_total", feed=name, status=result.status)
+    inc("feed_bytes_total", result.bytes_fetched, feed=name)
+    set_gauge("feed_entries", len(result.entries), feed=name)
+    return result
+
+
+def _fetch_feed(name, feed, session, cache_dir):
+    session = session or get_session()
+    url = feed["url"]
+    entries_path, meta_path = _cache_paths(cache_dir, name, url)
+    meta = _read_json(meta_path) or {}
+    # Entries cached by an older format or another parser are not reused; the feed is downloaded again.
+    parser_id = _parser_id(feed)
+    fresh_cache = meta.get("cache_format") == CACHE_FORMAT_VERSION and meta.get("parser") == parser_id
+    cached_entries = _load_entries(entries_path) if fresh_cache else None
+
+    headers = {}
+    if cached_entries is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        with session.get(url, headers=headers, timeout=feed.get("timeout", DEFAULT_TIMEOUT), stream=True) as response:
+            if response.status_code == 304 and cached_entries is not None:
+                return FeedResult(name, "not_modified", cached_entries)
+            response.raise_for_status()
+
+            # Parse the body as it streams in, instead of holding response.text in memory.
+            stats = FeedStats()
+            byte_counter = [0]
+            chunks = _count_bytes(response.iter_content(CHUNK_SIZE), byte_counter)
+            entries = sorted(set(_get_parser(feed)(iter_lines(chunks), stats)))
+            validators = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+
+        _write_json(entries_path, entries)
+        _write_json(meta_path, dict(validators, url=url, cache_format=CACHE_FORMAT_VERSION, parser=parser_id))
+        logging.info(f"Feed {name}: {stats}")
+        return FeedResult(name, "fetched", entries, byte_counter[0], stats=stats)
+    except Exception as e:
+        # Network, disk and parser errors alike only cost this feed, never the whole run.
+        if cached_entries is not None:
+            logging.warning(f"Feed {name} failed ({e}); using {len(cached_entries)} cached entries.")
+            return FeedResult(name, "stale", cached_entries, error=e)
+        logging.error(f"Feed {name} failed and has no cached copy: {e}")
+        return FeedResult(name, "error", [], error=e)
+
+
+def fetch_feeds(feeds, session=None, cache_dir=FEED_CACHE_DIR, max_workers=MAX_WORKERS):
+    """Fetch every feed concurrently. Returns {name: FeedResult} in the order of `feeds`."""
+    os.makedirs(cache_dir, exist_ok=True)
+    session = session or get_session()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(feeds)))) as pool:
+        futures = {
+            name: pool.submit(fetch_feed, name, feed, session, cache_dir)
+            for name, feed in feeds.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
+def iter_feeds(feeds, session=None, cache_dir=FEED_CACHE_DIR, max_workers=MAX_WORKERS):
+    """Fetch every feed concurrently, yielding each FeedResult as soon as its download finishes."""
+    os.makedirs(cache_dir, exist_ok=True)
+    session = session or get_session()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(feeds)))) as pool:
+        futures = [pool.submit(fetch_feed, name, feed, session, cache_dir) for name, feed in feeds.items()]
+        for future in as_completed(futures):
+            yield future.result()
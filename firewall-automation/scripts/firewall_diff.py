@@ -0,0 +1,154 @@
+"""
+firewall_diff.py
+
+Diff engine for Azure Firewall network rule collections.
+
+Every ARM PUT of an Azure Firewall takes minutes, even when nothing has changed. This module
+brings the desired and the current rule collections into a canonical form, meaning sorted
+address, port and protocol lists, with rules ordered by name and the action reduced to a string.
+It hashes each collection and compares the hashes. Collections whose hashes match are left
+alone. Only collections that are really different are diffed rule by rule, and the caller only
+needs to PUT when the diff is non-empty.
+
+Both the rule dicts used in scripts/rules.py and the Azure SDK model objects are accepted.
+
+Usage:
+  diff = diff_collections(desired, firewall.network_rule_collections, managed=lambda name: name == "AllowRules")
+  if diff.has_changes:
+      firewall.network_rule_collections = apply_diff(firewall.network_rule_collections, desired, diff)
+      ...begin_create_or_update(...)
+"""
+import hashlib
+import json
+
+# List fields of an AzureFirewallNetworkRule. A field a rule does not set compares equal to an empty list.
+RULE_FIELDS = ("protocols", "source_addresses", "destination_addresses", "destination_ports",
+               "source_ip_groups", "destination_ip_groups", "destination_fqdns")
+
+
+def _get(obj, name, default=None):
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+def _action_type(action):
+    if action is None:
+        return None
+    if isinstance(action, str):
+        return action.capitalize()
+    value = _get(action, "type")
+    value = getattr(value, "value", value)  # SDK enums
+    return str(value).capitalize() if value is not None else None
+
+
+def canonical_rule(rule):
+    canonical = {"name": _get(rule, "name"), "description": _get(rule, "description") or None}
+    for field in RULE_FIELDS:
+        values = _get(rule, field) or []
+        values = [str(getattr(value, "value", value)) for value in values]
+        if field == "protocols":
+            values = [value.upper() for value in values]
+        elif field == "destination_fqdns":
+            values = [value.lower() for value in values]
+        canonical[field] = sorted(set(values))
+    return canonical
+
+
+def canonical_collection(collection):
+    """Order-insensitive dict form of a rule collection (dict or SDK object)."""
+    return {
+        "name": _get(collection, "name"),
+        "priority": _get(collection, "priority"),
+        "action": _action_type(_get(collection, "action")),
+        "rules": sorted((canonical_rule(rule) for rule in _get(collection, "rules") or []), key=lambda r: r["name"]),
+    }
+
+
+def collection_hash(canonical):
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class FirewallDiff:
+    """Collection-level and rule-level differences between desired and current state."""
+
+    def __init__(self):
+        self.added = []        # collection names only in the desired state
+        self.removed = []      # managed collection names only in the current state
+        self.changed = {}      # name -> {"added_rules", "removed_rules", "changed_rules", "header_changed"}
+        self.unchanged = []
+
+    @property
+    def has_changes(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def summary(self):
+        return {
+            "added_collections": len(self.added),
+            "removed_collections": len(self.removed),
+            "changed_collections": len(self.changed),
+            "unchanged_collections": len(self.unchanged),
+            "added_rules": sum(len(c["added_rules"]) for c in self.changed.values()),
+            "removed_rules": sum(len(c["removed_rules"]) for c in self.changed.values()),
+            "changed_rules": sum(len(c["changed_rules"]) for c in self.changed.values()),
+        }
+
+    def __repr__(self):
+        return f"FirewallDiff({self.summary()})"
+
+
+def _diff_rules(desired, current):
+    desired_rules = {rule["name"]: rule for rule in desired["rules"]}
+    current_rules = {rule["name"]: rule for rule in current["rules"]}
+    return {
+        "added_rules": sorted(set(desired_rules) - set(current_rules)),
+        "removed_rules": sorted(set(current_rules) - set(desired_rules)),
+        "changed_rules": sorted(
+            name for name in set(desired_rules) & set(current_rules) if desired_rules[name] != current_rules[name]
+        ),
+        "header_changed": (desired["priority"], desired["action"]) != (current["priority"], current["action"]),
+    }
+
+
+def diff_collections(desired, current, managed=None):
+    """
+    Compare desired collections with the firewall's current ones.
+
+    `managed(name)` decides which current collections belong to the caller. Unmanaged collections
+    are never reported as removed. By default every collection named in `desired` is managed.
+    """
+    desired = {c["name"]: c for c in map(canonical_collection, desired)}
+    current = {c["name"]: c for c in map(canonical_collection, current or [])}
+    if managed is None:
+        managed = desired.__contains__
+
+    diff = FirewallDiff()
+    for name, collection in desired.items():
+        if name not in current:
+            diff.added.append(name)
+        elif collection_hash(collection) == collection_hash(current[name]):
+            diff.unchanged.append(name)
+        else:
+            diff.changed[name] = _diff_rules(collection, current[name])
+    diff.removed = [name for name in current if name not in desired and managed(name)]
+    return diff
+
+
+def apply_diff(current, desired, diff):
+    """
+    Return the collection list to PUT.
+
+    Unchanged and unmanaged collections keep their current objects, changed ones are swapped for
+    the desired objects in place, removed ones are dropped and added ones are appended.
+    """
+    desired_by_name = {_get(c, "name"): c for c in desired}
+    removed = set(diff.removed)
+    updated = []
+    for collection in current or []:
+        name = _get(collection, "name")
+        if name in removed:
+            continue
+        updated.append(desired_by_name[name] if name in diff.changed else collection)
+    updated.extend(desired_by_name[name] for name in diff.added)
+    return updated
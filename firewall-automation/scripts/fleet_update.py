@@ -0,0 +1,247 @@
+"""
+fleet_update.py
+
+Pushes rule collections to a whole inventory of Azure Firewalls at once.
+
+Each target's desired collections are computed once, before anything is sent. The rest happens
+in two overlapping phases:
+  - Dispatch: a bounded pool of workers GETs each firewall, diffs it against the desired state
+    (see firewall_diff) and starts begin_create_or_update for the targets that differ. Targets
+    that already match are left alone.
+  - Polling: each long-running operation is waited on in its own thread as soon as it has been
+    started, so the operations complete in parallel. The fleet then takes about as long as its
+    slowest firewall, not the sum of all of them.
+
+ARM throttles each subscription separately, and reads and writes have separate budgets. Every
+GET and PUT first takes a token from the subscription's read or write TokenBucket. A 429
+response pauses that subscription's bucket for the Retry-After interval, so every worker aimed
+at that subscription backs off, not just the one that was throttled. The request is then
+retried up to MAX_RETRIES times.
+
+The inventory is a JSON list of {"subscription_id", "resource_group", "firewall_name"} objects:
+
+  [{"subscription_id": "...", "resource_group": "rg-weu", "firewall_name": "fw-weu"}, ...]
+
+Usage:
+  targets = load_inventory("firewalls.json")
+  report = update_fleet(targets, [rule_collection])
+  report["updated"], report["failed"], report["wall_time"]
+"""
+import email.utils
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from MyFirewallFunctionProj.instrumentation import inc, observe, span
+from scripts.azure_clients import get_network_client
+from scripts.firewall_diff import apply_diff, diff_collections
+
+INVENTORY_PATH = os.environ.get("FIREWALL_INVENTORY")
+MAX_WORKERS = 16
+MAX_RETRIES = 5
+DEFAULT_RETRY_AFTER = 10.0      # seconds, when a 429 carries no usable Retry-After header
+# Per-subscription request budgets (tokens per second, burst), kept below ARM's own limits.
+READ_RATE = (10.0, 100)
+WRITE_RATE = (2.0, 20)
+
+
+class TokenBucket:
+    """Blocking token bucket; pause() stops all acquisitions until a deadline."""
+
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            self.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+
+class SubscriptionLimiter:
+    """One read and one write TokenBucket per subscription."""
+
+    def __init__(self, read_rate=READ_RATE, write_rate=WRITE_RATE):
+        self.rates = {"read": read_rate, "write": write_rate}
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, subscription_id, kind):
+        with self._lock:
+            key = (subscription_id, kind)
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(*self.rates[kind])
+            return self.buckets[key]
+
+
+class FirewallTarget:
+    def __init__(self, subscription_id, resource_group, firewall_name):
+        self.subscription_id = subscription_id
+        self.resource_group = resource_group
+        self.firewall_name = firewall_name
+
+    @property
+    def key(self):
+        return f"{self.subscription_id}/{self.resource_group}/{self.firewall_name}"
+
+    def __repr__(self):
+        return f"FirewallTarget({self.key!r})"
+
+
+def load_inventory(path=INVENTORY_PATH):
+    """FirewallTargets from a JSON inventory file."""
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    targets = []
+    for entry in entries:
+        missing = [field for field in ("subscription_id", "resource_group", "firewall_name") if not entry.get(field)]
+        if missing:
+            raise ValueError(f"Inventory entry {entry} is missing {missing}")
+        targets.append(FirewallTarget(entry["subscription_id"], entry["resource_group"], entry["firewall_name"]))
+    if len({target.key for target in targets}) != len(targets):
+        raise ValueError("Inventory lists the same firewall more than once")
+    return targets
+
+
+def retry_after_seconds(error, default=DEFAULT_RETRY_AFTER):
+    """Seconds to wait from an error's Retry-After header (delta-seconds or HTTP date)."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+def _is_throttled(error):
+    return getattr(error, "status_code", None) == 429
+
+
+def arm_call(limiter, subscription_id, kind, func, *args, max_retries=MAX_RETRIES):
+    """Call an ARM operation under the subscription's rate limit, retrying 429s after Retry-After."""
+    bucket = limiter.bucket(subscription_id, kind)
+    retries = 0
+    while True:
+        bucket.acquire()
+        try:
+            return func(*args)
+        except Exception as e:
+            if not _is_throttled(e) or retries >= max_retries:
+                raise
+            delay = retry_after_seconds(e)
+            retries += 1
+            inc("arm_throttled_total", subscription=subscription_id, kind=kind)
+            logging.warning(f"ARM throttled {kind} on subscription {subscription_id}; "
+                            f"retry {retries}/{max_retries} in {delay:.1f}s.")
+            # The next acquire() waits out the pause, as does every other worker on this subscription.
+            bucket.pause(delay)
+
+
+def _dispatch(target, desired, managed, limiter, client_factory):
+    """GET, diff and start the update of one firewall. Returns (diff, poller or None)."""
+    client = client_factory(target.subscription_id)
+    firewalls = client.azure_firewalls
+    firewall = arm_call(limiter, target.subscription_id, "read", firewalls.get,
+                        target.resource_group, target.firewall_name)
+    current = firewall.network_rule_collections or []
+    diff = diff_collections(desired, current, managed=managed)
+    if not diff.has_changes:
+        return diff, None
+    firewall.network_rule_collections = apply_diff(current, desired, diff)
+    poller = arm_call(limiter, target.subscription_id, "write", firewalls.begin_create_or_update,
+                      target.resource_group, target.firewall_name, firewall)
+    return diff, poller
+
+
+def update_fleet(targets, desired, managed=None, max_workers=MAX_WORKERS, limiter=None,
+                 client_factory=get_network_client):
+    """
+    Bring every target in line with `desired`: a list of rule collections, or a callable
+    target -> list that is called once per target before anything is dispatched.
+
+    Returns {"targets": {key: {"status", "diff", "error", "seconds"}}, "updated", "unchanged",
+    "failed", "wall_time", "slowest"}. status is "updated", "unchanged" or "failed"; one failing
+    firewall does not stop the others.
+    """
+    limiter = limiter or SubscriptionLimiter()
+    start = time.perf_counter()
+    plans = {target.key: desired(target) if callable(desired) else desired for target in targets}
+    outcomes = {}
+    lock = threading.Lock()
+
+    def finish(target, status, diff=None, error=None):
+        seconds = time.perf_counter() - start
+        with lock:
+            outcomes[target.key] = {"status": status, "diff": diff.summary() if diff is not None else None,
+                                    "error": None if error is None else repr(error), "seconds": seconds}
+        inc("fleet_targets_total", status=status)
+        observe("fleet_target_seconds", seconds, status=status)
+        if error is not None:
+            logging.error(f"Firewall {target.key} failed: {error}")
+
+    # Pollers only wait on ARM, so they get their own pool and never hold up a dispatch worker.
+    with ThreadPoolExecutor(max_workers=max(1, len(targets))) as polling:
+        def wait_for(target, diff, poller):
+            try:
+                poller.result()
+                finish(target, "updated", diff)
+            except Exception as e:
+                finish(target, "failed", diff, e)
+
+        def dispatch(target):
+            try:
+                diff, poller = _dispatch(target, plans[target.key], managed, limiter, client_factory)
+            except Exception as e:
+                finish(target, "failed", error=e)
+                return
+            if poller is None:
+                finish(target, "unchanged", diff)
+            else:
+                polling.submit(wait_for, target, diff, poller)
+
+        with span("fleet_update", targets=len(targets)):
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(targets)))) as dispatching:
+                list(dispatching.map(dispatch, targets))
+            polling.shutdown(wait=True)
+
+    wall_time = time.perf_counter() - start
+    ordered = {target.key: outcomes[target.key] for target in targets}
+    statuses = [outcome["status"] for outcome in ordered.values()]
+    report = {
+        "targets": ordered,
+        "updated": statuses.count("updated"),
+        "unchanged": statuses.count("unchanged"),
+        "failed": statuses.count("failed"),
+        "wall_time": wall_time,
+        "slowest": max(ordered, key=lambda key: ordered[key]["seconds"]) if ordered else None,
+    }
+    logging.info(f"Fleet update: {report['updated']} updated, {report['unchanged']} unchanged, "
+                 f"{report['failed']} failed in {wall_time:.1f}s.")
+    return report
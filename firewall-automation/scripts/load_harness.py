@@ -0,0 +1,762 @@
+"""
+load_harness.py
+
+Offline end-to-end load harness for the blocklist refresh and the fleet update.
+
+Each external service the update paths call is replaced by an in-process stand-in:
+  - FeedServer serves SyntheticFeeds over HTTP on 127.0.0.1. A feed is `size` IPv4 addresses in
+    the plain format, and each advance() replaces a `churn` fraction of them. The ETag changes
+    with every advance, so an unchanged feed is answered with 304 as the real feeds would be.
+  - FakeNetworkManagementClient keeps firewalls in memory. begin_create_or_update returns a
+    poller that completes after `lro_latency` seconds, and a `throttle_rate` share of the calls
+    fails with 429 and a Retry-After header.
+  - FakeMongoClient and FakeTableClient are in-memory stand-ins for the blocklist collection and
+    table, with an optional latency per call.
+
+run_blocklist_scenario() runs malip's blocklist pipeline against these stand-ins for several
+rounds: one cold round, then warm rounds with churned feeds. It reports each stage's latency
+percentiles and the networks processed per second. If any stage fails, the scenario prints the
+errors instead of timings and the harness exits with status 1. run_fleet_scenario() does the same
+for fleet_update.update_fleet over an inventory of fake firewalls.
+
+Results are written as JSON with sorted keys and rounded timings, one entry per scenario, so two
+runs can be compared with a plain diff. --compare lists the p50/p90 timings that got slower than
+REGRESSION_THRESHOLD.
+
+Usage:
+  python -m scripts.load_harness                                  # 1k, 10k and 100k entries
+  python -m scripts.load_harness --sizes 1000 1000000 --rounds 5 --json load.json
+  python -m scripts.load_harness --sizes --fleet 50 --lro-latency 2 --throttle-rate 0.05
+  python -m scripts.load_harness --json new.json --compare load.json
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from azure.core.exceptions import HttpResponseError
+from azure.data.tables import TableTransactionError
+
+from scripts import azure_clients, blocklist_store
+from scripts.fleet_update import FirewallTarget, SubscriptionLimiter, update_fleet
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_ROUNDS = 5
+DEFAULT_FEEDS = 3
+DEFAULT_CHURN = 0.01
+PERCENTILES = (50, 90, 99)
+# Feeds draw from FIRST_ADDRESS + size * UNIVERSE_FACTOR addresses, so they overlap by about 1/16.
+FIRST_ADDRESS = 1 << 24
+UNIVERSE_FACTOR = 16
+MAX_TRANSACTION_SIZE = 100
+REGRESSION_THRESHOLD = 0.2          # relative slowdown reported by --compare
+MIN_REGRESSION_SECONDS = 0.005      # below this, differences are timer noise
+
+
+class _Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class ThrottledError(HttpResponseError):
+    """A 429 with a Retry-After header, as ARM and Table Storage send it."""
+
+    def __init__(self, retry_after=0.0):
+        super().__init__(message="Too Many Requests")
+        self.status_code = 429
+        self.response = _Response({"Retry-After": str(retry_after)})
+
+
+class _Throttle:
+    """Fails a seeded random `rate` share of calls with ThrottledError."""
+
+    def __init__(self, rate=0.0, retry_after=0.0, seed=0):
+        self.rate = rate
+        self.retry_after = retry_after
+        self.count = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def check(self):
+        if not self.rate:
+            return
+        with self._lock:
+            throttled = self._rng.random() < self.rate
+            self.count += throttled
+        if throttled:
+            raise ThrottledError(self.retry_after)
+
+
+class FakeFirewall:
+    def __init__(self, name, network_rule_collections):
+        self.name = name
+        self.network_rule_collections = network_rule_collections
+
+
+class FakePoller:
+    """Long-running operation that applies its change once `latency` seconds have passed."""
+
+    def __init__(self, latency, apply):
+        self.deadline = time.monotonic() + latency
+        self._apply = apply
+        self._lock = threading.Lock()
+        self._applied = False
+        self._value = None
+
+    def done(self):
+        return time.monotonic() >= self.deadline
+
+    def result(self, timeout=None):
+        wait = self.deadline - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        with self._lock:
+            if not self._applied:
+                self._value = self._apply()
+                self._applied = True
+        return self._value
+
+
+class FakeAzureFirewalls:
+    """The azure_firewalls operations group: get and begin_create_or_update on in-memory firewalls."""
+
+    def __init__(self, lro_latency=0.0, throttle_rate=0.0, retry_after=0.0, seed=0):
+        self.lro_latency = lro_latency
+        self.firewalls = {}     # (resource group, name) -> list of rule collections
+        self.calls = {"get": 0, "begin_create_or_update": 0}
+        self._throttle = _Throttle(throttle_rate, retry_after, seed)
+        self._lock = threading.Lock()
+
+    @property
+    def throttled(self):
+        return self._throttle.count
+
+    def _call(self, operation):
+        with self._lock:
+            self.calls[operation] += 1
+        self._throttle.check()
+
+    def get(self, resource_group, firewall_name):
+        self._call("get")
+        with self._lock:
+            collections = self.firewalls.setdefault((resource_group, firewall_name), [])
+            return FakeFirewall(firewall_name, list(collections))
+
+    def begin_create_or_update(self, resource_group, firewall_name, parameters):
+        self._call("begin_create_or_update")
+        collections = list(parameters.network_rule_collections or [])
+
+        def apply():
+            with self._lock:
+                self.firewalls[(resource_group, firewall_name)] = collections
+            return FakeFirewall(firewall_name, list(collections))
+
+        return FakePoller(self.lro_latency, apply)
+
+
+class FakeNetworkManagementClient:
+    def __init__(self, lro_latency=0.0, throttle_rate=0.0, retry_after=0.0, seed=0):
+        self.azure_firewalls = FakeAzureFirewalls(lro_latency, throttle_rate, retry_after, seed)
+
+
+def partition_filter(query_filter, parameters=None):
+    """
+    Predicate on PartitionKey for the OData filters TableWriter sends: "or"-ed
+    "PartitionKey eq 'p'" and "PartitionKey ge 'lo' and PartitionKey lt 'hi'" terms.
+    """
+    for name, value in (parameters or {}).items():
+        query_filter = query_filter.replace(f"@{name}", "'" + str(value).replace("'", "''") + "'")
+    equal = set(re.findall(r"PartitionKey eq '([^']*)'", query_filter))
+    ranges = re.findall(r"PartitionKey ge '([^']*)' and PartitionKey lt '([^']*)'", query_filter)
+    if not equal and not ranges:
+        raise ValueError(f"Unsupported table filter: {query_filter!r}")
+    return lambda partition: partition in equal or any(lo <= partition < hi for lo, hi in ranges)
+
+
+class FakeTableClient:
+    """
+    query_entities, submit_transaction and delete_entity on an in-memory table, with the service's
+    batch rules: a transaction is atomic, and deleting a missing row fails all of it with 404.
+    """
+
+    def __init__(self, latency=0.0, throttle_rate=0.0, retry_after=0.0, seed=0):
+        self.latency = latency
+        self.rows = {}          # (PartitionKey, RowKey) -> entity
+        self.transactions = 0
+        self._throttle = _Throttle(throttle_rate, retry_after, seed)
+        self._lock = threading.Lock()
+
+    @property
+    def throttled(self):
+        return self._throttle.count
+
+    def query_entities(self, query_filter, select=None, parameters=None):
+        if self.latency:
+            time.sleep(self.latency)
+        matches = partition_filter(query_filter, parameters)
+        with self._lock:
+            entities = [entity for entity in self.rows.values() if matches(entity["PartitionKey"])]
+        for entity in entities:
+            yield {field: entity[field] for field in select if field in entity} if select else dict(entity)
+
+    def submit_transaction(self, operations):
+        operations = list(operations)
+        if len(operations) > MAX_TRANSACTION_SIZE:
+            raise ValueError(f"A transaction holds at most {MAX_TRANSACTION_SIZE} operations, got {len(operations)}.")
+        if len({operation[1]["PartitionKey"] for operation in operations}) > 1:
+            raise ValueError("All operations of a transaction must share one PartitionKey.")
+        self._throttle.check()
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.transactions += 1
+            for index, (kind, entity, *_) in enumerate(operations):
+                if kind == "delete" and (entity["PartitionKey"], entity["RowKey"]) not in self.rows:
+                    error = TableTransactionError(message=f"{index}:The specified resource does not exist.")
+                    error.status_code = 404
+                    raise error
+            for kind, entity, *_ in operations:
+                key = (entity["PartitionKey"], entity["RowKey"])
+                if kind == "delete":
+                    del self.rows[key]
+                else:
+                    self.rows[key] = dict(self.rows.get(key, {}), **entity)
+        return [{} for _ in operations]
+
+    def delete_entity(self, partition_key, row_key):
+        """Like TableClient.delete_entity, a missing row is not an error."""
+        self._throttle.check()
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.rows.pop((partition_key, row_key), None)
+
+
+class FakeUpdateOne:
+    """pymongo.UpdateOne's constructor, with the filter and update document kept in public attributes."""
+
+    def __init__(self, filter, update, upsert=False):
+        self.filter = filter
+        self.update = update
+        self.upsert = upsert
+
+
+class FakeDeleteOne:
+    def __init__(self, filter):
+        self.filter = filter
+
+
+FAKE_WRITE_MODELS = (FakeUpdateOne, FakeDeleteOne)
+
+
+class _WriteResult:
+    def __init__(self, matched_count=0, modified_count=0, upserted_count=0, deleted_count=0):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_count = upserted_count
+        self.deleted_count = deleted_count
+
+
+def _prepare_query(query):
+    """`query` with every "$in" operand turned into a set once, instead of a list scanned per document."""
+    return {
+        field: dict(condition, **{"$in": set(condition["$in"])})
+        if isinstance(condition, dict) and "$in" in condition else condition
+        for field, condition in query.items()
+    }
+
+
+def _matches(document, query):
+    for field, condition in query.items():
+        value = document.get(field)
+        if isinstance(condition, dict):
+            if "$lt" in condition and not (value is not None and value < condition["$lt"]):
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$exists" in condition and (field in document) != condition["$exists"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeMongoCollection:
+    """
+    The collection methods BlocklistStore uses: create_index, find, bulk_write (FakeUpdateOne and
+    FakeDeleteOne on the unique "network" field, see FAKE_WRITE_MODELS), update_many and delete_many.
+    """
+
+    def __init__(self, latency=0.0, key_field="network"):
+        self.latency = latency
+        self.key_field = key_field
+        self.documents = {}     # key field value -> document
+        self.indexes = {}
+        self.bulk_writes = 0
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def create_index(self, keys, name=None, **kwargs):
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        self.indexes[name] = dict(kwargs, keys=keys)
+        return name
+
+    def _select(self, query):
+        """(key, document) pairs matching `query`; "$in" on the key field is answered by key lookups."""
+        query = _prepare_query(query or {})
+        condition = query.get(self.key_field)
+        if isinstance(condition, dict) and "$in" in condition:
+            candidates = ((key, self.documents[key]) for key in condition["$in"] if key in self.documents)
+        else:
+            candidates = self.documents.items()
+        return [(key, document) for key, document in candidates if _matches(document, query)]
+
+    def find(self, query=None, projection=None):
+        self._wait()
+        with self._lock:
+            documents = [dict(document) for _, document in self._select(query)]
+        fields = [field for field, included in (projection or {}).items() if included]
+        for document in documents:
+            yield {field: document[field] for field in fields if field in document} if fields else document
+
+    def bulk_write(self, requests, ordered=True):
+        self._wait()
+        result = _WriteResult()
+        with self._lock:
+            self.bulk_writes += 1
+            for request in requests:
+                if not isinstance(request, (FakeUpdateOne, FakeDeleteOne)):
+                    raise TypeError(f"Build writes with FAKE_WRITE_MODELS, got {type(request).__name__}.")
+                key = request.filter[self.key_field]
+                if isinstance(request, FakeDeleteOne):
+                    result.deleted_count += self.documents.pop(key, None) is not None
+                    continue
+                document = self.documents.get(key)
+                if document is None:
+                    if not request.upsert:
+                        continue
+                    document = self.documents[key] = {self.key_field: key}
+                    document.update(request.update.get("$setOnInsert", {}))
+                    result.upserted_count += 1
+                else:
+                    result.matched_count += 1
+                    result.modified_count += 1
+                document.update(request.update.get("$set", {}))
+        return result
+
+    def delete_many(self, query):
+        self._wait()
+        with self._lock:
+            keys = [key for key, _ in self._select(query)]
+            for key in keys:
+                del self.documents[key]
+        return _WriteResult(deleted_count=len(keys))
+
+    def update_many(self, query, update):
+        self._wait()
+        result = _WriteResult()
+        with self._lock:
+            for _, document in self._select(query):
+                document.update(update.get("$set", {}))
+                result.matched_count += 1
+                result.modified_count += 1
+        return result
+
+
+class FakeMongoDatabase:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeMongoCollection(self.latency)
+        return self.collections[name]
+
+
+class FakeMongoClient:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.databases = {}
+
+    def __getitem__(self, name):
+        if name not in self.databases:
+            self.databases[name] = FakeMongoDatabase(self.latency)
+        return self.databases[name]
+
+
+def _format_ipv4(address):
+    return f"{address >> 24}.{(address >> 16) & 0xFF}.{(address >> 8) & 0xFF}.{address & 0xFF}"
+
+
+class SyntheticFeed:
+    """`size` distinct IPv4 addresses; advance() replaces a `churn` fraction with new ones."""
+
+    def __init__(self, name, size, churn=DEFAULT_CHURN, seed=0):
+        self.name = name
+        self.churn = churn
+        self.version = 0
+        self.universe = (FIRST_ADDRESS, FIRST_ADDRESS + max(size, 1) * UNIVERSE_FACTOR)
+        self._rng = random.Random(seed)
+        self.addresses = self._rng.sample(range(*self.universe), size)
+        self._body = None
+
+    @property
+    def etag(self):
+        return f'"{self.name}-{self.version}"'
+
+    def advance(self):
+        count = round(len(self.addresses) * self.churn)
+        current = set(self.addresses)
+        for i in self._rng.sample(range(len(self.addresses)), count):
+            address = self._rng.randrange(*self.universe)
+            while address in current:
+                address = self._rng.randrange(*self.universe)
+            current.discard(self.addresses[i])
+            current.add(address)
+            self.addresses[i] = address
+        self.version += 1
+        self._body = None
+
+    def body(self):
+        if self._body is None:
+            lines = [f"# {self.name} synthetic feed, version {self.version}"]
+            lines.extend(map(_format_ipv4, self.addresses))
+            self._body = ("\n".join(lines) + "\n").encode("ascii")
+        return self._body
+
+
+class _FeedHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server.feed_server
+        feed = server.feeds.get(self.path.lstrip("/").split("?")[0])
+        if feed is None:
+            self.send_error(404)
+            return
+        server.count("requests")
+        if self.headers.get("If-None-Match") == feed.etag:
+            server.count("not_modified")
+            self.send_response(304)
+            self.send_header("ETag", feed.etag)
+            self.end_headers()
+            return
+        body = feed.body()
+        server.count("bytes", len(body))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", feed.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FeedServer:
+    """Serves SyntheticFeeds at http://127.0.0.1:<port>/<name> from a daemon thread."""
+
+    def __init__(self, feeds):
+        self.feeds = {feed.name: feed for feed in feeds}
+        self.stats = {"requests": 0, "not_modified": 0, "bytes": 0}
+        self._lock = threading.Lock()
+        self._httpd = None
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+
+    def start(self):
+        for feed in self.feeds.values():
+            feed.body()     # render outside the measured fetches
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _FeedHandler)
+        self._httpd.feed_server = self
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    def feed_config(self):
+        """THREAT_FEEDS-style {name: {"url", "format"}} for every served feed."""
+        return {name: {"url": f"http://127.0.0.1:{self.port}/{name}", "format": "plain"} for name in self.feeds}
+
+    def advance(self):
+        for feed in self.feeds.values():
+            feed.advance()
+            feed.body()
+
+
+@contextmanager
+def installed_fakes(network_client, table_client, mongo_client):
+    """Route malip's network, Table Storage and MongoDB clients to the given stand-ins."""
+    from scripts import malip
+    account_url = f"https://{malip.STORAGE_ACCOUNT_NAME}.table.core.windows.net"
+    azure_clients.set_network_client(malip.SUBSCRIPTION_ID, network_client)
+    azure_clients.set_table_client(account_url, malip.TABLE_NAME, table_client)
+    blocklist_store.set_client(malip.MONGO_URI, mongo_client, FAKE_WRITE_MODELS)
+    try:
+        yield
+    finally:
+        azure_clients.reset_clients()
+        blocklist_store.set_client(malip.MONGO_URI, None)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty sequence."""
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(q / 100.0 * len(ordered))) - 1]
+
+
+def summarize(values):
+    """{"p50", "p90", "p99", "max", "mean", "count"} of a list of seconds (None when empty)."""
+    if not values:
+        return None
+    summary = {f"p{q}": round(percentile(values, q), 4) for q in PERCENTILES}
+    summary.update(max=round(max(values), 4), mean=round(sum(values) / len(values), 4), count=len(values))
+    return summary
+
+
+def _blocklist_pipeline(feeds, snapshot_path, feed_cache_dir):
+    from scripts.malip import build_blocklist_pipeline
+    return build_blocklist_pipeline(feeds, snapshot_path, feed_cache_dir)
+
+
+def run_blocklist_scenario(size, rounds=DEFAULT_ROUNDS, feeds=DEFAULT_FEEDS, churn=DEFAULT_CHURN, lro_latency=0.0,
+                           throttle_rate=0.0, retry_after=0.0, sink_latency=0.0, seed=0,
+                           pipeline_factory=_blocklist_pipeline):
+    """
+    Run the blocklist pipeline `rounds` times against `feeds` synthetic feeds of `size` entries.
+
+    Round 0 starts from empty sinks and no snapshot; every later round first churns the feeds.
+    pipeline_factory(feeds, snapshot_path, feed_cache_dir) builds the pipeline of one round.
+    """
+    synthetic = [SyntheticFeed(f"feed{i}", size, churn, seed + i) for i in range(feeds)]
+    network_client = FakeNetworkManagementClient(lro_latency, throttle_rate, retry_after, seed)
+    table_client = FakeTableClient(sink_latency, throttle_rate, retry_after, seed)
+    mongo_client = FakeMongoClient(sink_latency)
+    cold, warm_walls, warm_stages, entries = None, [], {}, []
+    failed, errors, statuses = set(), {}, {}
+
+    with tempfile.TemporaryDirectory() as workdir, FeedServer(synthetic) as server, \
+            installed_fakes(network_client, table_client, mongo_client):
+        snapshot_path = os.path.join(workdir, "blocklist.snap")
+        feed_cache_dir = os.path.join(workdir, "feeds")
+        for round_index in range(rounds):
+            if round_index:
+                server.advance()
+            report = pipeline_factory(server.feed_config(), snapshot_path, feed_cache_dir).run()
+            networks = report.value("networks")
+            entries.append(len(networks) if networks is not None else 0)
+            stages = {name: result.elapsed for name, result in report.stages.items() if result.status == "ok"}
+            statuses = {name: result.status for name, result in report.stages.items()}
+            for name in report.failed:
+                failed.add(name)
+                errors.setdefault(name, repr(report.stages[name].error))
+            if round_index == 0:
+                cold = {"wall_time": round(report.wall_time, 4),
+                        "stages": {name: round(elapsed, 4) for name, elapsed in stages.items()},
+                        "throughput": round(entries[0] / report.wall_time, 1) if report.wall_time else None}
+                continue
+            warm_walls.append(report.wall_time)
+            for name, elapsed in stages.items():
+                warm_stages.setdefault(name, []).append(elapsed)
+
+    warm = None
+    if warm_walls:
+        wall = summarize(warm_walls)
+        warm = {"wall_time": wall, "stages": {name: summarize(values) for name, values in warm_stages.items()},
+                "throughput": round(sum(entries[1:]) / len(warm_walls) / wall["p50"], 1) if wall["p50"] else None}
+    mongo_documents = sum(len(collection.documents) for database in mongo_client.databases.values()
+                          for collection in database.collections.values())
+    return {
+        "scenario": "blocklist",
+        "params": {"size": size, "feeds": feeds, "rounds": rounds, "churn": churn, "lro_latency": lro_latency,
+                   "throttle_rate": throttle_rate, "retry_after": retry_after, "sink_latency": sink_latency,
+                   "seed": seed},
+        "entries": entries[-1] if entries else 0,
+        "cold": cold,
+        "warm": warm,
+        "last_round": statuses,
+        "failed": sorted(failed),
+        "errors": errors,
+        "counters": {
+            "feed_requests": server.stats["requests"],
+            "feed_not_modified": server.stats["not_modified"],
+            "feed_bytes": server.stats["bytes"],
+            "arm_calls": dict(network_client.azure_firewalls.calls),
+            "arm_throttled": network_client.azure_firewalls.throttled,
+            "table_transactions": table_client.transactions,
+            "table_throttled": table_client.throttled,
+            "table_rows": len(table_client.rows),
+            "mongo_documents": mongo_documents,
+        },
+    }
+
+
+def _fleet_collections(count, round_index):
+    return [
+        {"name": f"Load-{i}", "priority": 100 + i, "action": {"type": "Allow"}, "rules": [{
+            "name": "allow", "protocols": ["TCP"], "source_addresses": ["*"],
+            "destination_addresses": [f"10.{i // 256}.{i % 256}.4"], "destination_ports": [str(1000 + round_index)],
+        }]}
+        for i in range(count)
+    ]
+
+
+def run_fleet_scenario(firewalls, rounds=3, collections=10, subscriptions=2, lro_latency=0.0, throttle_rate=0.0,
+                       retry_after=0.0, max_workers=16, seed=0):
+    """Push a changed set of `collections` to `firewalls` fake firewalls, `rounds` times."""
+    clients = {
+        f"sub-{i}": FakeNetworkManagementClient(lro_latency, throttle_rate, retry_after, seed + i)
+        for i in range(subscriptions)
+    }
+    targets = [FirewallTarget(f"sub-{i % subscriptions}", "rg-load", f"fw-{i}") for i in range(firewalls)]
+    limiter = SubscriptionLimiter()
+    walls, target_seconds = [], []
+    totals = {"updated": 0, "unchanged": 0, "failed": 0}
+    for round_index in range(rounds):
+        report = update_fleet(targets, _fleet_collections(collections, round_index), max_workers=max_workers,
+                              limiter=limiter, client_factory=clients.__getitem__)
+        walls.append(report["wall_time"])
+        target_seconds.extend(outcome["seconds"] for outcome in report["targets"].values())
+        for status in totals:
+            totals[status] += report[status]
+    wall = summarize(walls)
+    return {
+        "scenario": "fleet",
+        "params": {"firewalls": firewalls, "rounds": rounds, "collections": collections,
+                   "subscriptions": subscriptions, "lro_latency": lro_latency, "throttle_rate": throttle_rate,
+                   "retry_after": retry_after, "max_workers": max_workers, "seed": seed},
+        "wall_time": wall,
+        "target_seconds": summarize(target_seconds),
+        "throughput": round(firewalls / wall["p50"], 1) if wall and wall["p50"] else None,
+        "counters": dict(totals, arm_throttled=sum(c.azure_firewalls.throttled for c in clients.values())),
+    }
+
+
+def _flatten(value, prefix=""):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(item, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, value
+
+
+def compare_results(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """The p50/p90 timings of scenarios in both results that got more than `threshold` slower."""
+    regressions = []
+    for name, result in sorted(current["scenarios"].items()):
+        before = dict(_flatten(baseline.get("scenarios", {}).get(name)))
+        for metric, value in _flatten(result):
+            old = before.get(metric)
+            if not metric.endswith((".p50", ".p90")) or not old:
+                continue
+            if value > old * (1 + threshold) and value - old > MIN_REGRESSION_SECONDS:
+                regressions.append({"scenario": name, "metric": metric, "baseline": old, "current": value,
+                                    "ratio": round(value / old, 2)})
+    return regressions
+
+
+def _environment():
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def _print_blocklist(name, result):
+    print(f"\n{name}: {result['entries']} networks")
+    if result["failed"]:
+        # Timings of a round whose stages failed or were skipped measure nothing useful.
+        for stage in result["failed"]:
+            print(f"  FAILED {stage}: {result['errors'][stage]}")
+        return
+    cold, warm = result["cold"], result["warm"]
+    print(f"  cold  wall {cold['wall_time']:8.3f} s   {cold['throughput'] or 0:>12,.0f} networks/s")
+    if warm:
+        print(f"  warm  wall p50 {warm['wall_time']['p50']:8.3f} s  p90 {warm['wall_time']['p90']:8.3f} s"
+              f"   {warm['throughput'] or 0:>12,.0f} networks/s")
+        for stage, summary in warm["stages"].items():
+            print(f"    {stage:<10} p50 {summary['p50']:8.3f}  p90 {summary['p90']:8.3f}  max {summary['max']:8.3f}")
+
+
+def _print_fleet(name, result):
+    wall, targets = result["wall_time"], result["target_seconds"]
+    print(f"\n{name}: wall p50 {wall['p50']:.3f} s, per firewall p50 {targets['p50']:.3f} s "
+          f"p99 {targets['p99']:.3f} s, {result['throughput']} firewalls/s, {result['counters']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="*", default=list(DEFAULT_SIZES), help="entries per feed")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS)
+    parser.add_argument("--feeds", type=int, default=DEFAULT_FEEDS)
+    parser.add_argument("--churn", type=float, default=DEFAULT_CHURN, help="share of each feed replaced per round")
+    parser.add_argument("--lro-latency", type=float, default=0.0, help="seconds until a firewall update completes")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of ARM / Table calls answered 429")
+    parser.add_argument("--retry-after", type=float, default=0.0, help="Retry-After seconds of a 429")
+    parser.add_argument("--sink-latency", type=float, default=0.0, help="seconds per MongoDB / Table call")
+    parser.add_argument("--fleet", type=int, default=0, help="also update this many fake firewalls")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="report regressions against a previous --json file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    results = {"environment": _environment(), "scenarios": {}}
+    for size in args.sizes:
+        name = f"blocklist-{size}"
+        result = run_blocklist_scenario(size, args.rounds, args.feeds, args.churn, args.lro_latency,
+                                        args.throttle_rate, args.retry_after, args.sink_latency, args.seed)
+        results["scenarios"][name] = result
+        _print_blocklist(name, result)
+    if args.fleet:
+        name = f"fleet-{args.fleet}"
+        result = run_fleet_scenario(args.fleet, lro_latency=args.lro_latency, throttle_rate=args.throttle_rate,
+                                    retry_after=args.retry_after, seed=args.seed)
+        results["scenarios"][name] = result
+        _print_fleet(name, result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare_results(json.load(f), results)
+        print(f"\n{len(regressions)} regressions against {args.compare}")
+        for regression in regressions:
+            print(f"  {regression['scenario']} {regression['metric']}: {regression['baseline']} -> "
+                  f"{regression['current']} ({regression['ratio']}x)")
+    failed = [name for name, result in results["scenarios"].items() if result.get("failed")]
+    if failed:
+        parser.exit(1, f"\nStages failed in {', '.join(failed)}; the timings above are not comparable.\n")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,22 @@
 
-import requests
+import os
 import json
 import datetime
 import logging
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.network import NetworkManagementClient
-from azure.mgmt.network.models import NetworkRule, NetworkRuleCollection, RuleCollectionType
-from azure.data.tables import TableServiceClient, TableClient, UpdateMode
-from pymongo import MongoClient
+import tempfile
+import time
+from scripts.azure_clients import get_network_client, get_table_client
+from scripts.feed_fetcher import FEED_CACHE_DIR, iter_feeds
+from scripts.feed_parser import format_network, parse_network
+from scripts.cidr_aggregate import aggregate_networks, select_within_budget
+from scripts.rule_sharding import ShardLimits, is_shard_of, shard_blocklist
+from scripts.firewall_diff import apply_diff, diff_collections
+from scripts.blocklist_store import BlocklistStore
+from scripts.table_writer import TableWriter
+from scripts.blocklist_snapshot import BlocklistSnapshot, diff, load_previous
+from scripts.blocklist_manager import STATE_PATH as MANAGER_STATE_PATH, load_manager
+from scripts.pipeline import Pipeline
+from MyFirewallFunctionProj.instrumentation import inc_counts, set_gauge, span, write_metrics
 
 # Azure Configuration
 SUBSCRIPTION_ID = ""
@@ -17,140 +26,323 @@ RULE_COLLECTION_NAME = "BlockMaliciousIPs"
 STORAGE_ACCOUNT_NAME = "myfirewallstorage12345"
 STORAGE_ACCOUNT_KEY = "="
 TABLE_NAME = "BlockedIPs"
+# Before the /16 sharding, every address was one row in this partition; it is emptied once per process.
+LEGACY_TABLE_PARTITION = "BlockedIP"
+_legacy_partition_deleted = False
 
 # MongoDB Configuration
 MONGO_URI = "mongodb://localhost:27017/"
 MONGO_DB = "firewallDB"
 MONGO_COLLECTION = "blockedIPs"
 
+# Snapshot of the last successfully applied blocklist; each run diffs against it.
+SNAPSHOT_PATH = os.environ.get("BLOCKLIST_SNAPSHOT_PATH", os.path.join(tempfile.gettempdir(), "blocklist.snap"))
+
+# Flow-log hits, {"network": count} JSON of firewall deny-log matches per blocklisted network since
+# the export last ran. The flow-log export writes it; each ranking run claims and consumes it once.
+FLOW_LOG_HITS_PATH = os.environ.get("FLOW_LOG_HITS_PATH")
+
+# Rule Budget: prefixes are packed into multi-address rules over up to SHARD_LIMITS.collections
+# collections named f"{RULE_COLLECTION_NAME}-NN" with priority RULE_COLLECTION_PRIORITY + NN.
+RULE_COLLECTION_PRIORITY = 200
+SHARD_LIMITS = ShardLimits(addresses_per_rule=50, rules_per_collection=100, collections=20, addresses_per_firewall=10000)
+RULE_BUDGET = SHARD_LIMITS.capacity
+
+# Confidence (0-100) given to an entry listed by each feed; see scripts/connection.py.
+FEED_CONFIDENCE = {
+    "AbuseIPDB": 90,
+    "Spamhaus": 80,
+    "FireHOL": 70,
+    "AlienVault": 60
+}
+DEFAULT_CONFIDENCE = 50
+
 # Threat Intelligence Feeds
+# Each feed names a format from feed_parser.FEED_FORMATS (or brings its own "parser" callable),
+# and may set a per-feed "timeout".
 THREAT_FEEDS = {
-    "Spamhaus": "https://www.spamhaus.org/drop/drop.txt",
-    "FireHOL": "http://iplists.firehol.org/files/firehol_level1.netset",
-    "AlienVault": "https://reputation.alienvault.com/reputation.data"
+    "Spamhaus": {"url": "https://www.spamhaus.org/drop/drop.txt", "format": "spamhaus"},
+    "FireHOL": {"url": "http://iplists.firehol.org/files/firehol_level1.netset", "format": "netset"},
+    "AlienVault": {"url": "https://reputation.alienvault.com/reputation.data", "format": "alienvault"}
 }
 
+# Function to Fetch Malicious Networks
+def collect_networks(results):
+    """Merge FeedResults, in whatever order they arrive, into {(version, address, prefixlen): [feed names]}."""
+    networks = {}
+    for result in results:
+        logging.info(f"Feed {result.name}: {result.status}, {len(result.entries)} entries, {result.bytes_fetched} bytes.")
+        for key in result.entries:
+            networks.setdefault(key, []).append(result.name)
+
+    logging.info(f"Fetched {len(networks)} malicious networks.")
+    return networks
+
+def fetch_malicious_networks(feeds=None):
+    """Return {(version, address, prefixlen): [feed names]} for every valid feed entry."""
+    # All feeds are downloaded concurrently; unchanged feeds come back as 304 and are served from cache.
+    return collect_networks(iter_feeds(THREAT_FEEDS if feeds is None else feeds))
+
 # Function to Fetch Malicious IPs
-def fetch_malicious_ips():
-    malicious_ips = set()
-
-    try:
-        # Fetch from Spamhaus
-        response = requests.get(THREAT_FEEDS["Spamhaus"])
-        if response.status_code == 200:
-            for line in response.text.split("\n"):
-                if line and not line.startswith(";"):
-                    malicious_ips.add(line.strip())
-
-        # Fetch from FireHOL
-        response = requests.get(THREAT_FEEDS["FireHOL"])
-        if response.status_code == 200:
-            for line in response.text.split("\n"):
-                if line and "." in line:
-                    malicious_ips.add(line.strip())
-
-        # Fetch from AlienVault
-        response = requests.get(THREAT_FEEDS["AlienVault"])
-        if response.status_code == 200:
-            for line in response.text.split("\n"):
-                if not line.startswith("#") and "\t" in line:
-                    ip = line.split("\t")[0]
-                    malicious_ips.add(ip)
-
-        logging.info(f"Fetched {len(malicious_ips)} malicious IPs.")
-    except Exception as e:
-        logging.error(f"Error fetching threat feeds: {e}")
-
-    return list(malicious_ips)
+def fetch_malicious_ips(feeds=None):
+    return [format_network(key) for key in sorted(fetch_malicious_networks(feeds))]
 
-# Function to Update Azure Firewall Rules
-def update_firewall_rules(malicious_ips):
-    credential = DefaultAzureCredential()
-    network_client = NetworkManagementClient(credential, SUBSCRIPTION_ID)
-
-    # Convert IPs into firewall rules
-    firewall_rules = [
-        NetworkRule(
-            name=f"Block_{ip.replace('.', '_')}",
-            protocols=["TCP", "UDP"],
-            source_addresses=["*"],
-            destination_addresses=[ip],
-            destination_ports=["*"]
-        )
-        for ip in malicious_ips[:100]  # Limit rules to 100 IPs to avoid Azure limits
-    ]
+# Score each network by the feeds that list it: corroborating feeds raise the confidence.
+# A network without known sources (plain address lists, unlisted manager entries) gets the default.
+def network_confidence(sources):
+    if not sources:
+        return float(DEFAULT_CONFIDENCE)
+    miss = 1.0
+    for source in sources:
+        miss *= 1.0 - FEED_CONFIDENCE.get(source, DEFAULT_CONFIDENCE) / 100.0
+    return round(100.0 * (1.0 - miss), 2)
 
-    # Define Rule Collection
-    rule_collection = NetworkRuleCollection(
-        name=RULE_COLLECTION_NAME,
-        priority=200,  # Ensure priority is correct (lower number = higher priority)
-        action={"type": "Deny"},
-        rules=firewall_rules,
-        rule_collection_type=RuleCollectionType.NetworkRule
+# Function to Collapse Malicious Networks into the Rule Budget
+def select_blocked_networks(malicious_networks, budget=RULE_BUDGET):
+    """
+    Aggregate {key: [feed names]} into minimal CIDR blocks and keep the best `budget` of them.
+
+    A plain list of address strings is accepted too, every entry then having the default confidence.
+    """
+    if not isinstance(malicious_networks, dict):
+        malicious_networks = {
+            key: [] for key in (parse_network(ip) for ip in malicious_networks) if key is not None
+        }
+    confidences = {key: network_confidence(sources) for key, sources in malicious_networks.items()}
+    blocks = aggregate_networks(confidences)
+    selected, report = select_within_budget(blocks, budget, raw_count=len(malicious_networks))
+    logging.info(
+        f"Aggregated {report['raw_entries']} entries into {report['aggregated_prefixes']} prefixes; "
+        f"keeping {report['selected_prefixes']} ({report['address_coverage']:.1%} of addresses, "
+        f"{report['score_coverage']:.1%} of score)."
     )
+    return [format_network(key) for key, _ in selected], report
 
-    # Fetch Existing Firewall
-    firewall = network_client.azure_firewalls.get(RESOURCE_GROUP, FIREWALL_NAME)
+# Function to Update Azure Firewall Rules
+def update_firewall_rules(malicious_networks):
+    # The SDK models are only imported once there is something to block.
+    from azure.mgmt.network.models import (
+        AzureFirewallNetworkRule, AzureFirewallNetworkRuleCollection, AzureFirewallRCAction
+    )
+    network_client = get_network_client(SUBSCRIPTION_ID)
 
-    # Update Rule Collections
-    updated_collections = []
-    existing_rule_found = False
-    for collection in (firewall.network_rule_collections or []):
-        if collection.name == RULE_COLLECTION_NAME:
-            updated_collections.append(rule_collection)
-            existing_rule_found = True
-        else:
-            updated_collections.append(collection)
+    # Collapse the blocklist into as few prefixes as possible before spending the rule budget.
+    prefixes, coverage = select_blocked_networks(malicious_networks)
 
-    if not existing_rule_found:
-        updated_collections.append(rule_collection)
+    # Pack the prefixes into multi-address rules over several stably-named collections.
+    rule_collections = [
+        AzureFirewallNetworkRuleCollection(
+            name=shard["name"],
+            priority=shard["priority"],  # Ensure priority is correct (lower number = higher priority)
+            action=AzureFirewallRCAction(type=shard["action"]),
+            rules=[AzureFirewallNetworkRule(**rule) for rule in shard["rules"]]
+        )
+        for shard in shard_blocklist(prefixes, RULE_COLLECTION_NAME, RULE_COLLECTION_PRIORITY, "Deny", SHARD_LIMITS)
+    ]
 
-    firewall.network_rule_collections = updated_collections
+    # Fetch Existing Firewall
+    with span("arm_get", firewall=FIREWALL_NAME):
+        firewall = network_client.azure_firewalls.get(RESOURCE_GROUP, FIREWALL_NAME)
+
+    # Diff against the deployed shards; collections we don't manage are never touched.
+    current_collections = firewall.network_rule_collections or []
+    diff = diff_collections(rule_collections, current_collections,
+                            managed=lambda name: is_shard_of(name, RULE_COLLECTION_NAME))
+    coverage["diff"] = diff.summary()
+    rule_count = sum(len(c.rules) for c in rule_collections)
+    logging.info(f"Blocking {len(prefixes)} prefixes with {rule_count} rules "
+                 f"in {len(rule_collections)} collections; diff {diff.summary()}.")
+    set_gauge("blocklist_prefixes", len(prefixes))
+    set_gauge("firewall_rules_emitted", rule_count, collection=RULE_COLLECTION_NAME)
+    set_gauge("firewall_collections_emitted", len(rule_collections), collection=RULE_COLLECTION_NAME)
+    if not diff.has_changes:
+        logging.info("Azure Firewall blocklist already up to date; skipping update.")
+        return coverage
 
-    # Apply Changes
-    poller = network_client.azure_firewalls.begin_create_or_update(RESOURCE_GROUP, FIREWALL_NAME, firewall)
-    poller.result()
+    # Apply Changes: only the added, changed and removed shards differ from the current config.
+    firewall.network_rule_collections = apply_diff(current_collections, rule_collections, diff)
+    with span("arm_update", firewall=FIREWALL_NAME):
+        poller = network_client.azure_firewalls.begin_create_or_update(RESOURCE_GROUP, FIREWALL_NAME, firewall)
+        poller.result()
 
     logging.info("✅ Malicious IPs successfully blocked in Azure Firewall!")
+    return coverage
 
 # Function to Store Blocked IPs in MongoDB
-def store_blocked_ips_in_mongodb(malicious_ips):
-    client = MongoClient(MONGO_URI)
-    db = client[MONGO_DB]
-    collection = db[MONGO_COLLECTION]
+def store_blocked_ips_in_mongodb(malicious_networks, delta=None):
+    """
+    Sync {key: [feed names]} (or a plain list of addresses) into the indexed blocklist store.
 
-    # Prepare data for insertion
-    data = [{"ip": ip, "blocked_at": datetime.datetime.utcnow()} for ip in malicious_ips]
+    With a SnapshotDiff as `delta`, only its added, changed and removed networks are written. A
+    full delta (no previous snapshot) falls back to sync(), since its removals are unknown.
+    """
+    if not isinstance(malicious_networks, dict):
+        malicious_networks = {
+            key: [] for key in (parse_network(ip) for ip in malicious_networks) if key is not None
+        }
+    entries = {
+        format_network(key): {"sources": sources, "confidence": network_confidence(sources)}
+        for key, sources in malicious_networks.items()
+    }
 
-    # Insert data into MongoDB
-    collection.insert_many(data)
+    # Only new, changed and due-for-refresh networks are written.
+    store = BlocklistStore.from_uri(MONGO_URI, MONGO_DB, MONGO_COLLECTION)
+    if delta is None or delta.full:
+        counts = store.sync(entries)
+    else:
+        counts = store.apply_delta(
+            {format_network(key): entries[format_network(key)] for key in delta.added},
+            {format_network(key): entries[format_network(key)] for key in delta.changed},
+            [format_network(key) for key in delta.removed],
+            list(entries),
+        )
+    inc_counts("sink_operations_total", counts, sink="mongodb")
     logging.info("✅ Blocked IPs successfully stored in MongoDB!")
+    return counts
 
 # Function to Store Blocked IPs in Azure Table Storage
-def store_blocked_ips_in_azure_table(malicious_ips):
-    table_service_client = TableServiceClient(account_url=f"https://{STORAGE_ACCOUNT_NAME}.table.core.windows.net", credential=STORAGE_ACCOUNT_KEY)
-    table_client = table_service_client.get_table_client(table_name=TABLE_NAME)
+def store_blocked_ips_in_azure_table(malicious_networks, delta=None):
+    """
+    Write the delta of {key: [feed names]} (or a plain list of addresses) to Table Storage.
 
-    # Prepare data for insertion
-    data = [{"PartitionKey": "BlockedIP", "RowKey": ip, "BlockedAt": datetime.datetime.utcnow().isoformat()} for ip in malicious_ips]
+    With a SnapshotDiff as `delta`, the table is not listed and only that delta is written. A full
+    delta (no previous snapshot) resyncs the table and deletes the rows that are no longer listed.
+    """
+    global _legacy_partition_deleted
+    if not isinstance(malicious_networks, dict):
+        malicious_networks = {
+            key: [] for key in (parse_network(ip) for ip in malicious_networks) if key is not None
+        }
+    table_client = get_table_client(f"https://{STORAGE_ACCOUNT_NAME}.table.core.windows.net", TABLE_NAME,
+                                    credential=STORAGE_ACCOUNT_KEY)
 
-    # Insert data into Azure Table Storage
-    for entity in data:
-        table_client.upsert_entity(entity=entity, mode=UpdateMode.MERGE)
+    # Rows are sharded by /16 partition and written in concurrent 100-entity transactions.
+    entries = {
+        key: {"sources": sources, "confidence": network_confidence(sources)}
+        for key, sources in malicious_networks.items()
+    }
+    writer = TableWriter(table_client)
+    if not _legacy_partition_deleted:
+        inc_counts("sink_operations_total", writer.delete_partition(LEGACY_TABLE_PARTITION), sink="table_legacy")
+        _legacy_partition_deleted = True
+    if delta is None:
+        counts = writer.sync(entries)
+    elif delta.full:
+        counts = writer.sync(entries, delete_missing=True)
+    else:
+        counts = writer.apply_delta({key: entries[key] for key in delta.added},
+                                    {key: entries[key] for key in delta.changed}, delta.removed)
+    inc_counts("sink_operations_total", counts, sink="table")
     logging.info("✅ Blocked IPs successfully stored in Azure Table Storage!")
+    return counts
+
+# Rank this run's networks in the persistent, aging blocklist and keep its top RULE_BUDGET.
+# `hits` ({network key: count}, see load_flow_log_hits) raises the score of networks that traffic still hits.
+def rank_blocklist(networks, snapshot, delta, snapshot_path=SNAPSHOT_PATH, state_path=MANAGER_STATE_PATH, now=None,
+                   hits=None):
+    now = time.time() if now is None else now
+    manager = load_manager(state_path, RULE_BUDGET)
+    # The delta is only enough if the manager last saw exactly the previous snapshot.
+    previous = load_previous(snapshot_path, verify=False)
+    if previous is not None and manager.source_checksum == previous.checksum:
+        manager.apply_delta(networks, delta, network_confidence, now)
+    else:
+        manager.sync(networks, network_confidence, now)
+    if hits:
+        logging.info(f"Flow-log hits matched {manager.record_hits(hits, now)} of {len(hits)} networks.")
+    report = manager.tick(now)
+    manager.source_checksum = snapshot.checksum
+    # Saved before the firewall stage, so the active set stays pending until confirm_blocklist_deployed().
+    manager.deploy_pending |= bool(report["promoted"] or report["demoted"])
+    manager.save(state_path)
+    set_gauge("blocklist_tracked_networks", report["tracked"])
+    set_gauge("blocklist_active_networks", report["active"])
+    logging.info(f"Blocklist ranking: {len(report['promoted'])} promoted, {len(report['demoted'])} demoted, "
+                 f"{report['expired']} expired, {report['active']} active of {report['tracked']} tracked.")
+    return {"networks": manager.active_networks(), "changed": manager.deploy_pending, "report": report}
+
+# The firewall now has the ranked networks; a failed PUT leaves them pending for the next run.
+def confirm_blocklist_deployed(state_path=MANAGER_STATE_PATH):
+    manager = load_manager(state_path, RULE_BUDGET)
+    manager.deploy_pending = False
+    manager.save(state_path)
+
+def load_flow_log_hits(path):
+    """{network key: count} from a flow-log hits file; {} when there is none. Unparsable networks are skipped."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        counts = json.load(f)
+    hits = {}
+    for text, count in counts.items():
+        key = parse_network(text)
+        if key is not None:
+            hits[key] = hits.get(key, 0) + int(count)
+    return hits
+
+# Claims the export by renaming it, so hits written meanwhile wait for the next run and a failed ranking
+# retries the same claimed file instead of counting it twice.
+def rank_with_flow_log_hits(networks, snapshot, delta, snapshot_path, state_path, hits_path):
+    claimed = hits_path and hits_path + ".claimed"
+    if claimed and not os.path.exists(claimed) and os.path.exists(hits_path):
+        os.replace(hits_path, claimed)
+    ranked = rank_blocklist(networks, snapshot, delta, snapshot_path, state_path, hits=load_flow_log_hits(claimed))
+    if claimed and os.path.exists(claimed):
+        os.remove(claimed)
+    return ranked
+
+def blocklist_snapshot(networks):
+    return BlocklistSnapshot.from_networks(
+        networks, {key: network_confidence(sources) for key, sources in networks.items()}
+    )
+
+# The blocklist refresh as a stage graph: feeds stream into normalization as they finish, and the
+# firewall PUT, MongoDB and Table Storage writes run concurrently once the diff is known.
+def build_blocklist_pipeline(feeds=None, snapshot_path=SNAPSHOT_PATH, feed_cache_dir=FEED_CACHE_DIR,
+                             manager_state_path=MANAGER_STATE_PATH, flow_log_hits_path=FLOW_LOG_HITS_PATH):
+    pipeline = Pipeline("blocklist")
+    pipeline.add("feeds", lambda: iter_feeds(THREAT_FEEDS if feeds is None else feeds, cache_dir=feed_cache_dir),
+                 stream=True)
+    pipeline.add("networks", lambda feeds: collect_networks(feeds), deps=["feeds"])
+    pipeline.add("snapshot", lambda networks: blocklist_snapshot(networks), deps=["networks"],
+                 when=lambda networks: bool(networks))
+    # Diff against the last applied snapshot; an unchanged blocklist touches nothing downstream.
+    pipeline.add("delta", lambda snapshot: diff(load_previous(snapshot_path), snapshot), deps=["snapshot"])
+    if manager_state_path:
+        # With a scored blocklist, the firewall gets only the ranked top RULE_BUDGET networks.
+        pipeline.add("ranked", lambda networks, snapshot, delta: rank_with_flow_log_hits(
+            networks, snapshot, delta, snapshot_path, manager_state_path, flow_log_hits_path),
+            deps=["networks", "snapshot", "delta"])
+        pipeline.add("firewall", lambda ranked, delta: update_firewall_rules(ranked["networks"]),
+                     deps=["ranked", "delta"], when=lambda ranked, delta: delta.has_changes or ranked["changed"])
+        pipeline.add("deployed", lambda firewall: confirm_blocklist_deployed(manager_state_path), deps=["firewall"])
+    else:
+        pipeline.add("firewall", lambda networks, delta: update_firewall_rules(networks), deps=["networks", "delta"],
+                     when=lambda networks, delta: delta.has_changes)
+    # Runs even when nothing changed, to keep the MongoDB TTL from expiring unchanged networks.
+    pipeline.add("mongodb", lambda networks, delta: store_blocked_ips_in_mongodb(networks, delta),
+                 deps=["networks", "delta"])
+    pipeline.add("table", lambda networks, delta: store_blocked_ips_in_azure_table(networks, delta),
+                 deps=["networks", "delta"], when=lambda networks, delta: delta.has_changes)
+    # The snapshot only advances once every sink has applied the delta.
+    pipeline.add("commit", lambda snapshot, firewall, mongodb, table: snapshot.write(snapshot_path),
+                 deps=["snapshot", "firewall", "mongodb", "table"])
+    return pipeline
 
 # Main Execution
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
-    logging.info("🔥 Fetching Malicious IPs...")
-    
-    malicious_ips = fetch_malicious_ips()
-    if malicious_ips:
-        logging.info(f"🚀 Updating Azure Firewall with {len(malicious_ips)} malicious IPs...")
-        update_firewall_rules(malicious_ips)
-        logging.info("💾 Storing blocked IPs in MongoDB...")
-        store_blocked_ips_in_mongodb(malicious_ips)
-        logging.info("💾 Storing blocked IPs in Azure Table Storage...")
-        store_blocked_ips_in_azure_table(malicious_ips)
-    else:
+    logging.info("🔥 Fetching Malicious IPs and updating the blocklist sinks...")
+
+    report = build_blocklist_pipeline().run()
+    delta = report.value("delta")
+    if report.stages["snapshot"].status == "skipped" and report.value("networks") is not None:
         logging.warning("⚠️ No malicious IPs fetched. Firewall update skipped.")
+    elif delta is not None:
+        logging.info(f"📊 Blocklist changes since the last run: {delta.summary()}")
+        if not delta.has_changes:
+            logging.info("✅ Blocklist unchanged. Firewall and Table Storage updates skipped.")
+    if not report.ok:
+        logging.error(f"❌ Failed stages: {report.failed}")
+    logging.info(f"⏱️ {report.summary()}")
+    write_metrics()
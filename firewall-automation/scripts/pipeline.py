@@ -0,0 +1,261 @@
+"""
+pipeline.py
+
+A small runner for staged jobs whose steps form a dependency graph.
+
+Each stage is a function plus the names of the stages it depends on. A stage starts as soon as
+all of its dependencies have finished, and it receives their results as keyword arguments
+named after them. Stages that do not depend on each other run concurrently on threads, which
+suits the I/O-bound steps here: feed downloads, ARM calls, MongoDB and Table Storage writes.
+
+A stage fails on its own. The stages that depend on it are skipped, and every independent
+stage still runs, so a Table Storage outage does not block the MongoDB write. A `when`
+predicate, which receives the same keyword arguments, can skip a stage (and its dependents)
+when there is nothing to do. Values passed to run() act as already finished stages.
+
+A stage with stream=True returns an iterable instead of a value. Its items are handed to its
+single dependent through a bounded queue while they are produced. The dependent starts right
+away and iterates them, and a slow consumer makes the producer block once the queue is full.
+
+run() returns a PipelineReport with per-stage status, timings and the end-to-end wall time.
+These timings are also recorded as the pipeline_stage_seconds and pipeline_seconds histograms
+when instrumentation is enabled.
+
+Usage:
+  pipeline = Pipeline("blocklist")
+  pipeline.add("feeds", iter_feeds, stream=True)
+  pipeline.add("networks", collect_networks, deps=["feeds"])
+  pipeline.add("mongodb", store, deps=["networks"])
+  pipeline.add("table", write_table, deps=["networks"], when=lambda networks: bool(networks))
+  report = pipeline.run()
+  logging.info(report.summary())
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from MyFirewallFunctionProj.instrumentation import observe
+
+QUEUE_SIZE = 64     # items buffered between a streaming stage and its consumer
+OK, FAILED, SKIPPED = "ok", "failed", "skipped"
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+class BoundedStream:
+    """Iterator over a producer's items, with at most `maxsize` of them buffered."""
+
+    def __init__(self, maxsize=QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize)
+        self._closed = threading.Event()
+
+    def _put(self, item):
+        # Give up once the consumer has gone away, instead of blocking on a full queue forever.
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(self, iterable):
+        """Feed `iterable` into the stream; the error of a failing producer reaches the consumer."""
+        try:
+            for item in iterable:
+                if not self._put(item):
+                    return
+        except BaseException as e:
+            self._put(_Failure(e))
+            raise
+        self._put(_DONE)
+
+    def close(self):
+        self._closed.set()
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+
+
+class Stage:
+    def __init__(self, name, func, deps=(), when=None, stream=False, queue_size=QUEUE_SIZE):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.when = when
+        self.stream = stream
+        self.queue_size = queue_size
+
+
+class StageResult:
+    """Outcome of one stage. started and elapsed are seconds, started relative to the run."""
+
+    def __init__(self, name, status, value=None, error=None, started=0.0, elapsed=0.0):
+        self.name = name
+        self.status = status
+        self.value = value
+        self.error = error
+        self.started = started
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return f"StageResult({self.name!r}, {self.status!r}, started={self.started:.3f}, elapsed={self.elapsed:.3f})"
+
+
+class PipelineReport:
+    def __init__(self, name, stages, wall_time):
+        self.name = name
+        self.stages = stages
+        self.wall_time = wall_time
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    @property
+    def failed(self):
+        return [name for name, result in self.stages.items() if result.status == FAILED]
+
+    def value(self, name, default=None):
+        result = self.stages.get(name)
+        return result.value if result is not None and result.status == OK else default
+
+    def summary(self):
+        parts = [f"{name} {result.status} {result.elapsed:.2f}s" for name, result in self.stages.items()]
+        return f"{self.name}: {', '.join(parts)}; wall time {self.wall_time:.2f}s"
+
+    def as_dict(self):
+        return {
+            "wall_time": self.wall_time,
+            "stages": {
+                name: {"status": result.status, "started": result.started, "elapsed": result.elapsed,
+                       "error": None if result.error is None else repr(result.error)}
+                for name, result in self.stages.items()
+            },
+        }
+
+
+class Pipeline:
+    def __init__(self, name="pipeline"):
+        self.name = name
+        self.stages = {}
+
+    def add(self, name, func, deps=(), when=None, stream=False, queue_size=QUEUE_SIZE):
+        """Add a stage. Dependencies must be stages added earlier or inputs given to run()."""
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage {name!r}")
+        for dep in deps:
+            upstream = self.stages.get(dep)
+            if upstream is not None and upstream.stream and any(dep in stage.deps for stage in self.stages.values()):
+                raise ValueError(f"Streaming stage {dep!r} can only feed one consumer")
+        self.stages[name] = Stage(name, func, deps, when, stream, queue_size)
+        return self
+
+    def run(self, **inputs):
+        """Run every stage and return a PipelineReport; stage errors are reported, not raised."""
+        seen = set(inputs)
+        consumers = {dep for stage in self.stages.values() for dep in stage.deps}
+        for stage in self.stages.values():
+            missing = [dep for dep in stage.deps if dep not in seen]
+            if missing:
+                raise ValueError(f"Stage {stage.name!r} depends on unknown or later stages {missing}")
+            if stage.stream and stage.name not in consumers:
+                raise ValueError(f"Streaming stage {stage.name!r} has no consumer")
+            seen.add(stage.name)
+
+        start = time.perf_counter()
+        results = {}
+        values = dict(inputs)           # finished stages, plus the live iterator of running streams
+        pending = list(self.stages.values())
+        running = {}
+
+        def finished(name):
+            return name in inputs or name in results
+
+        def available(name):
+            return finished(name) or (self.stages[name].stream and name in values)
+
+        def release(stage):
+            # A consumer that stops, fails or never starts lets its producer finish.
+            for dep in stage.deps:
+                if isinstance(values.get(dep), BoundedStream):
+                    values[dep].close()
+
+        def call(stage, kwargs, stream):
+            began = time.perf_counter()
+            try:
+                if stream is not None:
+                    stream.produce(stage.func(**kwargs))
+                    value = None
+                else:
+                    value = stage.func(**kwargs)
+                return StageResult(stage.name, OK, value, started=began - start, elapsed=time.perf_counter() - began)
+            except Exception as e:
+                logging.error(f"Stage {stage.name} failed: {e}")
+                return StageResult(stage.name, FAILED, error=e, started=began - start,
+                                   elapsed=time.perf_counter() - began)
+            finally:
+                release(stage)
+
+        with ThreadPoolExecutor(max_workers=max(1, len(self.stages))) as pool:
+            while pending or running:
+                for stage in list(pending):
+                    blocked = [dep for dep in stage.deps
+                               if finished(dep) and dep not in inputs and results[dep].status != OK]
+                    if blocked:
+                        pending.remove(stage)
+                        release(stage)
+                        results[stage.name] = StageResult(stage.name, SKIPPED, error=f"upstream {blocked} did not complete",
+                                                          started=time.perf_counter() - start)
+                        continue
+                    if not all(available(dep) for dep in stage.deps):
+                        continue
+                    pending.remove(stage)
+                    kwargs = {dep: values[dep] for dep in stage.deps}
+                    try:
+                        run_stage = stage.when is None or stage.when(**kwargs)
+                    except Exception as e:
+                        logging.error(f"Stage {stage.name} condition failed: {e}")
+                        release(stage)
+                        results[stage.name] = StageResult(stage.name, FAILED, error=e, started=time.perf_counter() - start)
+                        continue
+                    if not run_stage:
+                        release(stage)
+                        results[stage.name] = StageResult(stage.name, SKIPPED, started=time.perf_counter() - start)
+                        continue
+                    stream = BoundedStream(stage.queue_size) if stage.stream else None
+                    if stream is not None:
+                        values[stage.name] = stream
+                    running[pool.submit(call, stage, kwargs, stream)] = stage
+
+                if not running:
+                    # Dependencies always come earlier, so one pass settles every stage that is left.
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    result = future.result()
+                    results[stage.name] = result
+                    if not stage.stream:
+                        values[stage.name] = result.value
+                    logging.info(f"Stage {stage.name} {result.status} in {result.elapsed:.2f}s")
+                    observe("pipeline_stage_seconds", result.elapsed, pipeline=self.name, stage=stage.name,
+                            status=result.status)
+
+        ordered = {name: results[name] for name in self.stages}
+        report = PipelineReport(self.name, ordered, time.perf_counter() - start)
+        observe("pipeline_seconds", report.wall_time, pipeline=self.name, ok=report.ok)
+        return report
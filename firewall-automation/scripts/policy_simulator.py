@@ -0,0 +1,186 @@
+"""
+policy_simulator.py
+
+Offline replay of flow logs against a rules.py-style rule set, vectorized with NumPy.
+
+A rule set is compiled once into per-dimension lookup tables. The interval boundaries of all
+rules cut each dimension (source, destination, port, protocol) into elementary segments, and
+every segment stores a bitset of the rules that match in that dimension. A flow is classified by
+locating its segment in each dimension and ANDing the four bitsets. The lowest set bit is the
+first-matching rule by priority, and flows that match no rule get the default verdict.
+Addresses are located with searchsorted, while ports and protocols use direct lookup tables.
+
+Flows are NumPy columns: uint32 "src" and "dst" (IPv4), an integer "port", and "protocol" codes
+in rule_analyzer.PROTOCOLS order. flow_columns() builds them from (src, dst, port, protocol)
+records. simulate() evaluates a flow log in chunks over a process pool. It reports per-rule hit
+counts and, when the deployed rule set is given, the flows whose verdict would change.
+
+Usage:
+  flows = flow_columns([("198.51.100.4", "20.169.181.2", 22, "TCP"), ...])
+  report = simulate(new_rules, flows, current_rules=firewall_rules, max_workers=4)
+  report["hit_counts"], report["changed"]
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from scripts.feed_parser import parse_network
+from scripts.rule_analyzer import IPV6_OFFSET, PROTOCOLS, compile_rules
+
+CHUNK_SIZE = 1 << 16        # flows per vectorized step (bounds the temporary bitset arrays)
+CHUNKS_PER_WORKER = 4
+DEFAULT_VERDICT = "Deny"    # Azure Firewall denies traffic that no rule allows
+NO_MATCH = -1
+
+
+def _segment_table(intervals_per_rule, limit):
+    """Segment starts and the (segments, words) bitset of rules matching each segment."""
+    cuts = {0}
+    for intervals in intervals_per_rule:
+        for lo, hi in intervals:
+            if lo < limit:
+                cuts.add(lo)
+            if hi + 1 < limit:
+                cuts.add(hi + 1)
+    starts = np.array(sorted(cuts), dtype=np.uint64)
+    words = max(1, (len(intervals_per_rule) + 63) // 64)
+    bits = np.zeros((len(starts), words), dtype=np.uint64)
+    for rule, intervals in enumerate(intervals_per_rule):
+        word, bit = divmod(rule, 64)
+        for lo, hi in intervals:
+            if lo >= limit:
+                continue
+            first = np.searchsorted(starts, lo, side="right") - 1
+            last = np.searchsorted(starts, min(hi, limit - 1), side="right") - 1
+            bits[first:last + 1, word] |= np.uint64(1 << bit)
+    return starts, bits
+
+
+class CompiledPolicy:
+    """Lookup tables for one rule set; rule i is the i-th rule in priority order."""
+
+    def __init__(self, rules, default_action="Allow", default_verdict=DEFAULT_VERDICT):
+        boxes = compile_rules(rules, default_action)
+        self.names = [box.name for box in boxes]
+        self.allows = np.array([box.action == "Allow" for box in boxes] + [default_verdict == "Allow"])
+        # IPv6 lives above IPV6_OFFSET on the analyzer's address axis; flows here are IPv4.
+        self.src_starts, self.src_bits = _segment_table([box.dims[0] for box in boxes], IPV6_OFFSET)
+        self.dst_starts, self.dst_bits = _segment_table([box.dims[1] for box in boxes], IPV6_OFFSET)
+        port_starts, port_bits = _segment_table([box.dims[2] for box in boxes], 1 << 16)
+        proto_starts, proto_bits = _segment_table([box.dims[3] for box in boxes], len(PROTOCOLS))
+        # Ports and protocols skip the binary search: a direct table maps each port to its segment,
+        # and the port and protocol bitsets are pre-ANDed into one (port segment, protocol) table.
+        port_segment = np.searchsorted(port_starts, np.arange(1 << 16, dtype=np.uint64), side="right") - 1
+        proto_segment = np.searchsorted(proto_starts, np.arange(len(PROTOCOLS), dtype=np.uint64), side="right") - 1
+        self.port_row = (port_segment * len(PROTOCOLS)).astype(np.int32)
+        self.service_bits = (port_bits[:, None, :] & proto_bits[proto_segment][None, :, :]).reshape(-1, port_bits.shape[1])
+
+    def __len__(self):
+        return len(self.names)
+
+    def match(self, src, dst, port, protocol):
+        """Index of the first matching rule for each flow, or NO_MATCH."""
+        if not len(self.names):
+            return np.full(len(src), NO_MATCH, dtype=np.int32)
+        result = np.empty(len(src), dtype=np.int32)
+        for offset in range(0, len(src), CHUNK_SIZE):
+            end = offset + CHUNK_SIZE
+            bits = self.src_bits[np.searchsorted(self.src_starts, src[offset:end].astype(np.uint64), side="right") - 1]
+            bits &= self.dst_bits[np.searchsorted(self.dst_starts, dst[offset:end].astype(np.uint64), side="right") - 1]
+            bits &= self.service_bits[self.port_row[port[offset:end]] + protocol[offset:end]]
+            nonzero = bits != 0
+            word = nonzero.argmax(axis=1)
+            value = bits[np.arange(len(bits)), word]
+            lowest = value & (~value + np.uint64(1))
+            rule = word * 64 + np.log2(lowest.astype(np.float64), where=lowest != 0, out=np.zeros(len(value))).astype(np.int64)
+            result[offset:end] = np.where(nonzero.any(axis=1), rule, NO_MATCH)
+        return result
+
+    def verdicts(self, matches):
+        """True where the flow is allowed."""
+        return self.allows[matches]   # NO_MATCH (-1) indexes the default verdict at the end
+
+
+def flow_columns(records):
+    """NumPy flow columns from (src, dst, port, protocol) records of IPv4 strings."""
+    src, dst, port, protocol = [], [], [], []
+    codes = {name: code for code, name in enumerate(PROTOCOLS)}
+    for s, d, p, proto in records:
+        s_key, d_key = parse_network(s), parse_network(d)
+        if s_key is None or d_key is None or s_key[0] != 4 or d_key[0] != 4:
+            raise ValueError(f"Only IPv4 flows can be simulated: {s} -> {d}")
+        src.append(s_key[1])
+        dst.append(d_key[1])
+        port.append(int(p))
+        protocol.append(codes[str(proto).upper()])
+    return {
+        "src": np.array(src, dtype=np.uint32),
+        "dst": np.array(dst, dtype=np.uint32),
+        "port": np.array(port, dtype=np.uint16),
+        "protocol": np.array(protocol, dtype=np.uint8),
+    }
+
+
+_worker_policies = None
+
+
+def _init_worker(new_rules, current_rules, default_action, default_verdict):
+    global _worker_policies
+    _worker_policies = _compile_pair(new_rules, current_rules, default_action, default_verdict)
+
+
+def _compile_pair(new_rules, current_rules, default_action, default_verdict):
+    new = CompiledPolicy(new_rules, default_action, default_verdict)
+    current = CompiledPolicy(current_rules, default_action, default_verdict) if current_rules is not None else None
+    return new, current
+
+
+def _evaluate_chunk(args, policies=None):
+    offset, flows = args
+    new, current = policies or _worker_policies
+    columns = (flows["src"], flows["dst"], flows["port"], flows["protocol"])
+    matches = new.match(*columns)
+    allowed = new.verdicts(matches)
+    hits = np.bincount(matches + 1, minlength=len(new) + 1)   # slot 0 counts unmatched flows
+    changed = None
+    if current is not None:
+        changed = np.flatnonzero(current.verdicts(current.match(*columns)) != allowed) + offset
+    return hits, int(allowed.sum()), changed
+
+
+def simulate(rules, flows, current_rules=None, default_action="Allow", default_verdict=DEFAULT_VERDICT,
+             max_workers=None, chunk_size=None):
+    """
+    Replay `flows` against `rules` (and optionally the deployed `current_rules`).
+
+    Returns {"flows", "allowed", "denied", "hit_counts": {rule or "<default>": hits},
+    "changed": indices of flows whose verdict differs from current_rules, or None}.
+    max_workers defaults to os.cpu_count(); with one worker everything runs in-process.
+    """
+    total = len(flows["src"])
+    max_workers = max_workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(CHUNK_SIZE, -(-total // (max_workers * CHUNKS_PER_WORKER)))
+    chunks = [
+        (offset, {name: column[offset:offset + chunk_size] for name, column in flows.items()})
+        for offset in range(0, total, chunk_size)
+    ]
+
+    if max_workers == 1 or len(chunks) <= 1:
+        policies = _compile_pair(rules, current_rules, default_action, default_verdict)
+        results = [_evaluate_chunk(chunk, policies) for chunk in chunks]
+        names = policies[0].names
+    else:
+        names = CompiledPolicy(rules, default_action, default_verdict).names
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(rules, current_rules, default_action, default_verdict)) as pool:
+            results = list(pool.map(_evaluate_chunk, chunks))
+
+    hits = sum((result[0] for result in results), np.zeros(len(names) + 1, dtype=np.int64))
+    allowed = sum(result[1] for result in results)
+    changed = None
+    if current_rules is not None:
+        changed = np.concatenate([result[2] for result in results]) if results else np.zeros(0, dtype=np.int64)
+    hit_counts = {name: int(count) for name, count in zip(names, hits[1:])}
+    hit_counts["<default>"] = int(hits[0])
+    return {"flows": total, "allowed": allowed, "denied": total - allowed, "hit_counts": hit_counts, "changed": changed}
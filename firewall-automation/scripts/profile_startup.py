@@ -0,0 +1,128 @@
+"""
+profile_startup.py
+
+Measures what a cold start of the Function App costs.
+
+For each entry module, a fresh interpreter imports it under `python -X importtime`, and the
+report breaks the import time down by top-level package and by the slowest imports. The first
+invocation is then timed in another fresh interpreter. run_cached() is called against an empty
+solution cache (a miss that imports and runs the optimizer), and then called a second time (the
+warm hit every later tick pays). Deployment to Azure is not part of the measurement.
+
+Results can be appended as JSON lines, so cold starts on the Consumption plan can be tracked
+across commits.
+
+Usage:
+  python -m scripts.profile_startup
+  python -m scripts.profile_startup --module MyFirewallFunctionProj.function_app --top 15 --json startup.jsonl
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_MODULES = ["MyFirewallFunctionProj.function_app", "scripts.update_azure_firewall"]
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)")
+
+FIRST_INVOCATION = """
+import json, time
+start = time.perf_counter()
+from MyFirewallFunctionProj.solution_cache import SolutionCache, run_cached
+imported = time.perf_counter()
+cache = SolutionCache({cache_path!r})
+run_cached(cache=cache)
+first = time.perf_counter()
+run_cached(cache=cache)
+second = time.perf_counter()
+print(json.dumps({{"import_s": imported - start, "first_call_s": first - imported, "warm_call_s": second - first}}))
+"""
+
+
+def _environment():
+    env = dict(os.environ)
+    # Every module is imported package-qualified (MyFirewallFunctionProj.*, scripts.*) from the project root.
+    paths = [PROJECT_ROOT, env.get("PYTHONPATH", "")]
+    env["PYTHONPATH"] = os.pathsep.join(path for path in paths if path)
+    return env
+
+
+def import_profile(module):
+    """Return (wall seconds, [(name, self_us, cumulative_us, depth)]) for importing `module`."""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               capture_output=True, text=True, cwd=PROJECT_ROOT, env=_environment())
+    wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    entries = []
+    for line in completed.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return wall, entries
+
+
+def summarize_imports(entries, top=10):
+    """Self time per top-level package and the `top` slowest imports by cumulative time."""
+    by_package = {}
+    for name, self_us, _, _ in entries:
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+    total_us = sum(self_us for _, self_us, _, _ in entries)
+    return {
+        "total_ms": total_us / 1000,
+        "packages_ms": {package: us / 1000 for package, us in sorted(by_package.items(), key=lambda item: -item[1])[:top]},
+        "slowest_ms": [(name, cumulative / 1000) for name, _, cumulative, _ in sorted(entries, key=lambda e: -e[2])[:top]],
+    }
+
+
+def first_invocation():
+    """Import, first-call (cache miss) and warm-call latency of run_cached() in a fresh process."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        code = FIRST_INVOCATION.format(cache_path=os.path.join(tmpdir, "cache.sqlite3"))
+        completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                   cwd=PROJECT_ROOT, env=_environment())
+    if completed.returncode != 0:
+        raise RuntimeError(f"First invocation failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", action="append", help="entry module to profile (repeatable)")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports and packages to list")
+    parser.add_argument("--json", help="append the results as one JSON line to this file")
+    args = parser.parse_args(argv)
+
+    record = {"timestamp": time.time(), "python": sys.version.split()[0], "modules": {}}
+    for module in args.module or DEFAULT_MODULES:
+        wall, entries = import_profile(module)
+        summary = summarize_imports(entries, args.top)
+        summary["process_wall_s"] = wall
+        record["modules"][module] = summary
+        print(f"{module}: {summary['total_ms']:.1f} ms of imports ({wall:.2f} s process wall time)")
+        for package, ms in summary["packages_ms"].items():
+            print(f"  {package:<40} {ms:8.1f} ms self")
+        print("  slowest (cumulative):")
+        for name, ms in summary["slowest_ms"]:
+            print(f"    {name:<50} {ms:8.1f} ms")
+
+    record["first_invocation"] = first_invocation()
+    latency = record["first_invocation"]
+    print(f"first invocation: import {latency['import_s'] * 1000:.1f} ms, cache miss {latency['first_call_s'] * 1000:.1f} ms, "
+          f"warm hit {latency['warm_call_s'] * 1000:.1f} ms")
+
+    if args.json:
+        with open(args.json, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    return record
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,463 @@
+"""
+rule_analyzer.py
+
+Static analysis of network rule sets in the scripts/rules.py format.
+
+Every rule is a box in four dimensions: source address, destination address, destination port
+and protocol. Each side of a box is a sorted union of intervals. IPv4 and IPv6 share one
+address axis, with IPv6 placed after the 2^32 IPv4 addresses, so "*" is a single interval.
+Rules are evaluated first-match by priority. The analyzer reports:
+
+  shadowed    a rule whose whole box is already matched by higher-priority rules, at least one
+              of them with the opposite action, so it never takes effect as written;
+  redundant   a rule that can be removed without changing any verdict, either because
+              higher-priority rules with the same action cover it, or because a lower-priority
+              rule with the same action covers it and no rule in between with the opposite
+              action overlaps it;
+  correlated  pairs of partially overlapping rules with opposite actions, where the verdict of
+              the overlap depends on priority order;
+  mergeable   groups of same-action rules identical in three dimensions whose fourth dimension
+              can be unioned into one rule.
+
+minimized is an equivalent rule set: shadowed and redundant rules are dropped and mergeable
+groups are folded into their highest-priority member.
+
+Overlapping rules are found through a BoxIndex: one interval index per dimension. Each lookup
+enumerates the dimension in which the rule overlaps the fewest others and checks the remaining
+three, so a wildcard in one dimension does not turn the search into all n^2 pairs.
+
+Usage:
+  report = analyze_rules(firewall_rules)
+  report["shadowed"], report["minimized"]
+  python -m scripts.rule_analyzer            # analyze scripts/rules.py
+"""
+import logging
+from bisect import bisect_left, bisect_right
+
+from scripts.cidr_aggregate import range_to_networks
+from scripts.feed_parser import format_network, parse_network
+
+IPV6_OFFSET = 1 << 32
+ADDRESS_SPACE = ((0, IPV6_OFFSET + (1 << 128) - 1),)
+PORT_SPACE = ((0, 65535),)
+PROTOCOLS = ("TCP", "UDP", "ICMP")
+PROTOCOL_SPACE = ((0, len(PROTOCOLS) - 1),)
+DIMENSIONS = ("source_addresses", "destination_addresses", "destination_ports", "protocols")
+MAX_DIFFERENCE_BOXES = 4096   # give up proving coverage beyond this many leftover pieces
+
+
+# --- interval lists -------------------------------------------------------------------------
+
+def merge_intervals(intervals):
+    """Sorted, disjoint, non-adjacent tuple of (lo, hi) intervals."""
+    merged = []
+    for lo, hi in sorted(intervals):
+        if merged and lo <= merged[-1][1] + 1:
+            if hi > merged[-1][1]:
+                merged[-1] = (merged[-1][0], hi)
+        else:
+            merged.append((lo, hi))
+    return tuple(merged)
+
+
+def intersect_intervals(a, b):
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        lo, hi = max(a[i][0], b[j][0]), min(a[i][1], b[j][1])
+        if lo <= hi:
+            result.append((lo, hi))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return tuple(result)
+
+
+def intervals_overlap(a, b, b_starts):
+    """Whether two interval lists share a point, bisecting `b` (with its lo values in b_starts)."""
+    for lo, hi in a:
+        k = bisect_right(b_starts, hi) - 1
+        if k >= 0 and b[k][1] >= lo:
+            return True
+    return False
+
+
+def subtract_intervals(a, b):
+    result = []
+    j = 0
+    for lo, hi in a:
+        while j < len(b) and b[j][1] < lo:
+            j += 1
+        k = j
+        while k < len(b) and b[k][0] <= hi:
+            if b[k][0] > lo:
+                result.append((lo, b[k][0] - 1))
+            lo = b[k][1] + 1
+            k += 1
+        if lo <= hi:
+            result.append((lo, hi))
+    return tuple(result)
+
+
+def contains_intervals(outer, inner):
+    return not subtract_intervals(inner, outer)
+
+
+# --- parsing and formatting -----------------------------------------------------------------
+
+def _address_interval(text):
+    if "-" in text:
+        first, last = (parse_network(part.strip()) for part in text.split("-", 1))
+        if first is None or last is None or first[0] != last[0]:
+            raise ValueError(f"Unsupported address range: {text!r}")
+        offset = IPV6_OFFSET if first[0] == 6 else 0
+        return offset + first[1], offset + last[1]
+    key = parse_network(text)
+    if key is None:
+        raise ValueError(f"Unsupported address (service tags and FQDNs cannot be analyzed): {text!r}")
+    version, address, prefixlen = key
+    bits = 32 if version == 4 else 128
+    offset = IPV6_OFFSET if version == 6 else 0
+    return offset + address, offset + address + (1 << (bits - prefixlen)) - 1
+
+
+def parse_addresses(values):
+    if not values or "*" in values or "Any" in values:
+        return ADDRESS_SPACE
+    return merge_intervals(_address_interval(value.strip()) for value in values)
+
+
+def parse_ports(values):
+    intervals = []
+    for value in values or ["*"]:
+        value = str(value).strip()
+        if value in ("*", "Any"):
+            return PORT_SPACE
+        lo, _, hi = value.partition("-")
+        lo, hi = int(lo), int(hi or lo)
+        if not 0 <= lo <= hi <= 65535:
+            raise ValueError(f"Invalid port range: {value!r}")
+        intervals.append((lo, hi))
+    return merge_intervals(intervals)
+
+
+def parse_protocols(values):
+    codes = []
+    for value in values or ["Any"]:
+        value = str(value).upper()
+        if value == "ANY":
+            return PROTOCOL_SPACE
+        if value not in PROTOCOLS:
+            raise ValueError(f"Unsupported protocol: {value!r}")
+        codes.append((PROTOCOLS.index(value),) * 2)
+    return merge_intervals(codes)
+
+
+def format_addresses(intervals):
+    if intervals == ADDRESS_SPACE:
+        return ["*"]
+    addresses = []
+    for lo, hi in intervals:
+        for version, offset, first, last in ((4, 0, lo, min(hi, IPV6_OFFSET - 1)), (6, IPV6_OFFSET, max(lo, IPV6_OFFSET), hi)):
+            if first <= last:
+                addresses.extend(format_network(key) for key in range_to_networks(version, first - offset, last - offset))
+    return addresses
+
+
+def format_ports(intervals):
+    if intervals == PORT_SPACE:
+        return ["*"]
+    return [str(lo) if lo == hi else f"{lo}-{hi}" for lo, hi in intervals]
+
+
+def format_protocols(intervals):
+    if intervals == PROTOCOL_SPACE:
+        return ["Any"]
+    return [PROTOCOLS[code] for lo, hi in intervals for code in range(lo, hi + 1)]
+
+
+# --- rule boxes -----------------------------------------------------------------------------
+
+class RuleBox:
+    """A rule compiled to its four interval dimensions, in DIMENSIONS order."""
+
+    def __init__(self, name, priority, action, dims, merged_from=None):
+        self.name = name
+        self.priority = priority
+        self.action = action
+        self.dims = dims
+        self.merged_from = merged_from or [name]
+        self.starts = tuple([lo for lo, _ in dim] for dim in dims)
+
+    def intersects(self, other):
+        for a, b, a_starts, b_starts in zip(self.dims, other.dims, self.starts, other.starts):
+            if len(a) <= len(b):
+                if not intervals_overlap(a, b, b_starts):
+                    return False
+            elif not intervals_overlap(b, a, a_starts):
+                return False
+        return True
+
+    def within(self, other):
+        return all(contains_intervals(b, a) for a, b in zip(self.dims, other.dims))
+
+    def to_rule(self):
+        return {
+            "name": self.name,
+            "protocols": format_protocols(self.dims[3]),
+            "source_addresses": format_addresses(self.dims[0]),
+            "destination_addresses": format_addresses(self.dims[1]),
+            "destination_ports": format_ports(self.dims[2]),
+            "priority": self.priority,
+            "action": self.action,
+        }
+
+    def __repr__(self):
+        return f"RuleBox({self.name!r}, {self.priority}, {self.action!r})"
+
+
+def compile_rules(rules, default_action="Allow"):
+    """RuleBoxes in evaluation order. Rules without a priority keep their list order."""
+    boxes = []
+    for index, rule in enumerate(rules):
+        dims = (
+            parse_addresses(rule.get("source_addresses")),
+            parse_addresses(rule.get("destination_addresses")),
+            parse_ports(rule.get("destination_ports")),
+            parse_protocols(rule.get("protocols")),
+        )
+        action = str(rule.get("action", default_action)).capitalize()
+        boxes.append(RuleBox(rule["name"], rule.get("priority", index), action, dims))
+    boxes.sort(key=lambda box: box.priority)
+    return boxes
+
+
+def box_difference(dims, other):
+    """dims minus other, as a list of disjoint boxes."""
+    if not all(intersect_intervals(a, b) for a, b in zip(dims, other)):
+        return [dims]
+    pieces = []
+    remaining = list(dims)
+    for d in range(len(dims)):
+        outside = subtract_intervals(remaining[d], other[d])
+        if outside:
+            pieces.append(tuple(remaining[:d]) + (outside,) + tuple(remaining[d + 1:]))
+        remaining[d] = intersect_intervals(remaining[d], other[d])
+    return pieces
+
+
+class IntervalIndex:
+    """
+    Static index over (lo, hi, item) intervals of one dimension.
+
+    Intervals are sorted by lo, with a max-hi segment tree over that order. Counting the intervals
+    that overlap a query takes O(log n); listing them takes O((k + 1) log n) for k results.
+    """
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals)
+        self.los = [lo for lo, _, _ in intervals]
+        self.his = [hi for _, hi, _ in intervals]
+        self.items = [item for _, _, item in intervals]
+        self.sorted_his = sorted(self.his)
+        self.size = 1
+        while self.size < len(intervals):
+            self.size *= 2
+        self.max_hi = [-1] * (2 * self.size)
+        self.max_hi[self.size:self.size + len(self.his)] = self.his
+        for node in range(self.size - 1, 0, -1):
+            self.max_hi[node] = max(self.max_hi[2 * node], self.max_hi[2 * node + 1])
+
+    def count(self, lo, hi):
+        """How many intervals overlap [lo, hi]."""
+        return bisect_right(self.los, hi) - bisect_left(self.sorted_his, lo)
+
+    def overlapping(self, lo, hi):
+        """Items of the intervals that overlap [lo, hi]."""
+        first, end = bisect_left(self.los, lo), bisect_right(self.los, hi)
+        found = self.items[first:end]      # starting inside [lo, hi]
+        # Starting before lo: descend only into subtrees of that prefix that reach lo.
+        stack = [(1, 0, self.size)]
+        while stack:
+            node, left, right = stack.pop()
+            if left >= first or self.max_hi[node] < lo:
+                continue
+            if node >= self.size:
+                found.append(self.items[left])
+                continue
+            middle = (left + right) // 2
+            stack.append((2 * node, left, middle))
+            stack.append((2 * node + 1, middle, right))
+        return found
+
+
+class BoxIndex:
+    """Interval indexes over every dimension of a list of RuleBoxes."""
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+        self.dimensions = [
+            IntervalIndex((lo, hi, index) for index, box in enumerate(boxes) for lo, hi in box.dims[d])
+            for d in range(len(DIMENSIONS))
+        ]
+
+    def overlapping(self, box, keep=None):
+        """
+        Sorted indexes of the boxes that share a point with `box` in all four dimensions.
+
+        Candidates come from the dimension where `box` overlaps the fewest boxes. `keep` filters
+        them by index before the full four-dimension check.
+        """
+        d = min(range(len(self.dimensions)),
+                key=lambda d: sum(self.dimensions[d].count(lo, hi) for lo, hi in box.dims[d]))
+        candidates = set()
+        for lo, hi in box.dims[d]:
+            candidates.update(self.dimensions[d].overlapping(lo, hi))
+        return sorted(j for j in candidates if (keep is None or keep(j)) and self.boxes[j].intersects(box))
+
+
+def overlapping_pairs(boxes, index=None):
+    """Index pairs (i < j) of boxes that share a point in all four dimensions."""
+    index = index or BoxIndex(boxes)
+    for i, box in enumerate(boxes):
+        for j in index.overlapping(box, keep=lambda j: j > i):
+            yield i, j
+
+
+def _neighbours(boxes):
+    neighbours = [[] for _ in boxes]
+    for i, j in overlapping_pairs(boxes):
+        neighbours[i].append(j)
+        neighbours[j].append(i)
+    for items in neighbours:
+        items.sort()
+    return neighbours
+
+
+def _covered(box, earlier):
+    """
+    Check whether the boxes in `earlier` (in priority order) cover `box` completely.
+
+    Returns (covered, takers), where takers are the rules that actually match some part of
+    `box` first. covered is None when proving it would take too many pieces.
+    """
+    remaining = [box.dims]
+    takers = []
+    for other in earlier:
+        pieces = [piece for dims in remaining for piece in box_difference(dims, other.dims)]
+        if pieces != remaining:
+            takers.append(other)
+        remaining = pieces
+        if not remaining:
+            return True, takers
+        if len(remaining) > MAX_DIFFERENCE_BOXES:
+            return None, takers
+    return False, takers
+
+
+def find_anomalies(boxes):
+    """Shadowed, redundant and correlated rules among `boxes` (sorted by priority)."""
+    neighbours = _neighbours(boxes)
+    shadowed, redundant, correlated = [], [], []
+    removable = set()
+    for i, box in enumerate(boxes):
+        earlier = [j for j in neighbours[i] if j < i and j not in removable]
+        covered, takers = _covered(box, [boxes[j] for j in earlier]) if earlier else (False, [])
+        if covered:
+            by = [other.name for other in takers]
+            if all(other.action == box.action for other in takers):
+                redundant.append({"rule": box.name, "by": by, "kind": "covered"})
+            else:
+                shadowed.append({"rule": box.name, "by": by})
+            removable.add(i)
+            continue
+        for j in earlier:
+            other = boxes[j]
+            if other.action != box.action and not box.within(other) and not other.within(box):
+                correlated.append({"rule": box.name, "with": other.name})
+        # Downward redundancy: a later same-action rule covers it and nothing in between disagrees.
+        for j in neighbours[i]:
+            if j <= i or j in removable:
+                continue
+            if boxes[j].action != box.action:
+                break
+            if box.within(boxes[j]):
+                redundant.append({"rule": box.name, "by": [boxes[j].name], "kind": "superseded"})
+                removable.add(i)
+                break
+    return shadowed, redundant, correlated, removable
+
+
+def merge_rules(boxes):
+    """
+    Fold same-action rules that differ in one dimension into their highest-priority member.
+
+    A later rule s may only move up to the priority of an earlier rule r if no rule between them
+    with the other action overlaps s. Returns (merged boxes, merge groups as name lists).
+    """
+    index = None
+    changed = True
+    while changed:
+        changed = False
+        for d in range(len(DIMENSIONS)):
+            position = {id(box): i for i, box in enumerate(boxes)}
+            buckets = {}
+            for box in boxes:
+                signature = (box.action,) + box.dims[:d] + box.dims[d + 1:]
+                buckets.setdefault(signature, []).append(box)
+            merged = {}
+            for members in buckets.values():
+                if len(members) < 2:
+                    continue
+                # The index is only rebuilt after a pass that actually merged something.
+                index = index or BoxIndex(boxes)
+                head = members[0]
+                for box in members[1:]:
+                    lo, hi = position[id(head)], position[id(box)]
+                    blocked = index.overlapping(
+                        box, keep=lambda t: lo < t < hi and boxes[t].action != box.action)
+                    if blocked:
+                        head = box
+                        continue
+                    target = merged.get(id(head), head)
+                    dims = list(target.dims)
+                    dims[d] = merge_intervals(target.dims[d] + box.dims[d])
+                    merged[id(head)] = RuleBox(head.name, head.priority, head.action, tuple(dims),
+                                               target.merged_from + box.merged_from)
+                    merged[id(box)] = None
+            if merged:
+                changed = True
+                boxes = [merged.get(id(box), box) for box in boxes]
+                boxes = [box for box in boxes if box is not None]
+                index = None
+    groups = [box.merged_from for box in boxes if len(box.merged_from) > 1]
+    return boxes, groups
+
+
+def analyze_rules(rules, default_action="Allow"):
+    """Analyze a rules.py-style list. Returns a report dict including a minimized rule set."""
+    boxes = compile_rules(rules, default_action)
+    shadowed, redundant, correlated, removable = find_anomalies(boxes)
+    kept = [box for i, box in enumerate(boxes) if i not in removable]
+    minimized, mergeable = merge_rules(kept)
+    report = {
+        "shadowed": shadowed,
+        "redundant": redundant,
+        "correlated": correlated,
+        "mergeable": mergeable,
+        "minimized": [box.to_rule() for box in minimized],
+        "stats": {"rules": len(boxes), "minimized_rules": len(minimized)},
+    }
+    logging.info(f"Rule analysis: {len(shadowed)} shadowed, {len(redundant)} redundant, "
+                 f"{len(correlated)} correlated, {len(mergeable)} merge groups; "
+                 f"{len(boxes)} -> {len(minimized)} rules.")
+    return report
+
+
+if __name__ == "__main__":
+    import json
+    from scripts.rules import firewall_rules
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(analyze_rules(firewall_rules), indent=2))
@@ -0,0 +1,102 @@
+"""
+rule_sharding.py
+
+Packs a blocklist into multi-address network rules spread over several rule collections, within
+configurable per-rule, per-collection and per-firewall limits.
+
+Shard membership is stable across runs. Each prefix is assigned to a collection by a hash of the
+prefix itself, not by its position in the list. When a feed gains or loses a few entries, only
+the collections those entries hash to change, and every other collection is byte-for-byte
+identical to the previous run. A shard only overflows into the next one when it is full.
+
+Collections come out as plain dicts in the same shape as scripts/rules.py:
+
+  {"name": "BlockMaliciousIPs-03", "priority": 203, "action": "Deny",
+   "rules": [{"name": "BlockMaliciousIPs-03-000", "protocols": ["TCP", "UDP"], ...}]}
+
+Usage:
+  collections = shard_blocklist(["203.0.113.0/24", "198.51.100.7", ...])
+"""
+import zlib
+
+MAX_ADDRESSES_PER_RULE = 50
+MAX_RULES_PER_COLLECTION = 100
+MAX_COLLECTIONS = 20
+MAX_ADDRESSES_PER_FIREWALL = 10000
+
+
+class ShardLimits:
+    """Packing limits; the defaults stay well inside Azure Firewall's documented limits."""
+
+    def __init__(self, addresses_per_rule=MAX_ADDRESSES_PER_RULE, rules_per_collection=MAX_RULES_PER_COLLECTION,
+                 collections=MAX_COLLECTIONS, addresses_per_firewall=MAX_ADDRESSES_PER_FIREWALL):
+        self.addresses_per_rule = addresses_per_rule
+        self.rules_per_collection = rules_per_collection
+        self.collections = collections
+        self.addresses_per_firewall = addresses_per_firewall
+
+    @property
+    def addresses_per_collection(self):
+        return self.addresses_per_rule * self.rules_per_collection
+
+    @property
+    def capacity(self):
+        """Most prefixes that fit on one firewall."""
+        return min(self.addresses_per_collection * self.collections, self.addresses_per_firewall)
+
+
+def shard_of(prefix, num_shards):
+    """Stable shard index of a prefix string (crc32, not Python's per-process hash())."""
+    return zlib.crc32(prefix.encode("ascii")) % num_shards
+
+
+def assign_shards(prefixes, limits):
+    """Return one list of prefixes per shard, hashing each prefix to its home shard."""
+    if len(prefixes) > limits.capacity:
+        raise ValueError(f"{len(prefixes)} prefixes exceed the firewall capacity of {limits.capacity}.")
+    shards = [[] for _ in range(limits.collections)]
+    overflow = []
+    for prefix in sorted(prefixes):
+        shard = shards[shard_of(prefix, limits.collections)]
+        if len(shard) < limits.addresses_per_collection:
+            shard.append(prefix)
+        else:
+            overflow.append(prefix)
+    # Linear probing for prefixes whose home shard is full.
+    for prefix in overflow:
+        index = shard_of(prefix, limits.collections)
+        while len(shards[index]) >= limits.addresses_per_collection:
+            index = (index + 1) % limits.collections
+        shards[index].append(prefix)
+    return shards
+
+
+def shard_blocklist(prefixes, base_name="BlockMaliciousIPs", base_priority=200, action="Deny",
+                    limits=None, protocols=("TCP", "UDP")):
+    """Pack prefixes into rule collections named f"{base_name}-NN" with priority base_priority + NN."""
+    limits = limits or ShardLimits()
+    collections = []
+    for index, shard in enumerate(assign_shards(list(prefixes), limits)):
+        if not shard:
+            continue
+        name = f"{base_name}-{index:02d}"
+        shard.sort()
+        rules = []
+        for offset in range(0, len(shard), limits.addresses_per_rule):
+            rules.append({
+                "name": f"{name}-{len(rules):03d}",
+                "protocols": list(protocols),
+                "source_addresses": ["*"],
+                "destination_addresses": shard[offset:offset + limits.addresses_per_rule],
+                "destination_ports": ["*"],
+            })
+        collections.append({"name": name, "priority": base_priority + index, "action": action, "rules": rules})
+    return collections
+
+
+def is_shard_of(collection_name, base_name="BlockMaliciousIPs"):
+    """True for collections produced by shard_blocklist() (and the old unsharded collection)."""
+    if collection_name == base_name:
+        return True
+    prefix = base_name + "-"
+    return collection_name.startswith(prefix) and collection_name[len(prefix):].isdigit()
@@ -0,0 +1,56 @@
+"""
+synthetic_topology.py
+
+Generates synthetic hub-and-spoke topologies and NSR lists in the format accepted by
+MyFirewallFunctionProj.firewall_optimizer, for benchmarks and load tests.
+
+Every region has one hub AP and (region_size - 1) spoke APs; all hubs hang off a single
+"core" AP. Most NSRs connect two spokes of the same region, so regions form independent
+groups unless cross_region_ratio is raised.
+
+Usage:
+  topology, nsrs = generate_topology(1000)
+"""
+import random
+
+
+def generate_topology(num_aps, nsrs_per_ap=1.0, region_size=10, cross_region_ratio=0.05,
+                      deny_ratio=0.7, seed=42):
+    rng = random.Random(seed)
+    region_size = max(2, region_size)
+    num_regions = max(1, (num_aps - 1) // region_size)
+
+    aps = ["core"]
+    links = []
+    regions = []
+    for r in range(num_regions):
+        hub = f"hub{r}"
+        spokes = [f"spoke{r}_{s}" for s in range(region_size - 1)]
+        aps.append(hub)
+        aps.extend(spokes)
+        links.append(["core", hub])
+        links.extend([hub, spoke] for spoke in spokes)
+        regions.append((hub, spokes))
+
+    nsrs = []
+    for i in range(int(len(aps) * nsrs_per_ap)):
+        hub_a, spokes_a = regions[rng.randrange(num_regions)]
+        source = rng.choice(spokes_a)
+        if num_regions > 1 and rng.random() < cross_region_ratio:
+            hub_b, spokes_b = regions[rng.randrange(num_regions)]
+            destination = rng.choice(spokes_b)
+            path = [source, hub_a, "core", hub_b, destination] if hub_b != hub_a else [source, hub_a, destination]
+        else:
+            destination = rng.choice(spokes_a)
+            path = [source, hub_a, destination]
+        if destination == source:
+            path = [source]
+        nsrs.append({
+            "name": f"nsr{i}",
+            "source": source,
+            "destination": destination,
+            "action": "Deny" if rng.random() < deny_ratio else "Allow",
+            "path": path,
+        })
+
+    return {"aps": aps, "links": links, "paths": {}}, nsrs
@@ -0,0 +1,189 @@
+"""
+table_writer.py
+
+Batched, partition-sharded writer for the blocklist in Azure Table Storage.
+
+Rows are spread over partitions by network prefix: the /16 for IPv4 ("v4-203.0") and the /32 for
+IPv6 ("v6-20010db8"). No single partition takes the whole load, and each partition stays small
+enough to diff cheaply. The RowKey is the network string with "/" replaced by "_", because
+Table Storage forbids "/" in keys.
+
+sync() lists the rows that already exist in these partitions (and no others) and writes only
+new or changed rows. When asked, it also deletes rows that are no longer listed. The writes are
+grouped per partition into submit_transaction() batches of at most 100 operations, the service
+maximum. The batches run concurrently on a bounded thread pool, and throttling (429), server
+errors and connection failures are retried with exponential backoff. apply_delta() writes an
+already-known delta (see blocklist_snapshot) without listing the table first. A delete of a row
+that is already gone fails its whole transaction with 404, so that delete is dropped and the rest
+resubmitted: replaying a delta is harmless.
+
+Usage:
+  writer = TableWriter(table_client)
+  writer.sync({(4, 3405803776, 24): {"sources": ["Spamhaus"], "confidence": 80.0}})
+"""
+import datetime
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+from azure.data.tables import UpdateMode
+
+from scripts.feed_parser import format_network
+
+MAX_BATCH_SIZE = 100        # Table Storage limit for one entity group transaction
+MAX_WORKERS = 8
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 0.5
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# Every partition_key() sorts inside one of these ranges ("." is the character after "-"), so
+# rows this writer does not manage are never listed.
+MANAGED_PARTITIONS_FILTER = ("(PartitionKey ge 'v4-' and PartitionKey lt 'v4.') or "
+                             "(PartitionKey ge 'v6-' and PartitionKey lt 'v6.')")
+
+
+def partition_key(key):
+    """Partition of a (version, address, prefixlen) network key: its /16 (IPv4) or /32 (IPv6)."""
+    version, address, _ = key
+    if version == 4:
+        return f"v4-{address >> 24}.{(address >> 16) & 0xFF}"
+    return f"v6-{address >> 96:08x}"
+
+
+def row_key(network):
+    """RowKey for a network string; '/', '\\', '#' and '?' are not allowed in table keys."""
+    return network.replace("/", "_")
+
+
+def _is_retryable(error):
+    if isinstance(error, (ServiceRequestError, ServiceResponseError)):
+        return True
+    return isinstance(error, HttpResponseError) and error.status_code in RETRYABLE_STATUS
+
+
+def _is_missing_row(error):
+    return isinstance(error, HttpResponseError) and error.status_code == 404
+
+
+class TableWriter:
+    """Writes blocklist deltas to one TableClient."""
+
+    def __init__(self, table_client, batch_size=MAX_BATCH_SIZE, max_workers=MAX_WORKERS,
+                 max_retries=MAX_RETRIES, backoff_seconds=BACKOFF_SECONDS):
+        if not 1 <= batch_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}.")
+        self.table_client = table_client
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+    def load_rows(self):
+        """{(PartitionKey, RowKey): {"Sources", "Confidence"}} for every row in the managed partitions."""
+        rows = {}
+        for entity in self.table_client.query_entities(MANAGED_PARTITIONS_FILTER,
+                                                       select=["PartitionKey", "RowKey", "Sources", "Confidence"]):
+            rows[(entity["PartitionKey"], entity["RowKey"])] = {
+                "Sources": entity.get("Sources"),
+                "Confidence": entity.get("Confidence"),
+            }
+        return rows
+
+    def plan(self, networks, existing, now=None, delete_missing=False):
+        """Return {partition: [transaction operations]} for the rows that differ from `existing`."""
+        now = now or datetime.datetime.utcnow()
+        operations = {}
+        wanted = set()
+        for key, entry in networks.items():
+            network = format_network(key)
+            row = (partition_key(key), row_key(network))
+            wanted.add(row)
+            values = {"Sources": ",".join(sorted(entry.get("sources", []))), "Confidence": entry.get("confidence")}
+            stored = existing.get(row)
+            if stored == values:
+                continue
+            entity = dict(values, PartitionKey=row[0], RowKey=row[1], Network=network)
+            if stored is None:
+                entity["BlockedAt"] = now.isoformat()
+            operations.setdefault(row[0], []).append(("upsert", entity, {"mode": UpdateMode.MERGE}))
+        if delete_missing:
+            for partition, row in existing.keys() - wanted:
+                operations.setdefault(partition, []).append(("delete", {"PartitionKey": partition, "RowKey": row}))
+        return operations
+
+    def _without_missing_deletes(self, batch, error):
+        """`batch` minus the delete(s) behind a 404; those rows are already gone."""
+        index = getattr(error, "index", None)
+        if index is not None and 0 <= index < len(batch) and batch[index][0] == "delete":
+            return batch[:index] + batch[index + 1:]
+        # The failing operation is unknown: delete_entity() ignores missing rows, so delete one by one.
+        for op in batch:
+            if op[0] == "delete":
+                self.table_client.delete_entity(op[1]["PartitionKey"], op[1]["RowKey"])
+        return [op for op in batch if op[0] != "delete"]
+
+    def _submit(self, batch):
+        retries = 0
+        while batch:
+            try:
+                self.table_client.submit_transaction(batch)
+                return retries
+            except (HttpResponseError, ServiceRequestError, ServiceResponseError) as e:
+                if _is_missing_row(e) and any(op[0] == "delete" for op in batch):
+                    logging.info(f"Table transaction hit a missing row ({e}); dropping the delete and resubmitting.")
+                    batch = self._without_missing_deletes(batch, e)
+                    continue
+                if retries >= self.max_retries or not _is_retryable(e):
+                    raise
+                delay = self.backoff_seconds * (2 ** retries) * (0.5 + random.random())
+                retries += 1
+                logging.warning(f"Table transaction failed ({e}); retry {retries}/{self.max_retries} in {delay:.2f}s.")
+                time.sleep(delay)
+        return retries
+
+    def _submit_all(self, operations, counts):
+        batches = [
+            ops[offset:offset + self.batch_size]
+            for ops in operations.values()
+            for offset in range(0, len(ops), self.batch_size)
+        ]
+        counts.update(partitions=len(operations), batches=len(batches), retries=0)
+        if batches:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(batches)))) as pool:
+                counts["retries"] = sum(pool.map(self._submit, batches))
+        return counts
+
+    def sync(self, networks, delete_missing=False, now=None):
+        """Bring the table in line with {key: {"sources", "confidence"}}. Returns write counts."""
+        existing = self.load_rows()
+        operations = self.plan(networks, existing, now, delete_missing)
+        upserted = sum(op[0] == "upsert" for ops in operations.values() for op in ops)
+        counts = {
+            "upserted": upserted,
+            "deleted": sum(len(ops) for ops in operations.values()) - upserted,
+            "unchanged": len(networks) - upserted,
+        }
+        self._submit_all(operations, counts)
+        logging.info(f"Table sync: {counts}")
+        return counts
+
+    def delete_partition(self, partition):
+        """Delete every row of `partition`, e.g. one left behind by an older layout. Returns counts."""
+        entities = self.table_client.query_entities("PartitionKey eq @partition", parameters={"partition": partition},
+                                                    select=["PartitionKey", "RowKey"])
+        operations = [("delete", {"PartitionKey": partition, "RowKey": entity["RowKey"]}) for entity in entities]
+        counts = {"deleted": len(operations)}
+        self._submit_all({partition: operations} if operations else {}, counts)
+        logging.info(f"Table partition {partition!r} deleted: {counts}")
+        return counts
+
+    def apply_delta(self, added, changed, removed, now=None):
+        """Write a known delta: `added` / `changed` map keys to entries, `removed` lists keys."""
+        # Pretend changed rows exist (so they keep BlockedAt) and removed rows are all stored.
+        existing = {(partition_key(key), row_key(format_network(key))): {} for key in list(changed) + list(removed)}
+        operations = self.plan({**added, **changed}, existing, now, delete_missing=True)
+        counts = {"upserted": len(added) + len(changed), "deleted": len(removed)}
+        self._submit_all(operations, counts)
+        logging.info(f"Table delta: {counts}")
+        return counts
@@ -0,0 +1,79 @@
+import os
+import random
+import tempfile
+import unittest
+from scripts import blocklist_index
+from scripts.blocklist_index import BlocklistIndex
+from scripts.feed_parser import format_network, parse_network
+from scripts.rules import firewall_rules
+
+NETWORKS = {
+    parse_network("203.0.113.0/24"): ["Spamhaus"],
+    parse_network("203.0.113.128/25"): ["FireHOL"],
+    parse_network("203.0.113.200"): ["AbuseIPDB", "FireHOL"],
+    parse_network("198.51.100.0/22"): ["AlienVault"],
+    parse_network("2001:db8::/32"): ["Spamhaus"],
+}
+
+def brute_force(networks, address):
+    key = parse_network(address)
+    best = None
+    for (version, first, prefixlen), sources in networks.items():
+        if version == key[0] and prefixlen <= key[2] and (key[1] >> (key[2] - prefixlen)) << (key[2] - prefixlen) == first:
+            best = max(best or (-1,), (prefixlen, format_network((version, first, prefixlen)), tuple(sorted(set(sources)))))
+    return best[1:] if best else None
+
+class TestBlocklistIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = BlocklistIndex.build(NETWORKS, rules=firewall_rules)
+
+    def test_most_specific_prefix_wins(self):
+        self.assertEqual(self.index.lookup("203.0.113.5"), ("203.0.113.0/24", ("Spamhaus",)))
+        self.assertEqual(self.index.lookup("203.0.113.129"), ("203.0.113.128/25", ("FireHOL",)))
+        self.assertEqual(self.index.lookup("203.0.113.200"), ("203.0.113.200", ("AbuseIPDB", "FireHOL")))
+        self.assertEqual(self.index.lookup("203.0.113.201"), ("203.0.113.128/25", ("FireHOL",)))
+        self.assertEqual(self.index.lookup("2001:db8::1"), ("2001:db8::/32", ("Spamhaus",)))
+        self.assertIsNone(self.index.lookup("192.0.2.1"))
+
+    def test_deny_rules_are_sources(self):
+        self.assertEqual(self.index.lookup("20.169.181.2"), ("20.169.181.2", ("rule:BlockSSH",)))
+
+    def test_bulk_matches_single_lookups(self):
+        rng = random.Random(5)
+        networks = {}
+        for _ in range(500):
+            prefixlen = rng.choice([8, 16, 20, 24, 28, 32])
+            key = parse_network(f"{rng.randrange(1, 8)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}/{prefixlen}")
+            networks.setdefault(key, []).append(rng.choice(["A", "B", "C"]))
+        index = BlocklistIndex.build(networks)
+        addresses = [f"{rng.randrange(1, 9)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}" for _ in range(2000)]
+        ids = index.classify(addresses)
+        for address, entry_id in zip(addresses, ids):
+            expected = brute_force(networks, address)
+            self.assertEqual(index.entry(entry_id) if entry_id >= 0 else None, expected)
+            self.assertEqual(index.lookup(address), expected)
+
+    def test_bisect_fallback(self):
+        saved, blocklist_index.np = blocklist_index.np, None
+        try:
+            index = BlocklistIndex.build(NETWORKS)
+            self.assertEqual(index.classify(["203.0.113.129", "192.0.2.1"])[1], -1)
+            self.assertEqual(index.lookup("203.0.113.129"), ("203.0.113.128/25", ("FireHOL",)))
+        finally:
+            blocklist_index.np = saved
+
+    def test_save_and_mmap_load(self):
+        fd, path = tempfile.mkstemp(suffix=".idx")
+        os.close(fd)
+        try:
+            self.index.save(path)
+            loaded = BlocklistIndex.load(path)
+            for address in ["203.0.113.5", "203.0.113.200", "2001:db8::1", "192.0.2.1", "20.169.181.2"]:
+                self.assertEqual(loaded.lookup(address), self.index.lookup(address))
+            self.assertEqual(list(loaded.classify(["203.0.113.129"])), list(self.index.classify(["203.0.113.129"])))
+            del loaded
+        finally:
+            os.remove(path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import os
+import tempfile
+import unittest
+from scripts import blocklist_manager
+from scripts.blocklist_manager import HALF_LIFE_SECONDS, BlocklistManager, load_manager
+from scripts.blocklist_snapshot import SnapshotDiff
+
+def net(i):
+    return (4, 0x0A000000 + i, 32)
+
+def confidence_of(sources):
+    return {"strong": 90.0, "medium": 60.0, "weak": 20.0}[sources[0]]
+
+class TestBlocklistManager(unittest.TestCase):
+    def setUp(self):
+        self.networks = {net(0): ["strong"], net(1): ["medium"], net(2): ["weak"]}
+
+    def test_keeps_the_top_budget_networks(self):
+        manager = BlocklistManager(2)
+        manager.sync(self.networks, confidence_of, 0)
+        report = manager.tick(0)
+        self.assertEqual(sorted(report["promoted"]), [net(0), net(1)])
+        self.assertEqual(manager.active_networks(), {net(0): ["strong"], net(1): ["medium"]})
+        self.assertAlmostEqual(manager.score(net(0)), 0.9)
+
+    def test_hysteresis_keeps_near_ties_in_place(self):
+        manager = BlocklistManager(1, hysteresis=0.1)
+        manager.observe(net(0), ["a"], 60.0, 0)
+        manager.tick(0)
+        manager.observe(net(1), ["b"], 64.0, 0)         # 6.7% better: not enough to swap
+        self.assertEqual(manager.tick(0)["promoted"], [])
+        manager.observe(net(1), ["b", "c"], 70.0, 0)    # 16.7% better: swaps in
+        report = manager.tick(0)
+        self.assertEqual((report["promoted"], report["demoted"]), ([net(1)], [net(0)]))
+
+    def test_unlisted_networks_decay_and_expire(self):
+        manager = BlocklistManager(1, min_score=0.1)
+        manager.sync(self.networks, confidence_of, 0)
+        manager.tick(0)
+        manager.sync({net(1): ["medium"], net(2): ["weak"]}, confidence_of, 0)
+        # Unlisted, the 0.9 network keeps its slot until it decays below the 0.6 one (plus margin).
+        self.assertEqual(manager.tick(HALF_LIFE_SECONDS / 2)["promoted"], [])
+        self.assertAlmostEqual(manager.score(net(0)), 0.9 / 2 ** 0.5)
+        self.assertEqual(manager.tick(HALF_LIFE_SECONDS)["promoted"], [net(1)])
+        self.assertAlmostEqual(manager.score(net(2), 100 * HALF_LIFE_SECONDS), 0.2)     # still listed: no decay
+        report = manager.tick(4 * HALF_LIFE_SECONDS)        # 0.9 / 16 < 0.1
+        self.assertEqual((report["expired"], report["tracked"]), (1, 2))
+
+    def test_hits_raise_the_score(self):
+        manager = BlocklistManager(1)
+        manager.sync(self.networks, confidence_of, 0)
+        manager.tick(0)
+        self.assertEqual(manager.record_hits({net(1): 20, net(9): 5}, 10), 1)
+        self.assertEqual(manager.tick(10)["promoted"], [net(1)])
+        self.assertEqual(manager.entries[net(1)].hits, 20)
+
+    def test_delta_matches_full_sync(self):
+        updated = {net(0): ["strong"], net(2): ["medium"], net(3): ["strong"]}
+        delta = SnapshotDiff(added=[net(3)], removed=[net(1)], changed=[net(2)])
+        by_delta, by_sync = BlocklistManager(2), BlocklistManager(2)
+        for manager in (by_delta, by_sync):
+            manager.sync(self.networks, confidence_of, 0)
+            manager.tick(0)
+        by_delta.apply_delta(updated, delta, confidence_of, 60)
+        by_sync.sync(updated, confidence_of, 60)
+        self.assertEqual(by_delta.tick(60), by_sync.tick(60))
+        self.assertEqual(by_delta.active_networks(), by_sync.active_networks())
+
+    def test_max_entries_evicts_weakest_candidates(self):
+        manager = BlocklistManager(1, max_entries=2)
+        manager.sync(self.networks, confidence_of, 0)
+        report = manager.tick(0)
+        self.assertEqual((report["evicted"], report["tracked"]), (1, 2))
+        self.assertNotIn(net(2), manager.entries)
+
+    def test_save_appends_a_journal_and_load_replays_it(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "blocklist.jsonl")
+            manager = BlocklistManager(2)
+            manager.sync(self.networks, confidence_of, 0)
+            manager.tick(0)
+            manager.source_checksum = 1234
+            manager.save(path)
+            self.assertFalse(os.path.exists(path + ".journal"))
+            manager.apply_delta({net(4): ["strong"]}, SnapshotDiff(added=[net(4)], removed=[net(2)]), confidence_of, 30)
+            manager.record_hits({net(1): 3}, 30)
+            manager.tick(30)
+            manager.save(path)
+            self.assertTrue(os.path.exists(path + ".journal"))
+
+            loaded = BlocklistManager.load(path, 2)
+            self.assertEqual(loaded.source_checksum, 1234)
+            self.assertEqual(loaded.active_networks(), manager.active_networks())
+            self.assertEqual(loaded.entries[net(1)].hits, 3)
+            self.assertFalse(loaded.entries[net(2)].listed)
+            self.assertEqual(loaded.tick(30), manager.tick(30))
+
+            blocklist_manager._cache.clear()
+            cached = load_manager(path, 2)
+            self.assertIs(load_manager(path, 2), cached)
+
+    def test_rank_blocklist_applies_snapshot_deltas(self):
+        from scripts.blocklist_snapshot import BlocklistSnapshot, diff, load_previous
+        from scripts.malip import blocklist_snapshot, rank_blocklist
+        with tempfile.TemporaryDirectory() as tmpdir:
+            snapshot_path, state_path = os.path.join(tmpdir, "blocklist.snap"), os.path.join(tmpdir, "state.jsonl")
+            networks = {net(0): ["Spamhaus"], net(1): ["FireHOL"]}
+            for now in (0, 60):
+                snapshot = blocklist_snapshot(networks)
+                ranked = rank_blocklist(networks, snapshot, diff(load_previous(snapshot_path), snapshot),
+                                        snapshot_path, state_path, now)
+                snapshot.write(snapshot_path)
+                networks = {net(0): ["Spamhaus", "FireHOL"], net(2): ["AlienVault"]}
+            self.assertEqual(sorted(ranked["networks"]), [net(0), net(1), net(2)])
+            manager = load_manager(state_path, 2)
+            self.assertFalse(manager.entries[net(1)].listed)
+            self.assertEqual(manager.entries[net(0)].sightings, {"Spamhaus": 0, "FireHOL": 60})
+            self.assertEqual(manager.source_checksum, BlocklistSnapshot.load(snapshot_path).checksum)
+
+    def test_ranking_stays_changed_until_the_firewall_confirms_it(self):
+        from scripts.blocklist_snapshot import diff, load_previous
+        from scripts.malip import blocklist_snapshot, confirm_blocklist_deployed, rank_blocklist
+        with tempfile.TemporaryDirectory() as tmpdir:
+            snapshot_path, state_path = os.path.join(tmpdir, "blocklist.snap"), os.path.join(tmpdir, "state.jsonl")
+            networks = {net(0): ["Spamhaus"]}
+            snapshot = blocklist_snapshot(networks)
+            self.assertTrue(rank_blocklist(networks, snapshot, diff(None, snapshot), snapshot_path, state_path, 0)["changed"])
+            # The firewall PUT failed: the next run must still deploy, even though nothing was promoted.
+            blocklist_manager._cache.clear()
+            ranked = rank_blocklist(networks, snapshot, diff(None, snapshot), snapshot_path, state_path, 60)
+            self.assertEqual(ranked["report"]["promoted"], [])
+            self.assertTrue(ranked["changed"])
+            confirm_blocklist_deployed(state_path)
+            blocklist_manager._cache.clear()
+            self.assertFalse(rank_blocklist(networks, snapshot, diff(None, snapshot), snapshot_path, state_path, 120)["changed"])
+
+    def test_flow_log_hits_change_the_ranking(self):
+        import json
+        from unittest import mock
+        from scripts import malip
+        from scripts.blocklist_snapshot import diff
+        with tempfile.TemporaryDirectory() as tmpdir, mock.patch.object(malip, "RULE_BUDGET", 1):
+            snapshot_path, state_path = os.path.join(tmpdir, "blocklist.snap"), os.path.join(tmpdir, "state.jsonl")
+            hits_path = os.path.join(tmpdir, "hits.json")
+            networks = {net(0): ["Spamhaus"], net(1): ["AlienVault"]}
+            snapshot = malip.blocklist_snapshot(networks)
+            ranked = malip.rank_with_flow_log_hits(networks, snapshot, diff(None, snapshot), snapshot_path, state_path,
+                                                   hits_path)
+            self.assertEqual(list(ranked["networks"]), [net(0)])
+            with open(hits_path, "w") as f:
+                json.dump({"10.0.0.1": 1000, "not an address": 5}, f)
+            ranked = malip.rank_with_flow_log_hits(networks, snapshot, diff(None, snapshot), snapshot_path, state_path,
+                                                   hits_path)
+            self.assertEqual(list(ranked["networks"]), [net(1)])
+            self.assertEqual(load_manager(state_path, 1).entries[net(1)].hits, 1000)
+            self.assertFalse([name for name in os.listdir(tmpdir) if name.startswith("hits")])   # consumed
+
+if __name__ == "__main__":
+    unittest.main()
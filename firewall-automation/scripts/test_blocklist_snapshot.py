@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from scripts.blocklist_snapshot import BlocklistSnapshot, diff, load_previous
+from scripts.feed_parser import parse_network
+from scripts.table_writer import TableWriter
+from scripts.test_table_writer import FakeTableClient
+
+NETWORKS = {
+    parse_network("203.0.113.0/24"): ["Spamhaus"],
+    parse_network("198.51.100.7"): ["FireHOL", "AbuseIPDB"],
+    parse_network("2001:db8::/32"): ["Spamhaus"],
+    parse_network("10.0.0.0/8"): ["AlienVault"],
+}
+
+class TestBlocklistSnapshot(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".snap")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_round_trip_through_mmap(self):
+        BlocklistSnapshot.from_networks(NETWORKS, {parse_network("10.0.0.0/8"): 60.0}).write(self.path)
+        loaded = BlocklistSnapshot.load(self.path)
+        self.assertEqual(list(loaded.keys()), sorted(NETWORKS))
+        self.assertEqual({k: sorted(v) for k, v in loaded.to_networks().items()}, {k: sorted(v) for k, v in NETWORKS.items()})
+        self.assertEqual(loaded.entry(0)[2], 60.0)
+
+    def test_corruption_is_detected(self):
+        BlocklistSnapshot.from_networks(NETWORKS).write(self.path)
+        with open(self.path, "r+b") as f:
+            f.seek(-3, os.SEEK_END)
+            f.write(b"\xff")
+        with self.assertRaises(ValueError):
+            BlocklistSnapshot.load(self.path)
+        self.assertIsNone(load_previous(self.path))
+
+    def test_diff(self):
+        old = BlocklistSnapshot.from_networks(NETWORKS)
+        self.assertFalse(diff(old, BlocklistSnapshot.from_networks(dict(NETWORKS))).has_changes)
+        self.assertEqual(diff(None, old).summary(), {"added": 4, "removed": 0, "changed": 0})
+        self.assertTrue(diff(None, old).full)
+
+        new_networks = dict(NETWORKS)
+        del new_networks[parse_network("10.0.0.0/8")]
+        new_networks[parse_network("192.0.2.0/24")] = ["FireHOL"]
+        new_networks[parse_network("203.0.113.0/24")] = ["Spamhaus", "FireHOL"]
+        delta = diff(old, BlocklistSnapshot.from_networks(new_networks))
+        self.assertEqual(delta.added, [parse_network("192.0.2.0/24")])
+        self.assertEqual(delta.removed, [parse_network("10.0.0.0/8")])
+        self.assertEqual(delta.changed, [parse_network("203.0.113.0/24")])
+        self.assertFalse(delta.full)
+
+    def test_delta_drives_table_writes(self):
+        table = FakeTableClient()
+        writer = TableWriter(table)
+        entries = {key: {"sources": sources, "confidence": 50.0} for key, sources in NETWORKS.items()}
+        old = BlocklistSnapshot.from_networks(NETWORKS)
+        delta = diff(None, old)
+        writer.apply_delta({key: entries[key] for key in delta.added}, {}, [])
+        del entries[parse_network("10.0.0.0/8")]
+        delta = diff(old, BlocklistSnapshot.from_networks({key: NETWORKS[key] for key in entries}))
+        table.transactions.clear()
+        writer.apply_delta({}, {}, delta.removed)
+        self.assertEqual(len(table.rows), 3)
+        self.assertEqual(len(table.transactions), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import datetime
+import unittest
+from scripts.blocklist_store import plan_sync
+
+NOW = datetime.datetime(2026, 1, 2, 12, 0, 0)
+
+class TestBlocklistStorePlan(unittest.TestCase):
+    def test_only_delta_is_written(self):
+        entries = {
+            "203.0.113.0/24": {"sources": ["Spamhaus"], "confidence": 80.0},
+            "198.51.100.7": {"sources": ["FireHOL", "AbuseIPDB"], "confidence": 97.0},
+            "192.0.2.1": {"sources": ["FireHOL"], "confidence": 70.0},
+            "192.0.2.2": {"sources": ["FireHOL"], "confidence": 70.0},
+        }
+        existing = {
+            "198.51.100.7": {"sources": ["AbuseIPDB"], "confidence": 90.0, "last_seen": NOW},
+            "192.0.2.1": {"sources": ["FireHOL"], "confidence": 70.0, "last_seen": NOW - datetime.timedelta(hours=1)},
+            "192.0.2.2": {"sources": ["FireHOL"], "confidence": 70.0, "last_seen": NOW - datetime.timedelta(days=2)},
+        }
+        updates, counts = plan_sync(entries, existing, NOW)
+        self.assertEqual(counts, {"inserted": 1, "updated": 1, "refreshed": 1, "unchanged": 1})
+        updates = dict(updates)
+        self.assertEqual(set(updates), {"203.0.113.0/24", "198.51.100.7", "192.0.2.2"})
+        self.assertEqual(updates["203.0.113.0/24"]["$setOnInsert"], {"first_seen": NOW})
+        self.assertEqual(updates["198.51.100.7"]["$set"]["sources"], ["AbuseIPDB", "FireHOL"])
+        self.assertEqual(updates["192.0.2.2"], {"$set": {"last_seen": NOW}})
+
+    def test_rerun_is_idempotent(self):
+        entries = {"203.0.113.0/24": {"sources": ["Spamhaus"], "confidence": 80.0}}
+        updates, _ = plan_sync(entries, {}, NOW)
+        existing = {network: dict(update["$set"], network=network) for network, update in updates}
+        self.assertEqual(plan_sync(entries, existing, NOW)[0], [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import ipaddress
+import random
+import unittest
+from scripts.cidr_aggregate import aggregate_networks, range_to_networks, select_within_budget
+from scripts.feed_parser import format_network, parse_network
+
+def keys(*texts):
+    return [parse_network(text) for text in texts]
+
+def addresses(networks):
+    covered = set()
+    for key in networks:
+        covered.update(int(ip) for ip in ipaddress.ip_network(format_network(key)))
+    return covered
+
+class TestCidrAggregate(unittest.TestCase):
+    def test_adjacent_and_overlapping_prefixes_collapse(self):
+        blocks = aggregate_networks(keys("10.0.0.0/25", "10.0.0.128/25", "10.0.0.7", "10.0.1.0/24", "192.168.1.1"))
+        self.assertEqual([format_network(key) for key, _ in blocks], ["10.0.0.0/23", "192.168.1.1"])
+
+    def test_merged_confidence_is_weighted_by_size(self):
+        blocks = aggregate_networks({parse_network("10.0.0.0/25"): 40, parse_network("10.0.0.128/26"): 70,
+                                     parse_network("10.0.0.192/26"): 70, parse_network("10.0.0.5"): 100})
+        self.assertEqual([(format_network(key), confidence) for key, confidence in blocks], [("10.0.0.0/24", 55.0)])
+
+    def test_range_to_networks_is_exact(self):
+        first, last = int(ipaddress.ip_address("10.0.0.3")), int(ipaddress.ip_address("10.0.0.17"))
+        networks = range_to_networks(4, first, last)
+        self.assertEqual(addresses(networks), set(range(first, last + 1)))
+        self.assertEqual(len(networks), 4)
+
+    def test_random_lists_keep_exact_coverage(self):
+        rng = random.Random(3)
+        raw = [(4, rng.randrange(0, 1 << 12) << 4, rng.choice([28, 30, 31, 32])) for _ in range(300)]
+        raw = [(v, a & ~((1 << (32 - p)) - 1), p) for v, a, p in raw]
+        blocks = aggregate_networks(raw)
+        self.assertEqual(addresses(key for key, _ in blocks), addresses(raw))
+        self.assertLessEqual(len(blocks), len(set(raw)))
+
+    def test_budget_prefers_confident_wide_prefixes(self):
+        blocks = aggregate_networks({
+            parse_network("203.0.113.0/24"): 50,
+            parse_network("198.51.100.7"): 90,
+            parse_network("192.0.2.0/28"): 80,
+        })
+        selected, report = select_within_budget(blocks, 2, raw_count=3)
+        self.assertEqual([format_network(key) for key, _ in selected], ["192.0.2.0/28", "203.0.113.0/24"])
+        self.assertEqual(report["retained_addresses"], 256 + 16)
+        self.assertAlmostEqual(report["address_coverage"], 272 / 273)
+        self.assertEqual(report["raw_entries"], 3)
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
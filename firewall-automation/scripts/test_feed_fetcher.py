@@ -0,0 +1,146 @@
+import glob
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from scripts.feed_fetcher import fetch_feeds
+from scripts.feed_parser import FeedStats, format_network, iter_lines, parse_feed, parse_network
+
+FEEDS = {
+    "/drop.txt": "; Spamhaus DROP List\n1.10.16.0/20 ; SBL256894\n2.56.192.0/22 ; SBL459831\n",
+    "/level1.netset": "# FireHOL level1\n0.0.0.0/8\n5.188.10.0/23\n",
+}
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the threat feed servers, with ETag revalidation."""
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get("If-None-Match")))
+        body = FEEDS.get(self.path)
+        if body is None:
+            self.send_error(500)
+            return
+        etag = f'"{hash(body) & 0xffffffff:x}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestFeedFetcher(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FeedHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{cls.server.server_port}"
+        cls.feeds = {
+            "Spamhaus": {"url": base + "/drop.txt", "format": "spamhaus"},
+            "FireHOL": {"url": base + "/level1.netset", "format": "netset"},
+        }
+        cls.broken = {"Broken": {"url": base + "/missing.txt", "format": "netset"}}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        FeedHandler.requests_seen = []
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_fetch_then_revalidate(self):
+        first = fetch_feeds(self.feeds, cache_dir=self.tmpdir.name)
+        self.assertEqual({r.status for r in first.values()}, {"fetched"})
+        self.assertGreater(first["Spamhaus"].bytes_fetched, 0)
+
+        second = fetch_feeds(self.feeds, cache_dir=self.tmpdir.name)
+        self.assertEqual({r.status for r in second.values()}, {"not_modified"})
+        self.assertEqual(second["FireHOL"].entries, first["FireHOL"].entries)
+        self.assertTrue(all(etag for _, etag in FeedHandler.requests_seen[2:]))
+
+    def test_cache_from_another_format_or_parser_is_not_reused(self):
+        fetch_feeds(self.feeds, cache_dir=self.tmpdir.name)
+        # A cache written before the entries became network keys holds plain strings.
+        for path in glob.glob(os.path.join(self.tmpdir.name, "*.entries.json")):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(["1.10.16.0/20"], f)
+        for path in glob.glob(os.path.join(self.tmpdir.name, "*.meta.json")):
+            with open(path, encoding="utf-8") as f:
+                meta = json.load(f)
+            meta.pop("cache_format")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+        results = fetch_feeds(self.feeds, cache_dir=self.tmpdir.name)
+        self.assertEqual({r.status for r in results.values()}, {"fetched"})
+        self.assertEqual(results["Spamhaus"].entries[0], parse_network("1.10.16.0/20"))
+
+        feeds = {"FireHOL": dict(self.feeds["FireHOL"], format="plain")}
+        self.assertEqual(fetch_feeds(feeds, cache_dir=self.tmpdir.name)["FireHOL"].status, "fetched")
+
+    def test_entries_are_normalized(self):
+        result = fetch_feeds(self.feeds, cache_dir=self.tmpdir.name)["Spamhaus"]
+        self.assertEqual([format_network(key) for key in result.entries], ["1.10.16.0/20", "2.56.192.0/22"])
+        self.assertEqual(result.stats.as_dict(), {"lines": 3, "accepted": 2, "skipped": 1, "invalid": 0})
+
+    def test_custom_parser(self):
+        def parser(lines, stats):
+            return (parse_network(line) for line in lines if line.startswith("5."))
+        feeds = {"Custom": {"url": self.feeds["FireHOL"]["url"], "parser": parser}}
+        result = fetch_feeds(feeds, cache_dir=self.tmpdir.name)["Custom"]
+        self.assertEqual(result.entries, [parse_network("5.188.10.0/23")])
+
+    def test_failed_feed_without_cache(self):
+        result = fetch_feeds(self.broken, cache_dir=self.tmpdir.name)["Broken"]
+        self.assertEqual(result.status, "error")
+        self.assertEqual(result.entries, [])
+
+    def test_parser_error_only_fails_its_feed(self):
+        def parser(lines, stats):
+            for line in lines:
+                raise ValueError(f"unexpected line {line!r}")
+            yield from ()
+        feeds = dict(self.feeds, Custom={"url": self.feeds["FireHOL"]["url"], "parser": parser})
+        results = fetch_feeds(feeds, cache_dir=self.tmpdir.name)
+        self.assertEqual(results["Custom"].status, "error")
+        self.assertIsInstance(results["Custom"].error, ValueError)
+        self.assertEqual(results["Spamhaus"].status, "fetched")
+
+class TestFeedParser(unittest.TestCase):
+    def test_iter_lines_across_chunks(self):
+        chunks = [b"10.0.0.0/8\r\n192.168", b".1.1\n", b"", b"last-line"]
+        self.assertEqual(list(iter_lines(chunks)), ["10.0.0.0/8", "192.168.1.1", "last-line"])
+
+    def test_parse_feed_drops_junk(self):
+        lines = [
+            "; Spamhaus DROP List 2024/01/01",
+            "1.10.16.0/20 ; SBL256894",
+            "10.0.0.7/24",
+            "not-an-ip",
+            "",
+            "2001:db8::/32 ; SBL1",
+        ]
+        stats = FeedStats()
+        keys = list(parse_feed(lines, "spamhaus", stats))
+        self.assertEqual([format_network(key) for key in keys], ["1.10.16.0/20", "10.0.0.0/24", "2001:db8::/32"])
+        self.assertEqual(stats.as_dict(), {"lines": 6, "accepted": 3, "skipped": 2, "invalid": 1})
+
+    def test_alienvault_fields(self):
+        lines = ["# comment", "46.4.123.15#4#2#Malicious Host#DE##51.0,9.0#11", "185.0.0.1\tScanning Host"]
+        self.assertEqual([format_network(k) for k in parse_feed(lines, "alienvault")], ["46.4.123.15", "185.0.0.1"])
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,70 @@
+import copy
+import unittest
+from types import SimpleNamespace
+from scripts.firewall_diff import apply_diff, canonical_collection, diff_collections
+from scripts.rule_sharding import is_shard_of, shard_blocklist
+
+def as_sdk(collection):
+    # Same attribute layout as the azure-mgmt-network models, in deployed (reordered) form.
+    rules = [SimpleNamespace(name=r["name"], protocols=[p.lower() for p in r["protocols"]][::-1],
+                             source_addresses=r["source_addresses"],
+                             destination_addresses=list(reversed(r["destination_addresses"])),
+                             destination_ports=r["destination_ports"]) for r in collection["rules"]]
+    return SimpleNamespace(name=collection["name"], priority=collection["priority"],
+                           action=SimpleNamespace(type=collection["action"]), rules=rules[::-1])
+
+class TestFirewallDiff(unittest.TestCase):
+    PREFIXES = [f"203.0.{i}.0/24" for i in range(120)]
+
+    def setUp(self):
+        self.desired = shard_blocklist(self.PREFIXES)
+        self.deployed = [SimpleNamespace(name="AllowRules", priority=100, action=SimpleNamespace(type="Allow"), rules=[])]
+        self.deployed += [as_sdk(c) for c in self.desired]
+
+    def test_sdk_and_dict_forms_canonicalize_equal(self):
+        self.assertEqual(canonical_collection(self.desired[0]), canonical_collection(as_sdk(self.desired[0])))
+
+    def test_no_changes(self):
+        diff = diff_collections(self.desired, self.deployed, managed=is_shard_of)
+        self.assertFalse(diff.has_changes)
+        self.assertEqual(len(diff.unchanged), len(self.desired))
+
+    def test_out_of_band_ip_group_fqdn_and_description_edits_are_changes(self):
+        for field, value in [("destination_ip_groups", ["/subscriptions/s/ipGroups/g"]),
+                             ("source_ip_groups", ["/subscriptions/s/ipGroups/h"]),
+                             ("destination_fqdns", ["evil.example"]), ("description", "edited in the portal")]:
+            deployed = copy.deepcopy(self.deployed)
+            setattr(deployed[1].rules[0], field, value)
+            diff = diff_collections(self.desired, deployed, managed=is_shard_of)
+            self.assertEqual(list(diff.changed), [deployed[1].name], field)
+
+    def test_rule_level_changes(self):
+        desired = copy.deepcopy(self.desired)
+        desired[0]["rules"][0]["destination_addresses"].append("198.51.100.0/24")
+        desired[0]["rules"].append(dict(desired[0]["rules"][0], name="Extra"))
+        diff = diff_collections(desired, self.deployed, managed=is_shard_of)
+        self.assertEqual(list(diff.changed), [desired[0]["name"]])
+        self.assertEqual(diff.changed[desired[0]["name"]]["added_rules"], ["Extra"])
+        self.assertEqual(diff.changed[desired[0]["name"]]["changed_rules"], [desired[0]["rules"][0]["name"]])
+
+    def test_apply_touches_only_affected_collections(self):
+        desired = copy.deepcopy(self.desired)
+        desired[1]["priority"] += 50
+        removed = desired.pop()
+        desired.append({"name": "BlockMaliciousIPs-99", "priority": 299, "action": "Deny", "rules": []})
+        diff = diff_collections(desired, self.deployed, managed=is_shard_of)
+        self.assertTrue(diff.changed[desired[1]["name"]]["header_changed"])
+        self.assertEqual(diff.removed, [removed["name"]])
+        self.assertEqual(diff.added, ["BlockMaliciousIPs-99"])
+
+        updated = apply_diff(self.deployed, desired, diff)
+        names = [c.name if hasattr(c, "name") else c["name"] for c in updated]
+        self.assertEqual(names[0], "AllowRules")
+        self.assertNotIn(removed["name"], names)
+        self.assertEqual(names[-1], "BlockMaliciousIPs-99")
+        self.assertIs(updated[0], self.deployed[0])
+        self.assertIs(updated[1], self.deployed[1])
+        self.assertIs(updated[2], desired[1])
+
+if __name__ == '__main__':
+    unittest.main()
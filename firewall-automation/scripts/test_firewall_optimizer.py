@@ -1,5 +1,7 @@
 import unittest
-from MyFirewallFunctionProj.firewall_optimizer import optimize_firewalls
+from MyFirewallFunctionProj.firewall_optimizer import build_model, optimize_firewalls, resolve_paths
+from MyFirewallFunctionProj.optimizer_session import OptimizerSession
+from MyFirewallFunctionProj.parallel_optimizer import optimize_firewalls_parallel, split_components
 
 class TestFirewallOptimizer(unittest.TestCase):
     def test_optimize_firewalls(self):
@@ -16,6 +18,136 @@ class TestFirewallOptimizer(unittest.TestCase):
         except Exception as e:
             self.fail(f"optimize_firewalls() raised an exception: {e}")
 
+    def test_optimize_firewalls_with_topology(self):
+        topology = {
+            "aps": ["web", "app", "db", "mgmt"],
+            "links": [["web", "app"], ["app", "db"], ["mgmt", "db"]],
+        }
+        nsrs = [
+            {"name": "block_web_db", "source": "web", "destination": "db", "action": "Deny"},
+            {"name": "block_mgmt_web", "source": "mgmt", "destination": "web", "action": "Deny"},
+            {"name": "allow_app_db", "source": "app", "destination": "db", "action": "Allow"},
+        ]
+        solution = optimize_firewalls(topology, nsrs)
+        allocation = solution["firewall_allocation"]
+        self.assertEqual(solution["total_firewalls_deployed"], 1)
+        self.assertTrue(any(allocation[ap] for ap in ["web", "app", "db"]))
+        self.assertTrue(solution["allow_rules"]["allow_rule_app_db"])
+        self.assertNotIn("allow_rule_app_db", solution)
+
+    def test_resolve_paths(self):
+        topology = {
+            "aps": ["a", "b", "c"],
+            "links": [["a", "b"], ["b", "c"]],
+            "paths": {"c->a": ["c", "a"]},
+        }
+        nsrs = [
+            {"source": "a", "destination": "c"},
+            {"source": "c", "destination": "a"},
+            {"source": "a", "destination": "b", "path": ["a", "b"]},
+        ]
+        self.assertEqual(resolve_paths(topology, nsrs), [["a", "b", "c"], ["c", "a"], ["a", "b"]])
+
+    def test_weighted_costs_agree_across_encodings(self):
+        topology = {
+            "aps": ["a", "b", "c"],
+            "links": [["a", "b"], ["b", "c"]],
+            "costs": {"a": 1, "b": 5, "c": 1},
+        }
+        nsrs = [
+            {"name": "block_a_b", "source": "a", "destination": "b", "action": "Deny"},
+            {"name": "block_b_c", "source": "b", "destination": "c", "action": "Deny"},
+        ]
+        for encoding in ("sum", "soft", "pb"):
+            solution = optimize_firewalls(topology, nsrs, encoding=encoding)
+            self.assertEqual(solution["total_cost"], 2, encoding)
+            self.assertEqual(solution["firewall_allocation"], {"a": True, "b": False, "c": True}, encoding)
+            self.assertTrue(solution["optimal"], encoding)
+
+    def test_deadline_reports_optimality(self):
+        solution = optimize_firewalls(deadline=30)
+        self.assertTrue(solution["optimal"])
+        self.assertEqual(solution["total_firewalls_deployed"], 1)
+
+    def test_unknown_ap_is_rejected(self):
+        with self.assertRaises(ValueError):
+            optimize_firewalls({"aps": ["a"], "links": []}, [{"source": "a", "destination": "z"}])
+
+    def test_non_positive_integer_costs_are_rejected(self):
+        nsrs = [{"name": "n", "source": "a", "destination": "b", "action": "Deny"}]
+        for cost in (0, -1, 2.5, "3", True):
+            with self.assertRaises(ValueError, msg=repr(cost)):
+                build_model({"aps": ["a", "b"], "links": [["a", "b"]], "costs": {"a": cost}}, nsrs)
+
+class TestOptimizerSession(unittest.TestCase):
+    TOPOLOGY = {"aps": ["a", "b", "c", "d"], "links": [["a", "b"], ["b", "c"], ["c", "d"]]}
+
+    def test_add_and_remove_nsrs(self):
+        session = OptimizerSession(self.TOPOLOGY, [
+            {"name": "block_a_b", "source": "a", "destination": "b", "action": "Deny"},
+            {"name": "block_c_d", "source": "c", "destination": "d", "action": "Deny"},
+        ])
+        self.assertEqual(session.solve()["total_firewalls_deployed"], 2)
+
+        session.remove_nsr("block_c_d")
+        self.assertEqual(session.solve()["total_firewalls_deployed"], 1)
+
+        # Re-adding a retracted NSR must bring its constraints back.
+        session.add_nsr({"name": "block_c_d", "source": "c", "destination": "d", "action": "Deny"})
+        self.assertEqual(session.solve()["total_firewalls_deployed"], 2)
+        self.assertEqual(sorted(session.nsr_names), ["block_a_b", "block_c_d"])
+
+    def test_rejected_batch_leaves_session_unchanged(self):
+        session = OptimizerSession(self.TOPOLOGY, [{"name": "block_a_b", "source": "a", "destination": "b"}])
+        constraints = session.model.num_constraints
+        for batch in ([{"name": "block_c_d", "source": "c", "destination": "d"}, {"name": "block_a_b", "source": "a", "destination": "b"}],
+                      [{"name": "block_b_c", "source": "b", "destination": "c"}, {"name": "block_b_c", "source": "b", "destination": "c"}]):
+            with self.assertRaises(ValueError):
+                session.add_nsrs(batch)
+            self.assertEqual(session.nsr_names, ["block_a_b"])
+            self.assertEqual(session.model.num_constraints, constraints)
+        self.assertEqual(session.solve()["total_firewalls_deployed"], 1)
+
+    def test_matches_cold_solve(self):
+        nsrs = [
+            {"name": "block_a_d", "source": "a", "destination": "d", "action": "Deny"},
+            {"name": "allow_b_c", "source": "b", "destination": "c", "action": "Allow"},
+        ]
+        session = OptimizerSession(self.TOPOLOGY, nsrs)
+        result = session.solve()
+        cold = optimize_firewalls(self.TOPOLOGY, nsrs)
+        self.assertEqual(result["total_firewalls_deployed"], cold["total_firewalls_deployed"])
+        self.assertEqual(result["allow_rules"], {"allow_rule_b_c": True})
+
+        session.remove_nsr("allow_b_c")
+        self.assertEqual(session.solve()["allow_rules"], {})
+
+class TestParallelOptimizer(unittest.TestCase):
+    TOPOLOGY = {
+        "aps": ["a", "b", "c", "x", "y", "idle"],
+        "links": [["a", "b"], ["b", "c"], ["x", "y"]],
+    }
+    NSRS = [
+        {"name": "block_a_b", "source": "a", "destination": "b", "action": "Deny"},
+        {"name": "block_b_c", "source": "b", "destination": "c", "action": "Deny"},
+        {"name": "block_x_y", "source": "x", "destination": "y", "action": "Deny"},
+        {"name": "allow_y_x", "source": "y", "destination": "x", "action": "Allow"},
+    ]
+
+    def test_split_components(self):
+        components = split_components(self.TOPOLOGY, self.NSRS)
+        self.assertEqual(sorted(aps for aps, _ in components), [["a", "b", "c"], ["x", "y"]])
+        self.assertTrue(all("path" in nsr for _, nsrs in components for nsr in nsrs))
+
+    def test_matches_monolithic_solve(self):
+        monolithic = optimize_firewalls(self.TOPOLOGY, self.NSRS)
+        for workers in (1, 2):
+            result = optimize_firewalls_parallel(self.TOPOLOGY, self.NSRS, max_workers=workers)
+            self.assertEqual(result["total_firewalls_deployed"], monolithic["total_firewalls_deployed"])
+            self.assertEqual(set(result["firewall_allocation"]), set(self.TOPOLOGY["aps"]))
+            self.assertFalse(result["firewall_allocation"]["idle"])
+            self.assertEqual(result["allow_rules"], {"allow_rule_y_x": True})
+
 if __name__ == "__main__":
     print("Running TestFirewallOptimizer...")
     unittest.main(verbosity=2)
@@ -0,0 +1,125 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from scripts.fleet_update import FirewallTarget, SubscriptionLimiter, TokenBucket, load_inventory, retry_after_seconds, update_fleet
+
+class Rule:
+    def __init__(self, name, ports):
+        self.name, self.protocols, self.source_addresses = name, ["TCP"], ["*"]
+        self.destination_addresses, self.destination_ports = ["10.0.0.1"], ports
+
+class Collection:
+    def __init__(self, name, ports):
+        self.name, self.priority, self.action, self.rules = name, 100, {"type": "Allow"}, [Rule("r", ports)]
+
+class Firewall:
+    def __init__(self, collections):
+        self.network_rule_collections = collections
+
+class Throttled(Exception):
+    status_code = 429
+    def __init__(self):
+        super().__init__("Too Many Requests")
+        self.response = type("Response", (), {"headers": {"Retry-After": "0"}})()
+
+class Poller:
+    def __init__(self, seconds, error=None):
+        self.seconds, self.error = seconds, error
+    def result(self):
+        time.sleep(self.seconds)
+        if self.error:
+            raise self.error
+
+class FakeFirewalls:
+    def __init__(self, deployed, throttle=0, poll_seconds=0.3, broken=()):
+        self.deployed, self.throttle, self.poll_seconds, self.broken = deployed, throttle, poll_seconds, broken
+        self.puts = []
+        self.lock = threading.Lock()
+    def get(self, resource_group, name):
+        with self.lock:
+            if self.throttle:
+                self.throttle -= 1
+                raise Throttled()
+        return Firewall(list(self.deployed.get(name, [])))
+    def begin_create_or_update(self, resource_group, name, firewall):
+        with self.lock:
+            self.puts.append(name)
+        return Poller(self.poll_seconds, RuntimeError("provisioning failed") if name in self.broken else None)
+
+class FakeClient:
+    def __init__(self, firewalls):
+        self.azure_firewalls = firewalls
+
+def targets(count, subscriptions=2):
+    return [FirewallTarget(f"sub{i % subscriptions}", "rg", f"fw{i}") for i in range(count)]
+
+class TestFleetUpdate(unittest.TestCase):
+    def test_operations_are_polled_in_parallel(self):
+        firewalls = FakeFirewalls({"fw0": [Collection("AllowRules", ["80"])]}, poll_seconds=0.3)
+        desired = [Collection("AllowRules", ["80"])]
+        start = time.perf_counter()
+        report = update_fleet(targets(12), desired, max_workers=4, client_factory=lambda sub: FakeClient(firewalls))
+        self.assertLess(time.perf_counter() - start, 0.3 * 3)   # serially this would take 11 * 0.3s
+        self.assertEqual((report["updated"], report["unchanged"], report["failed"]), (11, 1, 0))
+        self.assertNotIn("fw0", firewalls.puts)
+
+    def test_throttling_is_retried(self):
+        firewalls = FakeFirewalls({}, throttle=3, poll_seconds=0)
+        report = update_fleet(targets(4), [Collection("AllowRules", ["443"])],
+                              client_factory=lambda sub: FakeClient(firewalls))
+        self.assertEqual(report["updated"], 4)
+
+    def test_one_failure_does_not_stop_the_fleet(self):
+        firewalls = FakeFirewalls({}, poll_seconds=0, broken={"fw1"})
+        report = update_fleet(targets(3), [Collection("AllowRules", ["443"])],
+                              client_factory=lambda sub: FakeClient(firewalls))
+        self.assertEqual(report["targets"]["sub1/rg/fw1"]["status"], "failed")
+        self.assertEqual(report["updated"], 2)
+
+    def test_desired_state_computed_once_per_target(self):
+        calls = []
+        def desired(target):
+            calls.append(target.key)
+            return [Collection("AllowRules", ["22"])]
+        firewalls = FakeFirewalls({}, throttle=2, poll_seconds=0)
+        update_fleet(targets(5), desired, client_factory=lambda sub: FakeClient(firewalls))
+        self.assertEqual(sorted(calls), sorted(t.key for t in targets(5)))
+
+    def test_token_bucket_rate_and_pause(self):
+        now = [0.0]
+        def sleep(seconds):
+            now[0] += seconds
+        bucket = TokenBucket(rate=2.0, burst=2, clock=lambda: now[0], sleep=sleep)
+        for _ in range(6):
+            bucket.acquire()
+        self.assertAlmostEqual(now[0], 2.0)   # 2 from the burst, then 4 more at 2 per second
+        bucket.pause(5)
+        bucket.acquire()
+        self.assertAlmostEqual(now[0], 7.0)
+
+    def test_limiter_buckets_per_subscription_and_kind(self):
+        limiter = SubscriptionLimiter()
+        self.assertIs(limiter.bucket("a", "read"), limiter.bucket("a", "read"))
+        self.assertIsNot(limiter.bucket("a", "read"), limiter.bucket("a", "write"))
+        self.assertIsNot(limiter.bucket("a", "read"), limiter.bucket("b", "read"))
+
+    def test_retry_after_parsing(self):
+        self.assertEqual(retry_after_seconds(Throttled()), 0.0)
+        self.assertEqual(retry_after_seconds(RuntimeError(), default=7), 7)
+
+    def test_load_inventory(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "firewalls.json")
+            with open(path, "w") as f:
+                json.dump([{"subscription_id": "s", "resource_group": "rg", "firewall_name": "fw"}], f)
+            self.assertEqual([t.key for t in load_inventory(path)], ["s/rg/fw"])
+            with open(path, "w") as f:
+                json.dump([{"subscription_id": "s", "resource_group": "rg"}], f)
+            with self.assertRaises(ValueError):
+                load_inventory(path)
+
+if __name__ == "__main__":
+    unittest.main()
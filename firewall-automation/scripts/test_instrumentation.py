@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+import urllib.request
+from MyFirewallFunctionProj import instrumentation
+from MyFirewallFunctionProj.firewall_optimizer import optimize_firewalls
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        instrumentation.reset()
+        instrumentation.enable()
+
+    def tearDown(self):
+        instrumentation.enable(False)
+        instrumentation.reset()
+
+    def test_disabled_records_nothing(self):
+        instrumentation.enable(False)
+        with instrumentation.span("work") as timing:
+            timing.annotate(rows=3)
+        instrumentation.inc("rows_total", 5)
+        self.assertIs(instrumentation.span("work"), instrumentation._NOOP_SPAN)
+        self.assertEqual(instrumentation.render_prometheus(), "")
+
+    def test_counters_gauges_and_histograms(self):
+        instrumentation.inc("rows_total", 2, sink="table")
+        instrumentation.inc("rows_total", 3, sink="table")
+        instrumentation.set_gauge("rules_emitted", 7)
+        instrumentation.observe("arm_update_seconds", 0.2)
+        instrumentation.observe("arm_update_seconds", 400)
+        text = instrumentation.render_prometheus()
+        self.assertIn('# TYPE firewall_rows_total counter', text)
+        self.assertIn('firewall_rows_total{sink="table"} 5', text)
+        self.assertIn('firewall_rules_emitted 7', text)
+        self.assertIn('firewall_arm_update_seconds_bucket{le="0.25"} 1', text)
+        self.assertIn('firewall_arm_update_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn('firewall_arm_update_seconds_count 2', text)
+
+    def test_span_records_outcome(self):
+        with self.assertLogs("firewall.metrics", level="INFO") as logs:
+            with self.assertRaises(ValueError):
+                with instrumentation.span("feed_fetch", feed="Spamhaus"):
+                    raise ValueError("boom")
+        self.assertIn('"outcome": "error"', logs.output[0])
+        self.assertIn('firewall_feed_fetch_seconds_count{feed="Spamhaus",outcome="error"} 1',
+                      instrumentation.render_prometheus())
+
+    def test_optimizer_reports_solver_statistics(self):
+        optimize_firewalls()
+        text = instrumentation.render_prometheus()
+        self.assertIn('firewall_optimizer_solves_total{encoding="sum",status="sat"} 1', text)
+        self.assertIn("firewall_optimizer_check_seconds_count", text)
+        self.assertIn("firewall_z3_", text)
+
+    def test_file_and_http_output(self):
+        instrumentation.inc("ticks_total")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = instrumentation.write_metrics(os.path.join(tmpdir, "firewall.prom"))
+            with open(path, encoding="utf-8") as f:
+                self.assertIn("firewall_ticks_total 1", f.read())
+        server = instrumentation.serve_metrics(0)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as response:
+                self.assertIn("firewall_ticks_total 1", response.read().decode("utf-8"))
+        finally:
+            server.shutdown()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import datetime
+import tempfile
+import time
+import unittest
+from azure.core.exceptions import HttpResponseError
+from scripts.blocklist_store import BlocklistStore
+from scripts.feed_fetcher import fetch_feeds
+from scripts.fleet_update import FirewallTarget, update_fleet
+from scripts.load_harness import (FAKE_WRITE_MODELS, FakeMongoClient, FakeNetworkManagementClient, FakeTableClient,
+                                  FeedServer, SyntheticFeed, compare_results, percentile, run_blocklist_scenario, summarize)
+from scripts.pipeline import Pipeline
+from scripts.table_writer import TableWriter
+
+def collections(port):
+    return [{"name": "Load-0", "priority": 100, "action": {"type": "Allow"}, "rules": [{
+        "name": "allow", "protocols": ["TCP"], "source_addresses": ["*"],
+        "destination_addresses": ["10.0.0.4"], "destination_ports": [str(port)]}]}]
+
+class TestFeedServer(unittest.TestCase):
+    def test_serves_churned_feeds_with_etags(self):
+        with tempfile.TemporaryDirectory() as cache_dir, FeedServer([SyntheticFeed("a", 200, churn=0.05), SyntheticFeed("b", 50, seed=1)]) as server:
+            first = fetch_feeds(server.feed_config(), cache_dir=cache_dir)
+            self.assertEqual([len(first[name].entries) for name in ("a", "b")], [200, 50])
+            self.assertEqual(fetch_feeds(server.feed_config(), cache_dir=cache_dir)["a"].status, "not_modified")
+            server.advance()
+            second = fetch_feeds(server.feed_config(), cache_dir=cache_dir)["a"]
+            self.assertEqual(second.status, "fetched")
+            self.assertEqual(len(set(first["a"].entries) - set(second.entries)), 10)
+            self.assertEqual(server.stats["not_modified"], 2)
+
+class TestFakes(unittest.TestCase):
+    def test_fleet_update_survives_throttling_and_overlaps_operations(self):
+        client = FakeNetworkManagementClient(lro_latency=0.2, throttle_rate=0.3, seed=3)
+        targets = [FirewallTarget("sub", "rg", f"fw-{i}") for i in range(4)]
+        start = time.perf_counter()
+        report = update_fleet(targets, collections(22), client_factory=lambda subscription_id: client)
+        self.assertLess(time.perf_counter() - start, 0.6)   # four 0.2 s operations, run side by side
+        self.assertEqual(report["updated"], 4)
+        self.assertGreater(client.azure_firewalls.throttled, 0)
+        self.assertEqual(client.azure_firewalls.firewalls[("rg", "fw-0")][0]["name"], "Load-0")
+        self.assertEqual(update_fleet(targets, collections(22), client_factory=lambda s: client)["unchanged"], 4)
+
+    def test_table_writer_against_fake_table(self):
+        table = FakeTableClient()
+        writer = TableWriter(table)
+        networks = {(4, (10 << 24) + (i << 16), 32): {"sources": ["a"], "confidence": 50.0} for i in range(3)}
+        networks.update({(4, (11 << 24) + i, 32): {"sources": ["b"], "confidence": 50.0} for i in range(250)})
+        self.assertEqual(writer.sync(networks)["upserted"], 253)
+        self.assertEqual(len(table.rows), 253)
+        self.assertEqual(table.transactions, 6)     # three single-row partitions, 250 rows in three batches
+        self.assertEqual(writer.sync(networks)["upserted"], 0)
+        with self.assertRaises(ValueError):
+            table.submit_transaction([("upsert", {"PartitionKey": "p", "RowKey": str(i)}) for i in range(101)])
+        # Deleting a missing row fails the whole transaction; the writer drops that delete and resubmits.
+        with self.assertRaises(HttpResponseError) as raised:
+            table.submit_transaction([("upsert", {"PartitionKey": "p", "RowKey": "a"}), ("delete", {"PartitionKey": "p", "RowKey": "b"})])
+        self.assertEqual(raised.exception.status_code, 404)
+        self.assertNotIn(("p", "a"), table.rows)
+        gone = list(networks)[:2]
+        writer.apply_delta({}, {}, gone)
+        self.assertEqual(writer.apply_delta({}, {}, gone)["deleted"], 2)
+        self.assertEqual(len(table.rows), 251)
+
+    def test_blocklist_store_against_fake_mongo(self):
+        collection = FakeMongoClient()["db"]["blocked"]
+        collection.documents["legacy"] = {"ip": "198.51.100.9", "blocked_at": "2025-01-01T00:00:00"}
+        store = BlocklistStore(collection, write_models=FAKE_WRITE_MODELS)
+        now = datetime.datetime(2026, 1, 1)
+        entries = {"203.0.113.0/24": {"sources": ["x"], "confidence": 50.0}, "198.51.100.7/32": {"sources": ["y"], "confidence": 60.0},
+                   "192.0.2.0/24": {"sources": ["z"], "confidence": 70.0}}
+        self.assertEqual(store.sync(entries, now)["inserted"], 3)
+        self.assertNotIn("legacy", collection.documents)
+        self.assertEqual(store.sync(entries, now)["unchanged"], 3)
+        later = now + datetime.timedelta(days=2)
+        counts = store.apply_delta({}, {}, ["203.0.113.0/24"], ["198.51.100.7/32"], later)
+        self.assertEqual((counts["deleted"], counts["refreshed"]), (1, 1))
+        self.assertEqual(collection.documents["198.51.100.7/32"]["last_seen"], later)
+        self.assertEqual(collection.documents["198.51.100.7/32"]["first_seen"], now)
+        # 192.0.2.0/24 is an orphan (not in the current blocklist): it is left for the TTL index to expire.
+        self.assertEqual(collection.documents["192.0.2.0/24"]["last_seen"], now)
+
+class TestScenarios(unittest.TestCase):
+    def test_blocklist_scenario_reports_stage_percentiles(self):
+        def pipeline_factory(feeds, snapshot_path, feed_cache_dir):
+            from scripts.malip import collect_networks, store_blocked_ips_in_mongodb
+            from scripts.feed_fetcher import iter_feeds
+            pipeline = Pipeline("load")
+            pipeline.add("feeds", lambda: iter_feeds(feeds, cache_dir=feed_cache_dir), stream=True)
+            pipeline.add("networks", lambda feeds: collect_networks(feeds), deps=["feeds"])
+            pipeline.add("mongodb", lambda networks: store_blocked_ips_in_mongodb(networks), deps=["networks"])
+            return pipeline
+        result = run_blocklist_scenario(300, rounds=3, feeds=2, churn=0.1, pipeline_factory=pipeline_factory)
+        self.assertEqual(result["failed"], [])
+        # sync() leaves churned-out networks to the TTL index, so the collection only grows.
+        self.assertGreater(result["counters"]["mongo_documents"], result["entries"])
+        self.assertEqual(result["counters"]["feed_requests"], 6)
+        self.assertEqual(result["warm"]["stages"]["mongodb"]["count"], 2)
+        self.assertGreater(result["cold"]["throughput"], 0)
+
+    def test_blocklist_pipeline_deploys_and_commits_every_round(self):
+        result = run_blocklist_scenario(200, rounds=3, feeds=2, churn=0.1)
+        self.assertEqual(result["failed"], [])
+        self.assertEqual(result["last_round"]["commit"], "ok")
+        self.assertEqual(result["counters"]["arm_calls"]["begin_create_or_update"], 3)
+        # Warm rounds apply deltas, so removed networks leave both sinks.
+        self.assertEqual(result["counters"]["table_rows"], result["entries"])
+        self.assertEqual(result["counters"]["mongo_documents"], result["entries"])
+
+    def test_percentiles_and_regressions(self):
+        self.assertEqual(percentile([5, 1, 4, 2, 3], 50), 3)
+        self.assertEqual(percentile([1, 2], 99), 2)
+        self.assertIsNone(summarize([]))
+        baseline = {"scenarios": {"s": {"warm": {"wall_time": {"p50": 1.0, "p90": 1.0, "max": 1.0}}}}}
+        current = {"scenarios": {"s": {"warm": {"wall_time": {"p50": 1.5, "p90": 1.1, "max": 9.0}}},
+                                 "new": {"warm": {"wall_time": {"p50": 3.0}}}}}
+        self.assertEqual([r["metric"] for r in compare_results(baseline, current)], ["warm.wall_time.p50"])
+
+if __name__ == "__main__":
+    unittest.main()
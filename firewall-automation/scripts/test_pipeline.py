@@ -0,0 +1,98 @@
+import threading
+import time
+import unittest
+from scripts.pipeline import FAILED, OK, SKIPPED, Pipeline
+
+class TestPipeline(unittest.TestCase):
+    def test_results_flow_along_dependencies(self):
+        pipeline = Pipeline()
+        pipeline.add("double", lambda base: base * 2, deps=["base"])
+        pipeline.add("total", lambda base, double: base + double, deps=["base", "double"])
+        report = pipeline.run(base=5)
+        self.assertTrue(report.ok)
+        self.assertEqual(report.value("total"), 15)
+
+    def test_independent_stages_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)   # deadlocks (and fails) if the sinks ran serially
+        pipeline = Pipeline()
+        pipeline.add("source", lambda: [1, 2, 3])
+        pipeline.add("mongodb", lambda source: barrier.wait() is not None, deps=["source"])
+        pipeline.add("table", lambda source: barrier.wait() is not None, deps=["source"])
+        report = pipeline.run()
+        self.assertEqual((report.value("mongodb"), report.value("table")), (True, True))
+
+    def test_failure_skips_dependents_only(self):
+        def broken(source):
+            raise RuntimeError("Table Storage unavailable")
+        pipeline = Pipeline()
+        pipeline.add("source", lambda: 1)
+        pipeline.add("table", broken, deps=["source"])
+        pipeline.add("mongodb", lambda source: source + 1, deps=["source"])
+        pipeline.add("commit", lambda table, mongodb: True, deps=["table", "mongodb"])
+        report = pipeline.run()
+        self.assertEqual(report.failed, ["table"])
+        self.assertEqual(report.stages["mongodb"].status, OK)
+        self.assertEqual(report.stages["commit"].status, SKIPPED)
+        self.assertIsInstance(report.stages["table"].error, RuntimeError)
+
+    def test_when_skips_stage_and_dependents(self):
+        calls = []
+        pipeline = Pipeline()
+        pipeline.add("delta", lambda: [])
+        pipeline.add("firewall", lambda delta: calls.append("firewall"), deps=["delta"], when=lambda delta: bool(delta))
+        pipeline.add("commit", lambda firewall: calls.append("commit"), deps=["firewall"])
+        report = pipeline.run()
+        self.assertEqual(calls, [])
+        self.assertEqual([report.stages[name].status for name in ("firewall", "commit")], [SKIPPED, SKIPPED])
+        self.assertTrue(report.ok)
+
+    def test_stream_applies_backpressure(self):
+        produced = []
+        def produce():
+            for i in range(20):
+                produced.append(i)
+                yield i
+        def consume(numbers):
+            seen = []
+            for n in numbers:
+                time.sleep(0.001)
+                # The producer can run at most queue_size (+1 in hand) items ahead of the consumer.
+                self.assertLessEqual(len(produced) - len(seen), 4)
+                seen.append(n)
+            return seen
+        pipeline = Pipeline()
+        pipeline.add("numbers", produce, stream=True, queue_size=2)
+        pipeline.add("collected", consume, deps=["numbers"])
+        report = pipeline.run()
+        self.assertEqual(report.value("collected"), list(range(20)))
+
+    def test_stream_producer_error_reaches_consumer(self):
+        def produce():
+            yield 1
+            raise OSError("feed down")
+        pipeline = Pipeline()
+        pipeline.add("feeds", produce, stream=True)
+        pipeline.add("networks", lambda feeds: list(feeds), deps=["feeds"])
+        report = pipeline.run()
+        self.assertEqual(report.stages["feeds"].status, FAILED)
+        self.assertEqual(report.stages["networks"].status, FAILED)
+
+    def test_consumer_that_stops_early_releases_producer(self):
+        pipeline = Pipeline()
+        pipeline.add("numbers", lambda: iter(range(10 ** 6)), stream=True, queue_size=1)
+        pipeline.add("first", lambda numbers: next(iter(numbers)), deps=["numbers"])
+        report = pipeline.run()
+        self.assertEqual(report.value("first"), 0)
+        self.assertEqual(report.stages["numbers"].status, OK)
+
+    def test_rejects_bad_graphs(self):
+        with self.assertRaises(ValueError):
+            Pipeline().add("a", lambda b: b, deps=["b"]).run()
+        with self.assertRaises(ValueError):
+            Pipeline().add("s", lambda: [], stream=True).run()
+        pipeline = Pipeline().add("s", lambda: [], stream=True).add("a", list, deps=["s"])
+        with self.assertRaises(ValueError):
+            pipeline.add("b", list, deps=["s"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import random
+import unittest
+
+try:
+    import numpy as np
+    from scripts.policy_simulator import CompiledPolicy, flow_columns, simulate
+except ImportError:  # numpy is optional for the rest of the project
+    np = None
+
+from scripts.rule_analyzer import PROTOCOLS, compile_rules
+from scripts.rules import firewall_rules
+
+def python_match(boxes, packet):
+    for index, box in enumerate(boxes):
+        if all(any(lo <= value <= hi for lo, hi in dim) for value, dim in zip(packet, box.dims)):
+            return index
+    return -1
+
+def random_rules(rng, count):
+    rules = []
+    for i in range(count):
+        rules.append({
+            "name": f"R{i}", "priority": 100 + i, "action": rng.choice(["Allow", "Deny"]),
+            "protocols": [rng.choice(["TCP", "UDP", "ICMP", "Any"])],
+            "source_addresses": [rng.choice(["*", "10.0.0.0/8", "192.168.1.0/24"])],
+            "destination_addresses": [f"20.0.{rng.randrange(4)}.0/{rng.choice([22, 24, 30, 32])}"],
+            "destination_ports": [rng.choice(["*", "22", "80", "443", "1000-2000"])],
+        })
+    return rules
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestPolicySimulator(unittest.TestCase):
+    def random_flows(self, rng, count):
+        return {
+            "src": np.array([rng.choice([0x0A000001, 0xC0A80105, 0x01020304]) for _ in range(count)], dtype=np.uint32),
+            "dst": np.array([(20 << 24) | (rng.randrange(5) << 8) | rng.randrange(256) for _ in range(count)], dtype=np.uint32),
+            "port": np.array([rng.choice([22, 80, 443, 1500, 8080]) for _ in range(count)], dtype=np.uint16),
+            "protocol": np.array([rng.randrange(len(PROTOCOLS)) for _ in range(count)], dtype=np.uint8),
+        }
+
+    def test_matches_first_match_semantics(self):
+        rng = random.Random(4)
+        rules = random_rules(rng, 150)   # more than 64 rules: multi-word bitsets
+        boxes = compile_rules(rules)
+        flows = self.random_flows(rng, 3000)
+        matches = CompiledPolicy(rules).match(flows["src"], flows["dst"], flows["port"], flows["protocol"])
+        for i in range(len(matches)):
+            packet = (int(flows["src"][i]), int(flows["dst"][i]), int(flows["port"][i]), int(flows["protocol"][i]))
+            self.assertEqual(matches[i], python_match(boxes, packet))
+
+    def test_repo_rules(self):
+        flows = flow_columns([("1.2.3.4", "20.169.181.2", 22, "TCP"), ("1.2.3.4", "20.169.181.2", 80, "TCP"),
+                              ("1.2.3.4", "20.169.181.2", 443, "TCP")])
+        report = simulate(firewall_rules, flows, max_workers=1)
+        self.assertEqual(report["hit_counts"], {"BlockSSH": 1, "AllowHTTP": 1, "<default>": 1})
+        self.assertEqual((report["allowed"], report["denied"]), (1, 2))
+
+    def test_changed_verdicts_across_processes(self):
+        rng = random.Random(6)
+        current = random_rules(rng, 40)
+        proposed = [dict(rule, action="Deny") if rule["name"] == "R3" else rule for rule in current]
+        flows = self.random_flows(rng, 5000)
+        serial = simulate(proposed, flows, current_rules=current, max_workers=1)
+        parallel = simulate(proposed, flows, current_rules=current, max_workers=2, chunk_size=1000)
+        self.assertEqual(serial["hit_counts"], parallel["hit_counts"])
+        self.assertEqual(list(serial["changed"]), list(parallel["changed"]))
+        r3_hits = serial["hit_counts"]["R3"]
+        self.assertEqual(len(serial["changed"]), r3_hits if current[3]["action"] == "Allow" else 0)
+
+if __name__ == '__main__':
+    unittest.main()
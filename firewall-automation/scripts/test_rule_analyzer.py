@@ -0,0 +1,71 @@
+import itertools
+import random
+import unittest
+from scripts.rule_analyzer import analyze_rules, compile_rules, overlapping_pairs
+from scripts.rules import firewall_rules
+
+def rule(name, priority, action, dst, ports, protocols=("TCP",), src=("*",)):
+    return {"name": name, "priority": priority, "action": action, "protocols": list(protocols),
+            "source_addresses": list(src), "destination_addresses": list(dst), "destination_ports": list(ports)}
+
+def first_match(boxes, packet):
+    for box in boxes:
+        if all(any(lo <= value <= hi for lo, hi in dim) for value, dim in zip(packet, box.dims)):
+            return box.action
+    return None
+
+class TestRuleAnalyzer(unittest.TestCase):
+    RULES = [
+        rule("AllowWeb", 100, "Allow", ["10.0.0.0/24"], ["80", "443"]),
+        rule("DenyNet", 110, "Deny", ["10.0.0.0/16"], ["*"], ["Any"]),
+        rule("AllowHttpHost", 120, "Allow", ["10.0.0.5"], ["80"]),             # covered by AllowWeb
+        rule("AllowSshHost", 130, "Allow", ["10.0.0.5"], ["22"]),              # covered by DenyNet
+        rule("AllowSsh", 140, "Allow", ["10.0.1.0/24", "192.0.2.0/24"], ["22"]),  # correlated with DenyNet
+        rule("AllowDns1", 150, "Allow", ["198.51.100.1"], ["53"], ["UDP"]),
+        rule("AllowDns2", 160, "Allow", ["198.51.100.2"], ["53"], ["UDP"]),    # mergeable with AllowDns1
+        rule("AllowDns3", 170, "Allow", ["198.51.100.3"], ["53"], ["UDP"]),
+    ]
+
+    def test_anomalies(self):
+        report = analyze_rules(self.RULES)
+        self.assertEqual([r["rule"] for r in report["shadowed"]], ["AllowSshHost"])
+        self.assertEqual([r["rule"] for r in report["redundant"]], ["AllowHttpHost"])
+        self.assertIn({"rule": "AllowSsh", "with": "DenyNet"}, report["correlated"])
+        self.assertIn(["AllowDns1", "AllowDns2", "AllowDns3"], report["mergeable"])
+        dns = [r for r in report["minimized"] if r["name"] == "AllowDns1"][0]
+        self.assertEqual(dns["destination_addresses"], ["198.51.100.1", "198.51.100.2/31"])
+        self.assertEqual(report["stats"], {"rules": 8, "minimized_rules": 4})
+
+    def test_no_false_positives_on_repo_rules(self):
+        report = analyze_rules(firewall_rules)
+        self.assertFalse(report["shadowed"] or report["redundant"] or report["mergeable"])
+
+    def test_minimized_set_is_equivalent(self):
+        rng = random.Random(8)
+        rules = []
+        for i in range(60):
+            dst = [f"10.0.{rng.randrange(4)}.{rng.choice([0, 64, 128])}/{rng.choice([25, 26, 32])}"]
+            ports = [rng.choice(["22", "80", "443", "80-443", "*"])]
+            rules.append(rule(f"R{i}", i, rng.choice(["Allow", "Deny"]), dst, ports, [rng.choice(["TCP", "UDP", "Any"])]))
+        original = compile_rules(rules)
+        minimized = compile_rules(analyze_rules(rules)["minimized"])
+        self.assertLess(len(minimized), len(original))
+        addresses = [(10 << 24) | (k << 8) | host for k in range(5) for host in (0, 1, 63, 64, 65, 127, 128, 200, 255)]
+        for packet in itertools.product([0], addresses, [22, 80, 100, 443, 8080], [0, 1, 2]):
+            self.assertEqual(first_match(minimized, packet), first_match(original, packet), packet)
+
+    def test_overlapping_pairs_match_brute_force(self):
+        rng = random.Random(5)
+        rules = []
+        for i in range(120):
+            pick = lambda values: [rng.choice(values)]
+            rules.append(rule(f"R{i}", i, rng.choice(["Allow", "Deny"]),
+                              pick(["*", "10.0.0.0/24", "10.0.0.5", "10.0.1.0/24", "2001:db8::/32"]),
+                              pick(["*", "22", "80-443", "1000-2000"]), pick(["TCP", "UDP", "Any"]),
+                              pick(["*", "10.0.0.0/8", "192.168.1.5", "172.16.0.0/12"])))
+        boxes = compile_rules(rules)
+        expected = {(i, j) for i, j in itertools.combinations(range(len(boxes)), 2) if boxes[i].intersects(boxes[j])}
+        self.assertEqual(set(overlapping_pairs(boxes)), expected)
+
+if __name__ == '__main__':
+    unittest.main()
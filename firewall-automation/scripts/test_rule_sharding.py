@@ -0,0 +1,42 @@
+import random
+import unittest
+from scripts.rule_sharding import ShardLimits, is_shard_of, shard_blocklist
+
+def random_prefixes(rng, count):
+    return sorted({f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.0/24" for _ in range(count)})
+
+class TestRuleSharding(unittest.TestCase):
+    LIMITS = ShardLimits(addresses_per_rule=10, rules_per_collection=5, collections=8, addresses_per_firewall=400)
+
+    def test_limits_are_respected(self):
+        prefixes = random_prefixes(random.Random(1), 350)
+        collections = shard_blocklist(prefixes, limits=self.LIMITS)
+        packed = [a for c in collections for r in c["rules"] for a in r["destination_addresses"]]
+        self.assertEqual(sorted(packed), prefixes)
+        self.assertLessEqual(len(collections), 8)
+        for collection in collections:
+            self.assertLessEqual(len(collection["rules"]), 5)
+            self.assertTrue(all(len(r["destination_addresses"]) <= 10 for r in collection["rules"]))
+            self.assertEqual(collection["priority"], 200 + int(collection["name"].rsplit("-", 1)[1]))
+
+    def test_small_change_touches_few_shards(self):
+        rng = random.Random(2)
+        prefixes = random_prefixes(rng, 200)
+        before = {c["name"]: c for c in shard_blocklist(prefixes, limits=self.LIMITS)}
+        changed = prefixes[1:] + ["198.51.100.0/24"]
+        after = {c["name"]: c for c in shard_blocklist(changed, limits=self.LIMITS)}
+        touched = [name for name in set(before) | set(after) if before.get(name) != after.get(name)]
+        self.assertLessEqual(len(touched), 2)
+
+    def test_capacity_is_enforced(self):
+        with self.assertRaises(ValueError):
+            shard_blocklist(random_prefixes(random.Random(3), 500), limits=self.LIMITS)
+
+    def test_is_shard_of(self):
+        self.assertTrue(is_shard_of("BlockMaliciousIPs-07"))
+        self.assertTrue(is_shard_of("BlockMaliciousIPs"))
+        self.assertFalse(is_shard_of("BlockMaliciousIPs-extra"))
+        self.assertFalse(is_shard_of("AllowRules"))
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
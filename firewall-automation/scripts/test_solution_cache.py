@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from MyFirewallFunctionProj.solution_cache import SolutionCache, run_cached, solution_key
+
+TOPOLOGY = {"aps": ["a", "b", "c"], "links": [["a", "b"], ["b", "c"]]}
+NSRS = [
+    {"name": "block_a_c", "source": "a", "destination": "c", "action": "Deny"},
+    {"name": "allow_a_b", "source": "a", "destination": "b", "action": "Allow"},
+]
+
+class TestSolutionCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = SolutionCache(os.path.join(self.tmpdir.name, "cache.sqlite3"), max_entries=2)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def test_key_ignores_ordering(self):
+        shuffled = {"aps": ["c", "b", "a"], "links": [["c", "b"], ["b", "a"]]}
+        reordered_nsrs = [dict(reversed(list(nsr.items()))) for nsr in reversed(NSRS)]
+        self.assertEqual(solution_key(TOPOLOGY, NSRS), solution_key(shuffled, reordered_nsrs))
+        self.assertNotEqual(solution_key(TOPOLOGY, NSRS), solution_key(TOPOLOGY, NSRS[:1]))
+
+    def test_hit_skips_solve_and_deploy(self):
+        deployed = []
+        result, hit = run_cached(deployed.append, TOPOLOGY, NSRS, cache=self.cache)
+        self.assertFalse(hit)
+        cached, hit = run_cached(deployed.append, TOPOLOGY, NSRS, cache=self.cache)
+        self.assertTrue(hit)
+        self.assertEqual(cached, result)
+        self.assertEqual(len(deployed), 1)
+        self.assertEqual(self.cache.stats()["total_hits"], 1)
+
+    def test_failed_deploy_is_not_cached(self):
+        def deploy(result):
+            raise RuntimeError("ARM unavailable")
+        with self.assertRaises(RuntimeError):
+            run_cached(deploy, TOPOLOGY, NSRS, cache=self.cache)
+        self.assertIsNone(self.cache.get(solution_key(TOPOLOGY, NSRS)))
+
+    def test_eviction_keeps_most_recent(self):
+        for i in range(3):
+            self.cache.put(f"key{i}", {"n": i})
+        self.assertIsNone(self.cache.get("key0"))
+        self.assertEqual(self.cache.get("key2"), {"n": 2})
+        self.assertEqual(self.cache.stats()["entries"], 2)
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,120 @@
+import threading
+import unittest
+from azure.core.exceptions import HttpResponseError
+from azure.data.tables import TableTransactionError
+from scripts.feed_parser import parse_network
+from scripts.load_harness import partition_filter
+from scripts.table_writer import TableWriter, partition_key, row_key
+
+class FakeTableClient:
+    """In-memory stand-in for azure.data.tables.TableClient with the service's transaction rules."""
+
+    def __init__(self, throttle_first=0):
+        self.rows = {}
+        self.transactions = []
+        self.throttle_first = throttle_first
+        self.lock = threading.Lock()
+
+    def query_entities(self, query_filter, select=None, parameters=None):
+        matches = partition_filter(query_filter, parameters)
+        return [dict(row) for row in self.rows.values() if matches(row["PartitionKey"])]
+
+    def delete_entity(self, partition_key, row_key):
+        with self.lock:
+            self.rows.pop((partition_key, row_key), None)
+
+    def submit_transaction(self, operations):
+        operations = list(operations)
+        with self.lock:
+            if self.throttle_first:
+                self.throttle_first -= 1
+                error = HttpResponseError(message="Too Many Requests")
+                error.status_code = 429
+                raise error
+            if len(operations) > 100 or len({op[1]["PartitionKey"] for op in operations}) != 1:
+                raise HttpResponseError(message="Invalid batch")
+            # Transactions are atomic: a delete of a missing row fails all of it with 404.
+            for index, op in enumerate(operations):
+                if op[0] == "delete" and (op[1]["PartitionKey"], op[1]["RowKey"]) not in self.rows:
+                    error = TableTransactionError(message=f"{index}:The specified resource does not exist.")
+                    error.status_code = 404
+                    raise error
+            self.transactions.append(operations)
+            for op in operations:
+                key = (op[1]["PartitionKey"], op[1]["RowKey"])
+                if "/" in key[1]:
+                    raise HttpResponseError(message="Invalid RowKey")
+                if op[0] == "delete":
+                    self.rows.pop(key, None)
+                else:
+                    self.rows[key] = dict(self.rows.get(key, {}), **op[1])
+
+def networks(count):
+    return {
+        parse_network(f"10.{i % 4}.{i // 256 % 256}.{i % 256}"): {"sources": ["FireHOL"], "confidence": 70.0}
+        for i in range(count)
+    }
+
+class TestTableWriter(unittest.TestCase):
+    def test_keys(self):
+        self.assertEqual(partition_key(parse_network("203.0.113.0/24")), "v4-203.0")
+        self.assertEqual(partition_key(parse_network("2001:db8::/32")), "v6-20010db8")
+        self.assertEqual(row_key("203.0.113.0/24"), "203.0.113.0_24")
+
+    def test_batches_are_partitioned_and_bounded(self):
+        table = FakeTableClient()
+        counts = TableWriter(table).sync(networks(1000))
+        self.assertEqual(counts["upserted"], 1000)
+        self.assertEqual(len(table.rows), 1000)
+        self.assertEqual(counts["partitions"], 4)
+        self.assertEqual(counts["batches"], 12)  # 250 rows per partition -> 100 + 100 + 50
+
+    def test_only_changed_rows_are_written(self):
+        table = FakeTableClient()
+        writer = TableWriter(table)
+        entries = networks(300)
+        writer.sync(entries)
+        table.transactions.clear()
+        self.assertEqual(writer.sync(entries)["batches"], 0)
+
+        key = next(iter(entries))
+        entries[key] = {"sources": ["FireHOL", "Spamhaus"], "confidence": 94.0}
+        removed = list(entries)[-1]
+        del entries[removed]
+        counts = writer.sync(entries, delete_missing=True)
+        self.assertEqual((counts["upserted"], counts["deleted"]), (1, 1))
+        self.assertEqual(len(table.rows), 299)
+
+    def test_replayed_delta_skips_rows_already_deleted(self):
+        table = FakeTableClient()
+        writer = TableWriter(table)
+        entries = networks(10)
+        writer.sync(entries)
+        removed = list(entries)[:3]
+        writer.apply_delta({}, {}, removed)
+        added = {parse_network("10.0.9.9/32"): {"sources": ["FireHOL"], "confidence": 70.0}}
+        counts = writer.apply_delta(added, {}, removed)
+        self.assertEqual(counts["retries"], 0)
+        self.assertEqual(len(table.rows), 8)
+
+    def test_only_managed_partitions_are_listed(self):
+        table = FakeTableClient()
+        writer = TableWriter(table)
+        table.rows.update({("BlockedIP", f"198.51.100.{i}"): {"PartitionKey": "BlockedIP", "RowKey": f"198.51.100.{i}"}
+                           for i in range(150)})
+        entries = networks(20)
+        writer.sync(entries, delete_missing=True)
+        self.assertEqual(len(writer.load_rows()), 20)
+        self.assertEqual(len(table.rows), 170)
+        self.assertEqual(writer.delete_partition("BlockedIP")["deleted"], 150)
+        self.assertEqual(len(table.rows), 20)
+        self.assertEqual(writer.delete_partition("BlockedIP")["batches"], 0)
+
+    def test_throttling_is_retried(self):
+        table = FakeTableClient(throttle_first=2)
+        counts = TableWriter(table, backoff_seconds=0.001).sync(networks(50))
+        self.assertEqual(counts["retries"], 2)
+        self.assertEqual(len(table.rows), 50)
+
+if __name__ == '__main__':
+    unittest.main()
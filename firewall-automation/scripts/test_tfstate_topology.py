@@ -0,0 +1,119 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from MyFirewallFunctionProj import tfstate_topology
+from MyFirewallFunctionProj.example_network import DEFAULT_NSRS
+from MyFirewallFunctionProj.firewall_optimizer import optimize_firewalls, resolve_paths
+from MyFirewallFunctionProj.tfstate_topology import check_nsrs, load_topology, parse_tfstate
+
+SUBNET_ID = "/subscriptions/s/resourceGroups/firewall-rg/providers/Microsoft.Network/virtualNetworks/firewall-vnet/subnets/"
+
+def resource(kind, name, instances):
+    return {"mode": "managed", "type": kind, "name": name, "provider": "provider[\"registry.terraform.io/hashicorp/azurerm\"]",
+            "instances": [{"index_key": key, "attributes": attributes} for key, attributes in instances]}
+
+def example_state(forced=("frontend", "backend")):
+    subnets = [(name, {"id": SUBNET_ID + name, "name": name, "virtual_network_name": "firewall-vnet",
+                       "address_prefixes": [prefix]})
+               for name, prefix in [("frontend", "10.0.1.0/24"), ("backend", "10.0.2.0/24"), ("dmz", "10.0.3.0/24")]]
+    return {"version": 4, "terraform_version": "1.10.5", "serial": 3, "resources": [
+        resource("azurerm_subnet", "subnets", subnets),
+        resource("azurerm_firewall", "fw", [(None, {
+            "id": "fw-id", "name": "azure-firewall", "resource_group_name": "firewall-rg", "firewall_policy_id": "policy-id",
+            "ip_configuration": [{"name": "configuration", "subnet_id": SUBNET_ID + "dmz", "private_ip_address": "10.0.3.4"}]})]),
+        resource("azurerm_route_table", "via_fw", [(None, {"id": "rt-id", "name": "via-fw", "route": [
+            {"name": "all", "address_prefix": "0.0.0.0/0", "next_hop_type": "VirtualAppliance", "next_hop_in_ip_address": "10.0.3.4"}]})]),
+        resource("azurerm_subnet_route_table_association", "assoc",
+                 [(name, {"subnet_id": SUBNET_ID + name, "route_table_id": "rt-id"}) for name in forced]),
+        resource("azurerm_firewall_network_rule_collection", "allow_rules", [(None, {
+            "name": "AllowRules", "azure_firewall_name": "azure-firewall", "priority": 100, "action": "Allow",
+            "rule": [{"name": "AllowSSH", "protocols": ["TCP"], "source_addresses": ["*"],
+                      "destination_addresses": ["10.0.2.4"], "destination_ports": ["22"]}]})]),
+        resource("azurerm_firewall_policy_rule_collection_group", "group", [(None, {
+            "name": "group", "priority": 200, "firewall_policy_id": "policy-id",
+            "network_rule_collection": [{"name": "Deny", "priority": 300, "action": "Deny", "rule": [
+                {"name": "NoRDP", "protocols": ["Tcp"], "source_addresses": ["*"], "destination_addresses": ["*"],
+                 "destination_ports": ["3389"]}]}]})]),
+    ]}
+
+class TestTfstateTopology(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "terraform.tfstate")
+        self.cache_dir = os.path.join(self.tmpdir.name, "cache")
+        self.write(example_state())
+        tfstate_topology._memory.clear()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, state):
+        with open(self.path, "w") as f:
+            json.dump(state, f, indent=2)
+
+    def test_extracts_subnets_firewalls_and_rules(self):
+        topology = parse_tfstate(self.path)
+        self.assertEqual(topology["aps"], ["backend", "dmz", "frontend"])
+        self.assertEqual(topology["links"], [["backend", "dmz"], ["dmz", "frontend"]])
+        self.assertEqual(topology["firewalls"]["azure-firewall"]["subnet"], "dmz")
+        self.assertEqual(topology["subnets"]["backend"]["address_prefixes"], ["10.0.2.0/24"])
+        collections = {c["name"]: c for c in topology["rule_collections"]}
+        self.assertEqual(collections["AllowRules"]["rules"][0]["destination_ports"], ["22"])
+        self.assertEqual(collections["Deny"]["firewall"], "azure-firewall")
+        self.assertEqual(collections["Deny"]["rules"][0]["protocols"], ["TCP"])
+
+    def test_forced_subnets_route_through_firewall(self):
+        topology = parse_tfstate(self.path)
+        nsr = {"name": "n", "source": "frontend", "destination": "backend", "action": "Deny"}
+        self.assertEqual(resolve_paths(topology, [nsr]), [["frontend", "dmz", "backend"]])
+        self.write(example_state(forced=()))
+        self.assertIn(["backend", "frontend"], parse_tfstate(self.path)["links"])
+
+    def test_feeds_the_optimizer(self):
+        result = optimize_firewalls(parse_tfstate(self.path), DEFAULT_NSRS)
+        self.assertEqual(result["total_firewalls_deployed"], 1)
+
+    @unittest.skipIf(tfstate_topology.ijson is None, "ijson is not installed")
+    def test_streaming_matches_json(self):
+        self.assertEqual(parse_tfstate(self.path, stream=True), parse_tfstate(self.path, stream=False))
+
+    def test_rejects_other_state_versions(self):
+        self.write(dict(example_state(), version=3))
+        with self.assertRaises(ValueError):
+            parse_tfstate(self.path)
+
+    def test_cache_reparses_only_on_content_change(self):
+        with mock.patch.object(tfstate_topology, "parse_tfstate", wraps=tfstate_topology.parse_tfstate) as parse:
+            first = load_topology(self.path, self.cache_dir)
+            self.assertIs(load_topology(self.path, self.cache_dir), first)
+            os.utime(self.path, ns=(0, 10 ** 9))   # touched, same content
+            self.assertIs(load_topology(self.path, self.cache_dir), first)
+            tfstate_topology._memory.clear()          # a fresh worker process reads the disk cache
+            self.assertEqual(load_topology(self.path, self.cache_dir), first)
+            self.assertEqual(parse.call_count, 1)
+            self.write(example_state(forced=()))
+            self.assertNotEqual(load_topology(self.path, self.cache_dir)["links"], first["links"])
+            self.assertEqual(parse.call_count, 2)
+
+    def test_rejects_state_without_subnets(self):
+        self.write({"version": 4, "terraform_version": "1.10.5", "serial": 1, "resources": []})
+        with self.assertRaisesRegex(ValueError, "no azurerm_subnet instances"):
+            load_topology(self.path, self.cache_dir)
+
+    def test_rejects_nsrs_outside_the_state(self):
+        topology = parse_tfstate(self.path)
+        check_nsrs(topology, DEFAULT_NSRS, self.path)
+        nsr = {"name": "n", "source": "frontend", "destination": "db", "action": "Deny"}
+        with self.assertRaises(ValueError) as raised:
+            check_nsrs(topology, [nsr], self.path)
+        self.assertIn(self.path, str(raised.exception))
+        self.assertIn("NSR 'n' destination 'db'", str(raised.exception))
+        with mock.patch.object(tfstate_topology, "TFSTATE_PATH", self.path):
+            self.assertEqual(tfstate_topology.configured_topology()["aps"], ["backend", "dmz", "frontend"])
+            with self.assertRaisesRegex(ValueError, "terraform.tfstate"):
+                tfstate_topology.configured_topology([nsr])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import random
+import unittest
+from z3 import Not
+from MyFirewallFunctionProj.example_network import DEFAULT_NSRS, DEFAULT_TOPOLOGY
+from MyFirewallFunctionProj.firewall_optimizer import InfeasibleError, build_model, solve_model
+from MyFirewallFunctionProj.optimizer_session import OptimizerSession
+from MyFirewallFunctionProj.what_if import evaluate_scenarios
+from scripts.synthetic_topology import generate_topology
+
+def cold_cost(topology, nsrs, scenario):
+    removed = set(scenario.get("remove_nsrs", ()))
+    actions = scenario.get("set_actions", {})
+    nsrs = [dict(nsr, action=actions.get(nsr["name"], nsr.get("action", "Deny")))
+            for nsr in nsrs if nsr["name"] not in removed] + list(scenario.get("add_nsrs", ()))
+    model = build_model(topology, nsrs)
+    model.optimizer.add([Not(model.fw_alloc[ap]) for ap in scenario.get("forbid_firewalls", ())])
+    model.optimizer.add([model.fw_alloc[ap] for ap in scenario.get("require_firewalls", ())])
+    try:
+        return solve_model(model)["total_cost"]
+    except InfeasibleError:
+        return None
+
+class TestWhatIf(unittest.TestCase):
+    def test_example_scenarios(self):
+        report = evaluate_scenarios(DEFAULT_TOPOLOGY, DEFAULT_NSRS, [
+            {"name": "no firewalls on the path", "forbid_firewalls": ["frontend", "backend"]},
+            {"name": "frontend allowed", "set_actions": {"block_frontend_backend": "Allow"}},
+            {"name": "dmz firewall", "require_firewalls": ["dmz"]},
+        ])
+        infeasible, allowed, required = report["scenarios"]
+        self.assertFalse(infeasible["feasible"])
+        self.assertEqual(infeasible["unsat_core"],
+                         ["forbid_firewall:backend", "forbid_firewall:frontend", "nsr:block_frontend_backend"])
+        self.assertEqual((allowed["feasible"], allowed["total_cost"], allowed["changed_aps"]), (True, 0, ["frontend"]))
+        self.assertEqual(required["total_cost"], report["baseline"]["total_cost"] + 1)
+
+    def test_matches_cold_solves_and_restores_session(self):
+        topology, nsrs = generate_topology(60, seed=3)
+        rng = random.Random(5)
+        scenarios = []
+        for i in range(15):
+            nsr = rng.choice(nsrs)
+            scenarios.append(rng.choice([
+                {"forbid_firewalls": [rng.choice(topology["aps"])]},
+                {"set_actions": {nsr["name"]: "Allow" if nsr.get("action") == "Deny" else "Deny"}},
+                {"remove_nsrs": [nsr["name"]]},
+                {"add_nsrs": [dict(nsr, name=f"extra{i}", action="Deny")]},
+            ]))
+        session = OptimizerSession(topology, nsrs)
+        report = evaluate_scenarios(topology, nsrs, scenarios, session=session)
+        for scenario, outcome in zip(scenarios, report["scenarios"]):
+            self.assertEqual(outcome["total_cost"], cold_cost(topology, nsrs, scenario), scenario)
+        self.assertEqual(sorted(session.nsr_names), sorted(nsr["name"] for nsr in nsrs))
+        self.assertEqual(session.solve()["total_cost"], report["baseline"]["total_cost"])
+
+    def test_rejects_unknown_references(self):
+        for scenario in ({"forbid_firewalls": ["nowhere"]}, {"remove_nsrs": ["missing"]}, {"flip": []}):
+            with self.assertRaises(ValueError):
+                evaluate_scenarios(DEFAULT_TOPOLOGY, DEFAULT_NSRS, [scenario])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,16 +5,22 @@ This module integrates the output of a Z3‑based firewall optimizer with Azure
 It:
   1. Retrieves the optimized firewall allocation from the optimization model.
   2. Constructs a list of network rules based on the optimization.
-  3. Updates an Azure Firewall network rule collection using the Azure SDK for Python.
+  3. Updates an Azure Firewall network rule collection using the Azure SDK for Python,
+     skipping the update entirely when the deployed collection already matches.
+  4. In fleet mode (FIREWALL_INVENTORY), does the same for a whole inventory of firewalls in
+     parallel (see fleet_update).
 
 Usage:
   Run this script to update your Azure Firewall configuration with optimized rules.
 """
 import unittest
 import datetime
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.network import NetworkManagementClient
-from MyFirewallFunctionProj.firewall_optimizer import optimize_firewalls
+from scripts.azure_clients import get_network_client
+from scripts.firewall_diff import apply_diff, diff_collections
+from scripts.fleet_update import INVENTORY_PATH, MAX_WORKERS, load_inventory, update_fleet
+from scripts.pipeline import Pipeline
+from scripts.rule_analyzer import analyze_rules
+from MyFirewallFunctionProj.instrumentation import inc, set_gauge, span, write_metrics
 
 # Replace these with your actual Azure subscription and resource details.
 SUBSCRIPTION_ID = "c4a7542d-5884-4ab6-a0f3-d18cac5525eb"
@@ -23,12 +29,15 @@ FIREWALL_NAME = "myAzureFirewall"
 RULE_COLLECTION_NAME = "AllowRules"   # Name of the rule collection to update
 PRIORITY = 100                        # Priority for the rule collection
 
-def update_azure_firewall():
-    # Step 1: Run the optimization model.
-    result = optimize_firewalls()
-    print("Optimization result:", result)
+def fetch_current_firewall():
+    """The deployed Azure Firewall configuration."""
+    with span("arm_get", firewall=FIREWALL_NAME):
+        firewall = get_network_client(SUBSCRIPTION_ID).azure_firewalls.get(RESOURCE_GROUP, FIREWALL_NAME)
+    print("Retrieved firewall configuration.")
+    return firewall
 
-    # Step 2: Build a list of network rules based on optimization output.
+def build_rules(result):
+    """The rules.py-style rules an optimization result calls for."""
     rules = []
     # Example: For 'frontend', if a firewall is deployed, add a rule to block SSH traffic.
     if result["firewall_allocation"].get("frontend", False):
@@ -49,7 +58,8 @@ def update_azure_firewall():
             "destination_ports": ["80"]
         })
     # Example: For 'dmz', if a firewall is deployed and the allow rule is required, add a rule for HTTPS.
-    if result["firewall_allocation"].get("dmz", False) and result.get("allow_rule_dmz_backend", False):
+    allow_dmz_backend = result.get("allow_rule_dmz_backend", result.get("allow_rules", {}).get("allow_rule_dmz_backend", False))
+    if result["firewall_allocation"].get("dmz", False) and allow_dmz_backend:
         rules.append({
             "name": "AllowHTTPS",
             "protocols": ["TCP"],
@@ -57,20 +67,18 @@ def update_azure_firewall():
             "destination_addresses": ["20.169.181.2"],  # Replace with target IP address
             "destination_ports": ["443"]
         })
+    return rules
 
-    # Step 3: Authenticate with Azure and create a Network Management client.
-    credential = DefaultAzureCredential()
-    network_client = NetworkManagementClient(credential, SUBSCRIPTION_ID)
-
-    # Step 4: Build the list of NetworkRule objects.
-    from azure.mgmt.network import (
-        NetworkRule,
-        NetworkRuleCollection,
-        RuleCollectionType
+def build_rule_collection(rules):
+    """The AzureFirewallNetworkRuleCollection holding `rules`."""
+    from azure.mgmt.network.models import (
+        AzureFirewallNetworkRule,
+        AzureFirewallNetworkRuleCollection,
+        AzureFirewallRCAction
     )
     network_rules = []
     for rule in rules:
-        network_rule = NetworkRule(
+        network_rule = AzureFirewallNetworkRule(
             name=rule["name"],
             protocols=rule["protocols"],
             source_addresses=rule["source_addresses"],
@@ -79,39 +87,62 @@ def update_azure_firewall():
         )
         network_rules.append(network_rule)
 
-    # Step 5: Create or update the network rule collection.
-    rule_collection = NetworkRuleCollection(
+    rule_collection = AzureFirewallNetworkRuleCollection(
         name=RULE_COLLECTION_NAME,
         priority=PRIORITY,
-        action={"type": "Allow"},  # Change to "Deny" if desired.
-        rules=network_rules,
-        rule_collection_type=RuleCollectionType.NetworkRule
+        action=AzureFirewallRCAction(type="Allow"),  # Change to "Deny" if desired.
+        rules=network_rules
     )
+    return rule_collection
 
-    # Step 6: Retrieve the current Azure Firewall configuration.
-    firewall = network_client.azure_firewalls.get(RESOURCE_GROUP, FIREWALL_NAME)
-    print("Retrieved firewall configuration.")
+def update_azure_firewall(result=None, firewall=None):
+    # Step 1: Run the optimization model, unless the caller already has a result.
+    # The optimizer (and Z3) is only imported when it is actually needed.
+    if result is None:
+        from MyFirewallFunctionProj.firewall_optimizer import optimize_firewalls
+        result = optimize_firewalls()
+    print("Optimization result:", result)
+
+    # Step 2: Build a list of network rules based on optimization output.
+    rules = build_rules(result)
+
+    # Step 2b: Check the rule set for shadowed, redundant and mergeable rules before deploying.
+    # Every rule in the collection shares its Allow action, so priority order does not matter here.
+    with span("rule_analysis"):
+        analysis = analyze_rules(rules, default_action="Allow")
+    set_gauge("firewall_rules_emitted", len(rules), collection=RULE_COLLECTION_NAME)
+    set_gauge("rule_analysis_findings", len(analysis["shadowed"]) + len(analysis["redundant"]))
+    for finding in analysis["shadowed"] + analysis["redundant"]:
+        print("Rule analysis warning:", finding)
+    if analysis["mergeable"]:
+        print("Rule analysis: mergeable rules", analysis["mergeable"])
 
-    # Step 7: Update the firewall's network rule collections.
-    # We'll replace (or add) the collection with our new rules.
-    updated_collections = []
-    collection_found = False
-    if firewall.network_rule_collections:
-        for col in firewall.network_rule_collections:
-            if col.name == RULE_COLLECTION_NAME:
-                updated_collections.append(rule_collection)
-                collection_found = True
-            else:
-                updated_collections.append(col)
-    if not collection_found:
-        updated_collections.append(rule_collection)
-
-    firewall.network_rule_collections = updated_collections
-
-    # Step 8: Update the firewall with the new configuration.
+    # Step 3: Get the process-wide Network Management client (credential and token are reused).
+    network_client = get_network_client(SUBSCRIPTION_ID)
+
+    # Step 4: Build the network rule objects and the rule collection holding them.
+    rule_collection = build_rule_collection(rules)
+
+    # Step 5: Retrieve the current Azure Firewall configuration, unless the caller already fetched it.
+    if firewall is None:
+        firewall = fetch_current_firewall()
+
+    # Step 6: Diff our collection against the deployed one and splice in only what changed.
+    current_collections = firewall.network_rule_collections or []
+    diff = diff_collections([rule_collection], current_collections)
+    print("Rule collection diff:", diff.summary())
+    inc("firewall_updates_total", firewall=FIREWALL_NAME, changed=diff.has_changes)
+    if not diff.has_changes:
+        print("Firewall already up to date; skipping update.")
+        return diff
+
+    firewall.network_rule_collections = apply_diff(current_collections, [rule_collection], diff)
+
+    # Step 7: Update the firewall with the new configuration.
     print("Updating Azure Firewall...")
-    poller = network_client.azure_firewalls.begin_create_or_update(RESOURCE_GROUP, FIREWALL_NAME, firewall)
-    updated_firewall = poller.result()
+    with span("arm_update", firewall=FIREWALL_NAME):
+        poller = network_client.azure_firewalls.begin_create_or_update(RESOURCE_GROUP, FIREWALL_NAME, firewall)
+        updated_firewall = poller.result()
     print("Firewall updated successfully at", datetime.datetime.utcnow().isoformat())
 
     # Display the updated rule collections.
@@ -119,6 +150,43 @@ def update_azure_firewall():
         print(f"Rule Collection: {col.name}, Priority: {col.priority}")
         for r in col.rules:
             print(f"  - {r.name}: {r.protocols} {r.destination_ports}")
+    return diff
+
+def update_firewall_fleet(targets, result=None, max_workers=MAX_WORKERS):
+    """Deploy one optimization result to every FirewallTarget; see fleet_update.update_fleet()."""
+    if result is None:
+        from MyFirewallFunctionProj.firewall_optimizer import optimize_firewalls
+        result = optimize_firewalls()
+    # The desired state is the same everywhere, so it is built once for the whole fleet.
+    rule_collection = build_rule_collection(build_rules(result))
+    return update_fleet(targets, [rule_collection], max_workers=max_workers)
+
+def firewall_update_pipeline(topology=None, nsrs=None, cache=None):
+    """
+    The timer tick as stages: topology and cache lookup, then on a miss the solve and the GET of
+    the deployed firewall run concurrently, followed by the deployment and the cache write.
+    """
+    from MyFirewallFunctionProj.solution_cache import lookup_solution, solve, store_solution
+    from MyFirewallFunctionProj.tfstate_topology import configured_topology
+
+    miss = lambda cached: cached[1] is None
+    pipeline = Pipeline("firewall-optimizer")
+    # Without an explicit topology, the subnets in FIREWALL_TFSTATE are used (or the built-in example),
+    # after checking that every NSR endpoint is one of them.
+    pipeline.add("topology", lambda: topology if topology is not None else configured_topology(nsrs))
+    pipeline.add("cached", lambda topology: lookup_solution(topology, nsrs, cache), deps=["topology"])
+    pipeline.add("result", lambda topology, cached: solve(topology, nsrs), deps=["topology", "cached"], when=miss)
+    pipeline.add("firewall", lambda cached: fetch_current_firewall(), deps=["cached"], when=miss)
+    pipeline.add("deploy", lambda result, firewall: update_azure_firewall(result, firewall), deps=["result", "firewall"])
+    # Only a deployed result is cached, so a failed deployment is retried on the next tick.
+    pipeline.add("persist", lambda cached, result, deploy: store_solution(cached[0], result, cache),
+                 deps=["cached", "result", "deploy"])
+    return pipeline
 
 if __name__ == "__main__":
-    update_azure_firewall()
+    # With FIREWALL_INVENTORY set, every firewall in the inventory is updated concurrently.
+    if INVENTORY_PATH:
+        update_firewall_fleet(load_inventory(INVENTORY_PATH))
+    else:
+        update_azure_firewall()
+    write_metrics()
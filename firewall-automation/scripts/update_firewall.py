@@ -10,7 +10,7 @@ Usage:
 """
 
 import requests
-from firewall_optimizer import optimize_firewalls
+from MyFirewallFunctionProj.firewall_optimizer import optimize_firewalls
 
 def update_firewall_rules():
     # Obtain the optimization result from the Z3 model.